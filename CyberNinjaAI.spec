@@ -1,6 +1,12 @@
 # -*- mode: python ; coding: utf-8 -*-
+# Startup-optimized onedir build; build_exe.py produces the same layout
+import os
+import sys
 from PyInstaller.utils.hooks import collect_all
 
+sys.path.insert(0, SPECPATH)
+from build_exe import EXCLUDES
+
 datas = [('audio', 'audio'), ('requirements.txt', 'requirements.txt'), ('.env', '.env'), ('example.settings.json', 'example.settings.json')]
 binaries = []
 hiddenimports = ['PIL._tkinter_finder']
@@ -17,30 +23,36 @@ a = Analysis(
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
-    excludes=[],
+    excludes=EXCLUDES,
     noarchive=False,
-    optimize=0,
+    optimize=1,
 )
 pyz = PYZ(a.pure)
 
 exe = EXE(
     pyz,
     a.scripts,
-    a.binaries,
-    a.datas,
     [],
+    exclude_binaries=True,
     name='CyberNinjaAI',
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
-    upx_exclude=[],
-    runtime_tmpdir=None,
+    upx=False,
     console=False,
     disable_windowed_traceback=False,
     argv_emulation=False,
     target_arch=None,
     codesign_identity=None,
     entitlements_file=None,
-    icon=['C:\\Users\\HydraPony\\OpenAI Cookbook\\resources\\cyber_ninja.ico'],
+    icon=[os.path.join(SPECPATH, 'resources', 'cyber_ninja.ico')],
+)
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='CyberNinjaAI',
 )
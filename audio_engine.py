@@ -0,0 +1,466 @@
+import io
+import itertools
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+from collections import deque
+
+from metrics import timed
+
+# Everything the GUI plays goes through an audio engine: speech clips queued on
+# a reserved channel (pipelined sentences and streamed PCM) and the music
+# stream used for whole-reply clips. LocalAudioEngine runs pygame in this
+# process. AudioProcessEngine runs the same engine in a worker process, so MP3
+# decoding never competes with Tk and the network threads for the GIL, and a
+# crash in SDL or a codec only costs the audio.
+
+# Clips sent to the worker that haven't reached its channel yet; queue_clip
+# waits beyond this, as Channel.queue's single slot makes it wait in-process
+MAX_PENDING_CLIPS = 2
+# A worker that keeps dying is restarted this many times, then audio is off
+MAX_RESTARTS = 3
+# The worker exits with this code when there is no usable audio device, which
+# a restart won't fix
+AUDIO_UNAVAILABLE = 3
+STATE_INTERVAL = 0.1
+
+
+def decode_clip(pygame, data, fmt):
+    # "pcm" is raw audio in the mixer's own format; anything else is a file
+    if fmt == "pcm":
+        return pygame.mixer.Sound(buffer=data)
+    return pygame.mixer.Sound(file=io.BytesIO(data))
+
+
+class LocalAudioEngine:
+    def __init__(self, volume=0.7):
+        import pygame
+        from pcm_stream import init_mixer
+        init_mixer()
+        # Reserve a channel for speech clips so sound effects can't steal it
+        pygame.mixer.set_reserved(1)
+        self.pygame = pygame
+        self.channel = pygame.mixer.Channel(0)
+        self.paused = False
+        # pygame crashes in music.get_pos() after music.unpause() if nothing was
+        # ever loaded, so the music stream is left alone until it has been used
+        self.music_loaded = False
+        self.set_volume(volume)
+
+    def queue_clip(self, data, fmt="mp3", cancelled=None, timer=None, on_start=None):
+        # Decodes and plays a clip after the ones already queued; blocks the
+        # calling thread, so never call it on the Tk thread. on_start runs if
+        # the clip started on a silent channel. Returns False if not queued.
+        with timed(timer, "audio_load"):
+            sound = decode_clip(self.pygame, data, fmt)
+
+        # Channel.queue holds a single sound, so wait for the slot to free up
+        # rather than replacing the clip that is already waiting
+        while self.channel.get_queue() is not None:
+            if cancelled is not None and cancelled.is_set():
+                return False
+            time.sleep(0.005)
+        if cancelled is not None and cancelled.is_set():
+            return False
+
+        if self.channel.get_busy():
+            self.channel.queue(sound)
+        else:
+            self.channel.play(sound)
+            if on_start:
+                on_start()
+        if timer:
+            timer.mark("playback_start")
+        return True
+
+    def drain(self, cancelled=None):
+        # Clips are on the channel as soon as queue_clip returns
+        return True
+
+    def wait_idle(self, cancelled=None):
+        # Waits until everything queued has finished playing (a pause holds it)
+        while self.channel.get_busy() or self.channel.get_queue() is not None:
+            if cancelled is not None and cancelled.is_set():
+                return False
+            time.sleep(0.02)
+        return True
+
+    def play_music(self, data, timer=None, on_start=None):
+        # Returns False if the clip can't be played, in which case on_start
+        # will never run
+        with timed(timer, "audio_load"):
+            self.pygame.mixer.music.load(io.BytesIO(data), "mp3")
+        self.music_loaded = True
+        self.pygame.mixer.music.set_volume(self.volume)
+        self.pygame.mixer.music.play()
+        self.paused = False
+        if timer:
+            timer.mark("playback_start")
+        if on_start:
+            on_start()
+        return True
+
+    def pause(self):
+        if self.music_loaded:
+            self.pygame.mixer.music.pause()
+        self.pygame.mixer.pause()
+        self.paused = True
+
+    def resume(self):
+        if self.music_loaded:
+            self.pygame.mixer.music.unpause()
+        self.pygame.mixer.unpause()
+        self.paused = False
+
+    def stop(self):
+        self.channel.stop()
+        if self.music_loaded:
+            self.pygame.mixer.music.stop()
+        self.resume()
+
+    def set_volume(self, volume):
+        self.volume = volume
+        self.pygame.mixer.music.set_volume(volume)
+        self.channel.set_volume(volume)
+
+    def state(self):
+        music = self.pygame.mixer.music
+        music_busy = self.music_loaded and music.get_busy()
+        return {
+            "busy": self.channel.get_busy() or music_busy,
+            "paused": self.paused,
+            "queued": int(self.channel.get_queue() is not None),
+            "position_ms": music.get_pos() if music_busy else -1,
+        }
+
+    def close(self):
+        pass
+
+
+def run_worker(conn, volume):
+    # The audio process: decodes and plays whatever the GUI sends, and reports
+    # back when each clip starts and what the mixer is doing. Exits when the
+    # GUI sends quit or its end of the pipe closes.
+    try:
+        engine = LocalAudioEngine(volume)
+    except Exception as e:
+        print(f"Warning: Audio unavailable: {e}")
+        sys.exit(AUDIO_UNAVAILABLE)
+    pygame = engine.pygame
+    clips = deque()
+    last_state = None
+    last_sent = 0.0
+
+    while True:
+        if conn.poll(0.01):
+            try:
+                command, *args = conn.recv()
+            except (EOFError, OSError):
+                break
+            if command == "quit":
+                break
+            if command == "clip":
+                clip_id, data, fmt = args
+                try:
+                    clips.append((clip_id, decode_clip(pygame, data, fmt)))
+                except pygame.error as e:
+                    print(f"Warning: Could not decode audio clip: {e}")
+                    conn.send(("dropped", clip_id))
+            elif command == "music":
+                clip_id, data = args
+                try:
+                    engine.play_music(data)
+                    conn.send(("started", clip_id, True))
+                except pygame.error as e:
+                    print(f"Warning: Could not play audio: {e}")
+                    conn.send(("dropped", clip_id))
+                last_sent = 0.0
+            elif command == "stop":
+                clips.clear()
+                engine.stop()
+            else:
+                getattr(engine, command)(*args)  # pause, resume, set_volume
+            continue  # Handle everything already sent before playing more
+
+        # Keep the channel's queue slot filled behind the clip that is playing
+        while clips and not engine.paused and engine.channel.get_queue() is None:
+            clip_id, sound = clips.popleft()
+            idle = not engine.channel.get_busy()
+            if idle:
+                engine.channel.play(sound)
+            else:
+                engine.channel.queue(sound)
+            conn.send(("started", clip_id, idle))
+            last_sent = 0.0
+
+        state = engine.state()
+        state["queued"] += len(clips)
+        now = time.monotonic()
+        if state != last_state and now - last_sent >= STATE_INTERVAL:
+            conn.send(("state", state))
+            last_state = state
+            last_sent = now
+
+
+class AudioProcessEngine:
+    def __init__(self, volume=0.7):
+        # Same interface as LocalAudioEngine. Commands are sent by a background
+        # thread, so even a multi-megabyte clip never blocks the caller on the
+        # pipe, and a listener thread collects the worker's reports.
+        self.context = multiprocessing.get_context("spawn")
+        self.volume = volume
+        self.paused = False
+        self.lock = threading.Condition()
+        # Clips sent but not yet playing: id -> (timer, on_start)
+        self.waiting = {}
+        self.clip_ids = itertools.count(1)
+        self.latest_state = {"busy": False, "paused": False, "queued": 0, "position_ms": -1}
+        self.outbox = queue.Queue()
+        # Highest clip id written to the current worker; anything up to it is
+        # lost if that worker dies
+        self.last_sent_id = 0
+        self.restarts = 0
+        self.failed = False
+        self.process = None
+        self.conn = None
+        self.reader = None
+        self._start_worker()
+        threading.Thread(target=self._send_loop, name="audio-sender", daemon=True).start()
+
+    def queue_clip(self, data, fmt="mp3", cancelled=None, timer=None, on_start=None):
+        # Returns as soon as the clip is on its way; the worker decodes it
+        with self.lock:
+            while len(self.waiting) >= MAX_PENDING_CLIPS and not self.failed:
+                if cancelled is not None and cancelled.is_set():
+                    return False
+                self.lock.wait(0.05)
+            if self.failed or (cancelled is not None and cancelled.is_set()):
+                return False
+            clip_id = next(self.clip_ids)
+            self.waiting[clip_id] = (timer, on_start)
+        self.outbox.put(("clip", clip_id, data, fmt))
+        return True
+
+    def drain(self, cancelled=None):
+        # Waits until every clip sent so far has reached the worker's channel,
+        # so a reply's timings include when its audio actually started
+        with self.lock:
+            while self.waiting and not self.failed:
+                if cancelled is not None and cancelled.is_set():
+                    return False
+                self.lock.wait(0.05)
+        return not self.failed
+
+    def wait_idle(self, cancelled=None):
+        # Waits for the worker to report the channel silent; its reports are at
+        # most STATE_INTERVAL late, and a started clip counts as busy until then
+        with self.lock:
+            while (self.waiting or self.latest_state["busy"]) and not self.failed:
+                if cancelled is not None and cancelled.is_set():
+                    return False
+                self.lock.wait(0.05)
+        return not self.failed
+
+    def play_music(self, data, timer=None, on_start=None):
+        with self.lock:
+            if self.failed:
+                return False
+            clip_id = next(self.clip_ids)
+            self.waiting[clip_id] = (timer, on_start)
+        self.paused = False
+        self.outbox.put(("music", clip_id, data))
+        return True
+
+    def pause(self):
+        self.paused = True
+        self.outbox.put(("pause",))
+
+    def resume(self):
+        self.paused = False
+        self.outbox.put(("resume",))
+
+    def stop(self):
+        # Clips that haven't been sent yet are dropped with the ones the worker holds
+        kept = []
+        while True:
+            try:
+                message = self.outbox.get_nowait()
+            except queue.Empty:
+                break
+            if message[0] not in ("clip", "music"):
+                kept.append(message)
+        for message in kept:
+            self.outbox.put(message)
+        self._forget_waiting()
+        self.paused = False
+        self.outbox.put(("stop",))
+
+    def set_volume(self, volume):
+        self.volume = volume
+        self.outbox.put(("set_volume", volume))
+
+    def state(self):
+        # The worker's last report, at most STATE_INTERVAL old; clips on their
+        # way count as playing
+        state = dict(self.latest_state, paused=self.paused)
+        with self.lock:
+            if self.waiting:
+                state["busy"] = True
+        return state
+
+    def close(self):
+        self.outbox.put(("quit",))
+        self.outbox.put(None)
+        if self.process is not None:
+            self.process.join(1.0)
+
+    def _start_worker(self):
+        parent_conn, child_conn = self.context.Pipe()
+        self.process = self.context.Process(
+            target=run_worker,
+            args=(child_conn, self.volume),
+            name="cyber-ninja-audio",
+            daemon=True
+        )
+        self.process.start()
+        child_conn.close()
+        self.conn = parent_conn
+        self.reader = threading.Thread(target=self._read_loop, args=(parent_conn,), name="audio-events", daemon=True)
+        self.reader.start()
+
+    def _restart_worker(self):
+        # Called on the sender thread once the worker has died. The old
+        # listener has to finish first: it resolves the clips the dead worker held.
+        if self.failed:
+            return False
+        self.process.join(1.0)
+        self.reader.join(1.0)
+        if self.process.exitcode == AUDIO_UNAVAILABLE or self.restarts >= MAX_RESTARTS:
+            print("Warning: Audio process stopped; audio is off until the app restarts")
+            with self.lock:
+                self.failed = True
+            self._forget_waiting()
+            return False
+        print(f"Warning: Audio process exited (code {self.process.exitcode}); restarting it")
+        self.restarts += 1
+        self.conn.close()
+        self._start_worker()
+        if self.paused:
+            self.conn.send(("pause",))
+        return True
+
+    def _send_loop(self):
+        while True:
+            message = self.outbox.get()
+            if message is None:
+                break
+            if self.failed:
+                continue
+            if not self.process.is_alive() and not self._restart_worker():
+                continue
+            try:
+                self.conn.send(message)
+            except (OSError, ValueError):
+                # The worker died mid-send; this message is lost with its audio
+                if message[0] in ("clip", "music"):
+                    self._forget_waiting(message[1])
+                self._restart_worker()
+                continue
+            if message[0] in ("clip", "music"):
+                with self.lock:
+                    self.last_sent_id = message[1]
+
+    def _read_loop(self, conn):
+        while True:
+            try:
+                event, *args = conn.recv()
+            except (EOFError, OSError):
+                break
+            if event == "state":
+                self.latest_state = args[0]
+                continue
+            with self.lock:
+                timer, on_start = self.waiting.pop(args[0], (None, None))
+                self.lock.notify_all()
+            if event == "started":
+                self.latest_state = dict(self.latest_state, busy=True)
+                if timer:
+                    timer.mark("playback_start")
+                if args[1] and on_start:
+                    on_start()
+        # Whatever the worker was holding is gone with it; clips not sent yet
+        # go to its replacement
+        with self.lock:
+            for clip_id in [i for i in self.waiting if i <= self.last_sent_id]:
+                del self.waiting[clip_id]
+            self.lock.notify_all()
+
+    def _forget_waiting(self, clip_id=None):
+        with self.lock:
+            if clip_id is None:
+                self.waiting.clear()
+            else:
+                self.waiting.pop(clip_id, None)
+            self.lock.notify_all()
+
+
+class AudioArbiter:
+    def __init__(self):
+        # One speaker for every chat tab: speech pipelines and PCM players each
+        # wait for the one before them, in the order their replies were sent,
+        # whichever tab sent them. A player counts as done once its audio has
+        # finished playing, so the first one listed is the one being heard.
+        self.lock = threading.Lock()
+        self.players = []  # (owner, player), in playback order
+
+    def last(self):
+        # The player a new one should wait for, or None if all are done
+        with self.lock:
+            self._prune()
+            return self.players[-1][1] if self.players else None
+
+    def add(self, player, owner=None):
+        with self.lock:
+            self.players.append((owner, player))
+
+    def active(self):
+        with self.lock:
+            self._prune()
+            return bool(self.players)
+
+    def cancel(self, owner=None):
+        # Cancels every player, or only owner's. Returns True if the one being
+        # heard right now was among them, so the output should be stopped too.
+        with self.lock:
+            self._prune()
+            playing = self.players[0][1] if self.players else None
+            cancelled = [player for o, player in self.players if owner is None or o is owner]
+            self.players = [(o, player) for o, player in self.players if not (owner is None or o is owner)]
+        for player in cancelled:
+            player.cancel()
+        return playing is not None and any(player is playing for player in cancelled)
+
+    def cancel_playing(self):
+        # Cancels only the player at the front, the one being heard or about to
+        # be; replies queued behind it still play. Returns True if there was one.
+        with self.lock:
+            self._prune()
+            owner, player = self.players.pop(0) if self.players else (None, None)
+        if player is None:
+            return False
+        player.cancel()
+        return True
+
+    def _prune(self):
+        self.players = [(owner, player) for owner, player in self.players if not player.wait(0)]
+
+
+def create_engine(use_process, volume=0.7):
+    if use_process:
+        try:
+            return AudioProcessEngine(volume)
+        except OSError as e:
+            print(f"Warning: Could not start the audio process ({e}); playing audio in the app instead")
+    return LocalAudioEngine(volume)
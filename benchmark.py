@@ -0,0 +1,448 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from types import SimpleNamespace
+
+import pygame
+
+from mock_openai_server import MockConfig, MockOpenAIServer
+
+# Benchmarks the chat/TTS paths against mock_openai_server so performance can be
+# compared between commits without API costs:
+#   python benchmark.py --output bench.json
+#   python benchmark.py --output new.json --compare bench.json
+
+
+def percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+    pick = lambda p: values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+    return {"p50": round(pick(50), 2), "p95": round(pick(95), 2), "max": round(values[-1], 2)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=Path(__file__).parent, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def max_rss_kb():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def measure(name, iterations, run_once):
+    # run_once() returns a dict of per-iteration samples in milliseconds
+    samples = {}
+    tracemalloc.start()
+    started = time.perf_counter()
+    for i in range(iterations):
+        for key, value in run_once(i).items():
+            samples.setdefault(key, []).append(value)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = {key: percentiles(values) for key, values in samples.items()}
+    result["iterations"] = iterations
+    result["throughput_per_s"] = round(iterations / elapsed, 3)
+    result["peak_traced_kb"] = peak // 1024
+    print(f"  {name}: " + ", ".join(
+        f"{key} p50 {value['p50']:.1f}" for key, value in result.items() if isinstance(value, dict)
+    ))
+    return result
+
+
+def bench_cli(bot, iterations):
+    from speech_text import normalize_for_speech
+
+    results = {}
+
+    def chat(i):
+        start = time.perf_counter()
+        bot.get_chat_response(f"Benchmark question {i}")
+        return {"e2e_ms": (time.perf_counter() - start) * 1000}
+    results["cli_chat"] = measure("cli_chat", iterations, chat)
+
+    def chat_hit(i):
+        # Same opening question of a fresh conversation, answered from the response cache
+        bot.history.reset()
+        start = time.perf_counter()
+        bot.get_chat_response("What can you do?")
+        return {"e2e_ms": (time.perf_counter() - start) * 1000}
+    bot.history.reset()
+    bot.get_chat_response("What can you do?")
+    results["cli_chat_hit"] = measure("cli_chat_hit", iterations, chat_hit)
+
+    def stream(i):
+        start = time.perf_counter()
+        first = None
+        tokens = 0
+        for _ in bot.stream_chat_response(f"Benchmark stream {i}"):
+            if first is None:
+                first = time.perf_counter()
+            tokens += 1
+        end = time.perf_counter()
+        return {
+            "ttft_ms": (first - start) * 1000,
+            "e2e_ms": (end - start) * 1000,
+            "tokens_per_s": tokens / (end - first) if end > first else 0.0
+        }
+    results["cli_stream"] = measure("cli_stream", iterations, stream)
+
+    def tts_miss(i):
+        start = time.perf_counter()
+        bot.text_to_speech(f"Unique benchmark line number {i} at {time.time()}")
+        return {"e2e_ms": (time.perf_counter() - start) * 1000}
+    results["cli_tts_miss"] = measure("cli_tts_miss", iterations, tts_miss)
+
+    bot.text_to_speech("Cached benchmark line.")
+
+    def tts_hit(i):
+        start = time.perf_counter()
+        bot.text_to_speech("Cached benchmark line.")
+        return {"e2e_ms": (time.perf_counter() - start) * 1000}
+    results["cli_tts_hit"] = measure("cli_tts_hit", iterations, tts_hit)
+
+    # A long answer is split up and its chunks synthesized in parallel
+    paragraph = "The cyber ninja moves through the network without leaving a trace. " * 15
+
+    def tts_long(i):
+        start = time.perf_counter()
+        bot.text_to_speech(f"Long reply {i} at {time.time()}.\n\n" + "\n\n".join([paragraph] * 5))
+        return {"e2e_ms": (time.perf_counter() - start) * 1000}
+    results["cli_tts_long"] = measure("cli_tts_long", iterations, tts_long)
+
+    # A typical technical answer: the code block is summarized instead of read out
+    code = "\n".join(f"    result_{n} = compute(value_{n}, https_endpoint='https://api.example.com/v1/{n}')"
+                     for n in range(40))
+
+    def tts_markdown(i):
+        reply = (f"Here is **answer {i}** at {time.time()}. See https://docs.example.com/guide/setup for details.\n\n"
+                 f"```python\n{code}\n```\n\n- Run it\n- Check the output")
+        start = time.perf_counter()
+        bot.tts_cache.speech(bot.client, reply, voice="alloy")
+        raw = time.perf_counter()
+        bot.text_to_speech(reply)
+        return {
+            "raw_ms": (raw - start) * 1000,
+            "normalized_ms": (time.perf_counter() - raw) * 1000,
+            "raw_chars": len(reply),
+            "spoken_chars": len(normalize_for_speech(reply)[0])
+        }
+    results["cli_tts_markdown"] = measure("cli_tts_markdown", iterations, tts_markdown)
+
+    from speech_pipeline import SpeechPipeline
+
+    def pipeline(i):
+        timer = bot.metrics.start(i)
+        speech = SpeechPipeline(
+            bot.client,
+            lambda audio, p: p.timer.mark("playback_start"),
+            cache=bot.tts_cache,
+            timer=timer
+        )
+        for delta in bot.stream_chat_response(f"Benchmark pipeline {i} {time.time()}", timer=timer):
+            speech.feed(delta)
+        speech.close()
+        speech.wait()
+        record = bot.metrics.finish(timer)["timings_ms"]
+        return {
+            "ttft_ms": record["chat_ttft"],
+            "first_audio_ms": record["playback_start"],
+            "e2e_ms": record["total"]
+        }
+    results["cli_pipeline"] = measure("cli_pipeline", iterations, pipeline)
+    return results
+
+
+def bench_gui(client, output_dir, iterations, concurrency, audio_process=False):
+    # Drives CyberNinjaGUI.process_message without creating any Tk widgets
+    from enhanced_gui_chatbot import CyberNinjaGUI
+    from conversation import ConversationHistory
+    from metrics import LatencyMetrics
+    from request_queue import RequestQueue
+    from response_cache import ResponseCache
+    from tts_cache import TTSCache
+    from audio_engine import AudioArbiter, create_engine
+
+    # The CLI bench leaves the mixer at 44.1 kHz stereo, and the in-app engine
+    # would reuse it and play the 24 kHz mono PCM clips too fast; start it
+    # afresh so both engines play at the TTS format and time the same audio
+    pygame.mixer.quit()
+    try:
+        audio = create_engine(audio_process)
+    except pygame.error as e:
+        audio = None
+        print(f"  Audio unavailable, skipping PCM streaming: {e}")
+
+    class HeadlessGUI:
+        process_message = CyberNinjaGUI.process_message
+        stream_chat_response = CyberNinjaGUI.stream_chat_response
+        replay_cached_reply = CyberNinjaGUI.replay_cached_reply
+        finish_turn = CyberNinjaGUI.finish_turn
+        create_pcm_player = CyberNinjaGUI.create_pcm_player
+
+        def __init__(self, streamed):
+            self.client = client
+            self.settings = {"voice": "alloy", "voice_speed": 1.0, "volume": 0.7, "stream_responses": streamed}
+            self.tts_cache = TTSCache(output_dir / "gui_cache")
+            self.response_cache = ResponseCache(output_dir / "gui_cache" / "responses.db")
+            self.conversation = ConversationHistory()
+            self.metrics = LatencyMetrics()
+            self.events = []
+            self.ui_queue = SimpleNamespace(post=lambda *event: self.events.append(event))
+            self.request_queue = RequestQueue(self.process_message, self.ui_queue.post, max_workers=concurrency)
+            self.audio = audio
+            self.arbiter = AudioArbiter()
+
+        def submit(self, i, stream_audio=False):
+            timer = self.metrics.start()
+            player = self.create_pcm_player(timer) if stream_audio else None
+            request = self.request_queue.submit(
+                f"GUI benchmark {i} {time.time()}",
+                tab=self,  # Stands in for a chat tab: it has a conversation and request queue
+                system_prompt="You are a cyber ninja AI assistant.",
+                pipeline=None,
+                player=player,
+                timer=timer
+            )
+            if player:
+                request.attach(player)
+            return request, timer
+
+        def close(self):
+            # The cache's pending writes finish before the temporary directory goes
+            self.request_queue.shutdown()
+            self.tts_cache.close()
+            self.response_cache.close()
+
+    results = {}
+    for streamed in (True, False):
+        name = "gui_stream" if streamed else "gui_blocking"
+        gui = HeadlessGUI(streamed)
+
+        def turn(i):
+            request, timer = gui.submit(i)
+            request.future.result()
+            timings = gui.metrics.finish(timer)["timings_ms"]
+            sample = {"e2e_ms": timings["total"]}
+            if "chat_ttft" in timings:
+                sample["ttft_ms"] = timings["chat_ttft"]
+            return sample
+        try:
+            results[name] = measure(name, iterations, turn)
+        finally:
+            gui.close()
+
+    # Several messages fired back to back, as a power user would
+    gui = HeadlessGUI(True)
+
+    def burst(i):
+        start = time.perf_counter()
+        submitted = [gui.submit(f"{i}.{n}") for n in range(concurrency * 2)]
+        for request, _ in submitted:
+            request.future.result()
+        return {"burst_ms": (time.perf_counter() - start) * 1000}
+    try:
+        results["gui_burst"] = measure("gui_burst", max(1, iterations // 2), burst)
+    finally:
+        gui.close()
+
+    # Whole-reply speech streamed as PCM: audio starts with the first chunk
+    if audio is not None:
+        gui = HeadlessGUI(True)
+
+        def pcm_stream(i):
+            request, timer = gui.submit(i, stream_audio=True)
+            request.future.result()
+            # Let the clip play out so the next turn doesn't queue behind it;
+            # the player reported the turn once its audio had started
+            request.context["player"].wait()
+            timings = gui.metrics.last["timings_ms"]
+            return {"first_audio_ms": timings["playback_start"], "e2e_ms": timings["total"]}
+        try:
+            results["gui_pcm_stream"] = measure("gui_pcm_stream", iterations, pcm_stream)
+        finally:
+            audio.stop()
+            gui.close()
+            audio.close()
+    return results
+
+def bench_server(client, output_dir, iterations, concurrency):
+    # Drives chat_server over real HTTP: one session's turns, then a burst of
+    # sessions at once to show how the concurrency cap queues them
+    import asyncio
+    import http.client
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+    from chat_server import ChatServer
+    from response_cache import ResponseCache
+    from settings_store import SettingsStore
+    from tts_cache import TTSCache
+
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, name="bench-server", daemon=True)
+    thread.start()
+    tts_cache = TTSCache(output_dir / "server_cache")
+    response_cache = ResponseCache(output_dir / "server_cache" / "responses.db")
+    server = ChatServer(
+        SettingsStore(output_dir / "server_settings.json").items(),
+        client,
+        tts_cache,
+        response_cache,
+        concurrency=concurrency,
+        max_waiting=concurrency * 8
+    )
+    asyncio.run_coroutine_threadsafe(server.start("127.0.0.1", 0), loop).result()
+
+    def post(path, body):
+        conn = http.client.HTTPConnection("127.0.0.1", server.port, timeout=60)
+        conn.request("POST", path, json.dumps(body), {"Content-Type": "application/json"})
+        return conn, conn.getresponse()
+
+    def new_session():
+        conn, response = post("/sessions", {})
+        session_id = json.loads(response.read())["session_id"]
+        conn.close()
+        return session_id
+
+    def chat(session_id, message):
+        start = time.perf_counter()
+        first = None
+        conn, response = post(f"/sessions/{session_id}/chat", {"message": message, "bypass_cache": True})
+        for line in response:
+            if first is None and line.startswith(b"event: token"):
+                first = time.perf_counter()
+        conn.close()
+        return {"ttft_ms": (first - start) * 1000, "e2e_ms": (time.perf_counter() - start) * 1000}
+
+    results = {}
+    try:
+        session_id = new_session()
+        results["server_chat"] = measure("server_chat", iterations, lambda i: chat(session_id, f"Server turn {i}"))
+
+        sessions = concurrency * 4
+
+        def burst(i):
+            ids = [new_session() for _ in range(sessions)]
+            start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=sessions) as pool:
+                turns = list(pool.map(lambda s: chat(s, f"Burst {i} {s}"), ids))
+            return {
+                "burst_ms": (time.perf_counter() - start) * 1000,
+                "ttft_ms": max(turn["ttft_ms"] for turn in turns)
+            }
+        results["server_burst"] = measure("server_burst", iterations, burst)
+
+        def speech(i):
+            start = time.perf_counter()
+            first = None
+            conn, response = post(f"/sessions/{session_id}/speech", {"text": f"Server speech {i} at {time.time()}"})
+            while response.read(4096):
+                if first is None:
+                    first = time.perf_counter()
+            conn.close()
+            return {"first_audio_ms": (first - start) * 1000, "e2e_ms": (time.perf_counter() - start) * 1000}
+        results["server_speech"] = measure("server_speech", iterations, speech)
+    finally:
+        asyncio.run_coroutine_threadsafe(server.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        tts_cache.close()
+        response_cache.close()
+    return results
+
+
+def compare(current, baseline_path):
+    with open(baseline_path, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+    print(f"\nCompared with {baseline_path} (commit {baseline.get('commit')}):")
+    for scenario, metrics in current["results"].items():
+        for key, value in metrics.items():
+            old = baseline.get("results", {}).get(scenario, {}).get(key)
+            if isinstance(value, dict) and isinstance(old, dict) and old.get("p50"):
+                change = (value["p50"] - old["p50"]) / old["p50"] * 100
+                print(f"  {scenario}.{key} p50: {old['p50']:.1f} -> {value['p50']:.1f} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Cyber Ninja AI against a mock OpenAI server")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=2)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--compare", help="Earlier results file to compare against")
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--token-rate", type=float, default=200.0)
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--audio-latency-ms", type=float, default=100)
+    parser.add_argument("--audio-bytes", type=int, default=48000)
+    parser.add_argument("--audio-rate", type=float, default=2000000)
+    parser.add_argument("--audio-bytes-per-char", type=int, default=200)
+    parser.add_argument("--skip-gui", action="store_true", help="Only benchmark the CLI engine")
+    parser.add_argument("--skip-server", action="store_true", help="Skip the HTTP server scenarios")
+    parser.add_argument("--audio-process", action="store_true", help="Play GUI audio through the worker process")
+    args = parser.parse_args()
+
+    config = MockConfig(args.latency_ms, args.token_rate, args.reply_tokens,
+                        args.audio_latency_ms, args.audio_bytes, args.audio_rate, args.audio_bytes_per_char)
+    # Playback is timed against SDL's null device unless a real one is chosen
+    os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+    server = MockOpenAIServer(config).start()
+    os.environ["OPENAI_BASE_URL"] = server.base_url
+    os.environ["OPENAI_API_KEY"] = "mock"
+
+    from chatbot import CyberNinjaChatbot
+    from openai_client import create_client
+
+    results = {}
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            output_dir = Path(tmp)
+            print(f"Benchmarking against {server.base_url}")
+            bot = CyberNinjaChatbot(output_dir=output_dir)
+            try:
+                results.update(bench_cli(bot, args.iterations))
+                if not args.skip_gui:
+                    results.update(bench_gui(create_client(), output_dir, args.iterations, args.concurrency,
+                                             args.audio_process))
+                if not args.skip_server:
+                    results.update(bench_server(create_client(), output_dir, args.iterations, args.concurrency))
+            finally:
+                bot.tts_cache.close()
+    finally:
+        server.stop()
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "python": sys.version.split()[0],
+        "mock_config": config.to_dict(),
+        "max_rss_kb": max_rss_kb(),
+        "requests": server.counts,
+        "results": results
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.compare:
+        compare(report, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+import json
+import re
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+TITLE_CHARS = 60
+SEARCH_TOKEN = re.compile(r'\w+', re.UNICODE)
+# Only the most recent matches are ranked, which keeps common words fast
+RANK_WINDOW = 2000
+SNIPPET_CHARS = 90
+
+
+def title_for(line):
+    # Sessions are named after the first thing the user asked
+    text = line.split(": ", 1)[-1]
+    text = " ".join(text.split())
+    return text if len(text) <= TITLE_CHARS else text[:TITLE_CHARS - 1] + "…"
+
+
+def make_snippet(line, words):
+    # The part of the line around the first word that matched
+    text = " ".join(line.split())
+    folded = text.casefold()
+    positions = [folded.find(word.casefold()) for word in words]
+    position = min((p for p in positions if p >= 0), default=0)
+    start = max(0, position - SNIPPET_CHARS // 3)
+    snippet = text[start:start + SNIPPET_CHARS]
+    return ("…" if start else "") + snippet + ("…" if start + SNIPPET_CHARS < len(text) else "")
+
+
+class ChatLog:
+    def __init__(self, db_path):
+        # Append-only transcript store: each displayed line is one row, written
+        # as it appears, so saving costs the same per message however long the
+        # chat is and a crash loses nothing
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.db_path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # WAL with synchronous=NORMAL can lose the last commit on power loss,
+        # never corrupt the file; it keeps per-message commits cheap
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id INTEGER PRIMARY KEY, title TEXT, created REAL, updated REAL, "
+            "message_count INTEGER DEFAULT 0, source TEXT UNIQUE)"
+        )
+        # (session_id, seq) is the index that lets any range of a session be read
+        # without touching the rest
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "session_id INTEGER, seq INTEGER, line TEXT, created REAL, "
+            "PRIMARY KEY (session_id, seq)) WITHOUT ROWID"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated)")
+        # Full-text index over every line, kept in step with messages by append()
+        self.db.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+            "line, session_id UNINDEXED, seq UNINDEXED, tokenize='unicode61 remove_diacritics 2')"
+        )
+        if self.db.execute("SELECT 1 FROM messages_fts LIMIT 1").fetchone() is None:
+            # Logs written before the index existed are indexed once
+            self.db.execute("INSERT INTO messages_fts (line, session_id, seq) SELECT line, session_id, seq FROM messages")
+        self.db.commit()
+
+    def start_session(self, title="New chat", source=None):
+        now = time.time()
+        with self.lock:
+            cursor = self.db.execute(
+                "INSERT INTO sessions (title, created, updated, source) VALUES (?, ?, ?, ?)",
+                (title, now, now, source)
+            )
+            self.db.commit()
+            return cursor.lastrowid
+
+    def append(self, session_id, lines):
+        if not lines:
+            return
+        now = time.time()
+        with self.lock:
+            count, title = self.db.execute(
+                "SELECT message_count, title FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            rows = [(session_id, count + i, line, now) for i, line in enumerate(lines)]
+            self.db.executemany("INSERT INTO messages (session_id, seq, line, created) VALUES (?, ?, ?, ?)", rows)
+            self.db.executemany(
+                "INSERT INTO messages_fts (line, session_id, seq) VALUES (?, ?, ?)",
+                [(line, session_id, seq) for session_id, seq, line, _ in rows]
+            )
+            if title == "New chat":
+                title = next((title_for(line) for line in lines if line.startswith("You: ")), title)
+            self.db.execute(
+                "UPDATE sessions SET message_count = ?, updated = ?, title = ? WHERE id = ?",
+                (count + len(lines), now, title, session_id)
+            )
+            self.db.commit()
+
+    def count(self, session_id):
+        with self.lock:
+            row = self.db.execute("SELECT message_count FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row[0] if row else 0
+
+    def read(self, session_id, start=0, limit=-1):
+        # Lines start..start+limit of a session, in order
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT line FROM messages WHERE session_id = ? AND seq >= ? ORDER BY seq LIMIT ?",
+                (session_id, start, limit)
+            ).fetchall()
+        return [line for (line,) in rows]
+
+    def title(self, session_id):
+        with self.lock:
+            row = self.db.execute("SELECT title FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row[0] if row else ""
+
+    def sessions(self, limit=20):
+        # Most recently updated first, as (id, title, updated, message_count)
+        with self.lock:
+            return self.db.execute(
+                "SELECT id, title, updated, message_count FROM sessions "
+                "WHERE message_count > 0 ORDER BY updated DESC LIMIT ?",
+                (limit,)
+            ).fetchall()
+
+    def search(self, query, limit=20):
+        # Best matches first, as (session_id, seq, session title, snippet). Every
+        # word must match; the last one may be a prefix, as when still typing.
+        words = SEARCH_TOKEN.findall(query)
+        if not words:
+            return []
+        match = " ".join(f'"{word}"' for word in words) + "*"
+        with self.lock:
+            hits = self.db.execute(
+                "SELECT rowid, session_id, seq FROM ("
+                "SELECT rowid, session_id, seq, rank FROM messages_fts WHERE messages_fts MATCH ? "
+                "ORDER BY rowid DESC LIMIT ?) ORDER BY rank LIMIT ?",
+                (match, RANK_WINDOW, limit)
+            ).fetchall()
+            if not hits:
+                return []
+            # Lines and titles are looked up for the hits only; SQLite's
+            # snippet() would be computed for every match before ranking
+            marks = ",".join("?" * len(hits))
+            lines = dict(self.db.execute(
+                f"SELECT rowid, line FROM messages_fts WHERE rowid IN ({marks})", [hit[0] for hit in hits]
+            ).fetchall())
+            titles = dict(self.db.execute(
+                f"SELECT id, title FROM sessions WHERE id IN ({marks})", [hit[1] for hit in hits]
+            ).fetchall())
+        return [
+            (session_id, seq, titles.get(session_id, ""), make_snippet(lines[rowid], words))
+            for rowid, session_id, seq in hits
+        ]
+
+    def import_json(self, path):
+        # Saved chats are JSON lists of display lines. Each file is imported once;
+        # opening it again reopens the session it became.
+        path = Path(path).resolve()
+        source = f"{path}:{path.stat().st_mtime_ns}"
+        with self.lock:
+            row = self.db.execute("SELECT id FROM sessions WHERE source = ?", (source,)).fetchone()
+        if row:
+            return row[0]
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = [str(line) for line in json.load(f)]
+        session_id = self.start_session(path.stem, source=source)
+        self.append(session_id, lines)
+        return session_id
+
+    def export_json(self, session_id, path, batch=1000):
+        # Writes the same format import_json reads, streamed in batches
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("[")
+            start = 0
+            while True:
+                lines = self.read(session_id, start, batch)
+                if not lines:
+                    break
+                for i, line in enumerate(lines):
+                    f.write(("" if start + i == 0 else ",") + "\n  " + json.dumps(line, ensure_ascii=False))
+                start += len(lines)
+            f.write("\n]\n")
+
+    def close(self):
+        with self.lock:
+            self.db.close()
@@ -0,0 +1,639 @@
+import argparse
+import asyncio
+import concurrent.futures
+import contextlib
+import json
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlsplit
+
+from dotenv import load_dotenv
+
+from conversation import ConversationHistory, summarize_messages
+from metrics import LatencyMetrics
+from openai_client import create_client, warm_up
+from rate_limiter import get_rate_limiter
+from response_cache import ResponseCache
+from settings_store import SettingsStore, PERSONALITY_TRAITS, build_system_prompt, validate
+from speech_text import normalize_for_speech
+from tts_cache import TTSCache
+
+# Serves the chat and speech engine to many clients from one process, sharing
+# one API key, connection pool, rate limiter and cache between them:
+#   POST   /sessions               {"humor": 0.9, ...} -> {"session_id": ...}
+#   GET    /sessions/<id>
+#   DELETE /sessions/<id>
+#   POST   /sessions/<id>/chat     {"message": ...} -> Server-Sent Events
+#   POST   /sessions/<id>/speech   {"text": ..., "format": "mp3"} -> audio, streamed
+#   GET    /health
+# Try it against the mock API:
+#   python mock_openai_server.py --port 8765
+#   OPENAI_BASE_URL=http://127.0.0.1:8765/v1 OPENAI_API_KEY=mock python chat_server.py
+#   curl -X POST localhost:8080/sessions
+#   curl -N -X POST localhost:8080/sessions/<id>/chat -d '{"message": "hi"}'
+
+DEFAULT_PORT = 8080
+DEFAULT_CONCURRENCY = 8
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 1024 * 1024
+# Tokens or audio chunks held between the upstream read and a slow client;
+# once full, the upstream read waits for the client to catch up
+STREAM_BUFFER = 64
+SESSION_IDLE_SECONDS = 3600
+EXPIRY_CHECK_SECONDS = 60
+# Settings a session may choose for itself; the rest are the server's
+SESSION_SETTINGS = ("custom_prompt", "voice", "voice_speed") + PERSONALITY_TRAITS
+AUDIO_TYPES = {
+    "mp3": "audio/mpeg", "opus": "audio/opus", "aac": "audio/aac",
+    "flac": "audio/flac", "wav": "audio/wav", "pcm": "audio/pcm"
+}
+REASONS = {
+    200: "OK", 201: "Created", 204: "No Content", 400: "Bad Request", 401: "Unauthorized",
+    404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+    429: "Too Many Requests", 500: "Internal Server Error", 502: "Bad Gateway",
+    503: "Service Unavailable"
+}
+
+
+class HTTPError(Exception):
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class StreamCancelled(Exception):
+    pass
+
+
+class Request:
+    def __init__(self, method, target, headers, body):
+        self.method = method
+        self.path = urlsplit(target).path
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        if not self.body:
+            return {}
+        try:
+            data = json.loads(self.body)
+        except ValueError as e:
+            raise HTTPError(400, f"Invalid JSON: {e}")
+        if not isinstance(data, dict):
+            raise HTTPError(400, "Expected a JSON object")
+        return data
+
+    def keep_alive(self):
+        return self.headers.get("connection", "").lower() != "close"
+
+
+class ThreadStream:
+    # Hands items from a worker thread to a coroutine through a bounded queue.
+    # put() blocks the thread while the queue is full, so a slow client slows
+    # its own upstream read instead of the reply piling up in memory. Once the
+    # client is gone, put() raises StreamCancelled.
+    def __init__(self, loop, maxsize=STREAM_BUFFER):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+        self.cancelled = threading.Event()
+
+    def put(self, item):
+        if self.cancelled.is_set():
+            raise StreamCancelled()
+        future = asyncio.run_coroutine_threadsafe(self.queue.put(item), self.loop)
+        while True:
+            try:
+                future.result(timeout=0.1)
+                return
+            except concurrent.futures.TimeoutError:
+                if self.cancelled.is_set():
+                    future.cancel()
+                    raise StreamCancelled()
+
+    def close(self):
+        # The end of the stream; never blocks, since the reader may be gone
+        try:
+            self.put(None)
+        except StreamCancelled:
+            pass
+
+    async def get(self):
+        return await self.queue.get()
+
+
+class ChatSession:
+    def __init__(self, session_id, settings, client):
+        self.id = session_id
+        # The server's settings with this session's choices applied
+        self.settings = settings
+        self.system_prompt = build_system_prompt(settings)
+        self.conversation = ConversationHistory(
+            max_tokens=settings["history_tokens"],
+            summarize=lambda summary, messages: summarize_messages(client, summary, messages)
+        )
+        # One turn at a time: each needs the one before it as context
+        self.lock = asyncio.Lock()
+        self.turns = 0
+        self.last_used = time.monotonic()
+
+    def touch(self):
+        self.last_used = time.monotonic()
+
+    def info(self):
+        return {
+            "session_id": self.id,
+            "turns": self.turns,
+            "busy": self.lock.locked(),
+            "idle_seconds": round(time.monotonic() - self.last_used, 1),
+            "settings": {key: self.settings[key] for key in SESSION_SETTINGS}
+        }
+
+
+class ChatServer:
+    def __init__(self, settings, client, tts_cache, response_cache, metrics=None,
+                 concurrency=DEFAULT_CONCURRENCY, max_waiting=None, max_sessions=1000,
+                 session_idle=SESSION_IDLE_SECONDS, token=None):
+        self.settings = dict(settings)
+        self.client = client
+        self.tts_cache = tts_cache
+        self.response_cache = response_cache
+        self.metrics = metrics or LatencyMetrics()
+        self.concurrency = concurrency
+        # Requests allowed to wait for a free slot before new ones get a 503
+        self.max_waiting = concurrency * 4 if max_waiting is None else max_waiting
+        self.max_sessions = max_sessions
+        self.session_idle = session_idle
+        self.token = token
+        # SDK calls block, so they run on these threads; the event loop only
+        # parses requests and moves bytes to clients
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="chat-server")
+        self.sessions = {}
+        # Handler task -> its writer, for closing connections on shutdown
+        self.connections = {}
+        self.active = 0
+        self.waiting = 0
+        self.slots = None
+        self.server = None
+        self.expiry_task = None
+
+    async def start(self, host="127.0.0.1", port=DEFAULT_PORT):
+        self.slots = asyncio.Semaphore(self.concurrency)
+        self.server = await asyncio.start_server(self.handle_connection, host, port, limit=MAX_HEADER_BYTES)
+        self.expiry_task = asyncio.create_task(self.expire_sessions())
+        return self
+
+    @property
+    def port(self):
+        return self.server.sockets[0].getsockname()[1]
+
+    async def serve_forever(self):
+        async with self.server:
+            await self.server.serve_forever()
+
+    async def close(self):
+        if self.expiry_task:
+            self.expiry_task.cancel()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        # Idle keep-alive connections would otherwise wait for a request forever;
+        # closing the socket ends each handler the same way a client leaving does
+        for writer in self.connections.values():
+            writer.close()
+        await asyncio.gather(*self.connections, return_exceptions=True)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # Connections
+
+    async def handle_connection(self, reader, writer):
+        task = asyncio.current_task()
+        self.connections[task] = writer
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except HTTPError as e:
+                    await self.send_error(writer, e)
+                    break
+                if request is None:
+                    break
+                if not await self.dispatch(request, writer) or not request.keep_alive():
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # Client went away
+        finally:
+            self.connections.pop(task, None)
+            writer.close()
+            with contextlib.suppress(ConnectionError):
+                await writer.wait_closed()
+
+    async def read_request(self, reader):
+        # Returns None when the client closes an idle keep-alive connection
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+        except asyncio.IncompleteReadError as e:
+            if not e.partial.strip():
+                return None
+            raise
+        except asyncio.LimitOverrunError:
+            raise HTTPError(400, "Request headers too large")
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, target, _ = lines[0].split(" ", 2)
+        except ValueError:
+            raise HTTPError(400, "Malformed request line")
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+        if "chunked" in headers.get("transfer-encoding", "").lower():
+            raise HTTPError(400, "Chunked request bodies are not supported")
+        try:
+            length = int(headers.get("content-length", 0))
+        except ValueError:
+            raise HTTPError(400, "Invalid Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, f"Request body over {MAX_BODY_BYTES} bytes")
+        body = await reader.readexactly(length) if length > 0 else b""
+        return Request(method.upper(), target, headers, body)
+
+    async def dispatch(self, request, writer):
+        # Returns False if the connection can't be reused, e.g. after a stream
+        # the client abandoned
+        try:
+            if self.token and not secrets.compare_digest(
+                    request.headers.get("authorization", ""), f"Bearer {self.token}"):
+                raise HTTPError(401, "Missing or wrong bearer token", {"WWW-Authenticate": "Bearer"})
+            handler, args = self.route(request)
+            return await handler(request, writer, *args)
+        except HTTPError as e:
+            await self.send_error(writer, e)
+            return True
+        except (ConnectionError, asyncio.IncompleteReadError):
+            raise
+        except Exception as e:
+            print(f"Warning: {request.method} {request.path} failed: {e}")
+            await self.send_error(writer, HTTPError(500, "Internal server error"))
+            return False
+
+    def route(self, request):
+        parts = [part for part in request.path.split("/") if part]
+        routes = {
+            ("health",): {"GET": self.health},
+            ("sessions",): {"POST": self.create_session},
+            ("sessions", None): {"GET": self.session_info, "DELETE": self.delete_session},
+            ("sessions", None, "chat"): {"POST": self.chat},
+            ("sessions", None, "speech"): {"POST": self.speech},
+        }
+        for pattern, methods in routes.items():
+            if len(pattern) != len(parts) or any(p is not None and p != part for p, part in zip(pattern, parts)):
+                continue
+            if request.method not in methods:
+                raise HTTPError(405, f"{request.method} not allowed here", {"Allow": ", ".join(methods)})
+            args = [self.get_session(part) for p, part in zip(pattern, parts) if p is None]
+            return methods[request.method], args
+        raise HTTPError(404, f"No such endpoint: {request.path}")
+
+    # Responses
+
+    async def send_json(self, writer, status, data, headers=None):
+        body = json.dumps(data).encode("utf-8")
+        self.write_head(writer, status, {"Content-Type": "application/json", "Content-Length": len(body), **(headers or {})})
+        writer.write(body)
+        await writer.drain()
+
+    async def send_error(self, writer, error):
+        with contextlib.suppress(ConnectionError):
+            await self.send_json(writer, error.status, {"error": str(error)}, error.headers)
+
+    def write_head(self, writer, status, headers):
+        lines = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+        lines += [f"{name}: {value}" for name, value in headers.items()]
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1"))
+
+    def start_stream(self, writer, content_type, headers=None):
+        # Streams use chunked encoding, so the connection can be reused afterwards
+        self.write_head(writer, 200, {"Content-Type": content_type, "Transfer-Encoding": "chunked",
+                                      "Cache-Control": "no-cache", **(headers or {})})
+
+    async def write_chunk(self, writer, data):
+        if data:
+            writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+            await writer.drain()
+
+    async def end_stream(self, writer):
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+
+    # Sessions
+
+    def get_session(self, session_id):
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise HTTPError(404, "No such session; it may have expired")
+        session.touch()
+        return session
+
+    async def create_session(self, request, writer):
+        settings = dict(self.settings)
+        for key, value in request.json().items():
+            if key not in SESSION_SETTINGS:
+                raise HTTPError(400, f"Unknown or server-wide setting: {key}")
+            try:
+                settings[key] = validate(key, value)
+            except ValueError as e:
+                raise HTTPError(400, str(e))
+        if len(self.sessions) >= self.max_sessions:
+            self.drop_idle_sessions()
+            if len(self.sessions) >= self.max_sessions:
+                raise HTTPError(429, "Too many sessions", {"Retry-After": EXPIRY_CHECK_SECONDS})
+        session = ChatSession(secrets.token_urlsafe(16), settings, self.client)
+        self.sessions[session.id] = session
+        await self.send_json(writer, 201, session.info())
+        return True
+
+    async def session_info(self, request, writer, session):
+        await self.send_json(writer, 200, session.info())
+        return True
+
+    async def delete_session(self, request, writer, session):
+        # A turn in progress finishes for its client; the session is just forgotten
+        self.sessions.pop(session.id, None)
+        self.write_head(writer, 204, {"Content-Length": 0})
+        await writer.drain()
+        return True
+
+    def drop_idle_sessions(self, idle=None):
+        cutoff = time.monotonic() - (self.session_idle if idle is None else idle)
+        for session_id, session in list(self.sessions.items()):
+            if session.last_used < cutoff and not session.lock.locked():
+                del self.sessions[session_id]
+
+    async def expire_sessions(self):
+        while True:
+            await asyncio.sleep(EXPIRY_CHECK_SECONDS)
+            self.drop_idle_sessions()
+
+    async def health(self, request, writer):
+        await self.send_json(writer, 200, {
+            "sessions": len(self.sessions),
+            "active": self.active,
+            "waiting": self.waiting,
+            "concurrency": self.concurrency,
+            "max_waiting": self.max_waiting,
+            "rate_limiter": get_rate_limiter().stats(),
+            "latency_ms": self.metrics.summary()
+        })
+        return True
+
+    # Upstream work
+
+    @contextlib.asynccontextmanager
+    async def slot(self):
+        # At most `concurrency` upstream calls at once. Past max_waiting queued
+        # requests, new ones are turned away rather than queueing without bound.
+        if self.slots.locked() and self.waiting >= self.max_waiting:
+            raise HTTPError(503, "Server busy, try again shortly", {"Retry-After": 1})
+        self.waiting += 1
+        try:
+            await self.slots.acquire()
+        finally:
+            self.waiting -= 1
+        self.active += 1
+        try:
+            yield
+        finally:
+            self.active -= 1
+            self.slots.release()
+
+    async def relay(self, writer, produce, *args, first=None):
+        # Runs produce(stream, *args) on a worker thread and writes what it puts
+        # to the client; first() sees the first item before anything is written.
+        # The worker is told to stop if the client goes. Returns False if the
+        # stream was cut short, which leaves the connection unusable.
+        loop = asyncio.get_running_loop()
+        stream = ThreadStream(loop)
+        work = loop.run_in_executor(self.executor, produce, stream, *args)
+        try:
+            item = await first(await stream.get())
+            while item is not None:
+                if isinstance(item, Exception):
+                    # Too late for an error status; the unterminated body tells
+                    # the client the stream is incomplete
+                    print(f"Warning: Stream failed: {item}")
+                    return False
+                await self.write_chunk(writer, item)
+                item = await stream.get()
+            await self.end_stream(writer)
+            return True
+        finally:
+            stream.cancelled.set()
+            # Holds the slot until the upstream read has actually stopped
+            await asyncio.shield(work)
+
+    async def chat(self, request, writer, session):
+        body = request.json()
+        message = body.get("message")
+        if not isinstance(message, str) or not message.strip():
+            raise HTTPError(400, "message must be non-empty text")
+        bypass_cache = bool(body.get("bypass_cache", False))
+
+        async def first(item):
+            self.start_stream(writer, "text/event-stream")
+            return item
+
+        # A second message to the same session waits for the reply before it
+        async with session.lock:
+            async with self.slot():
+                # Failures after this point reach the client as an error event
+                keep_alive = await self.relay(writer, self.produce_chat, session, message.strip(), bypass_cache,
+                                              first=first)
+        session.touch()
+        return keep_alive
+
+    async def speech(self, request, writer, session):
+        body = request.json()
+        text = body.get("text")
+        response_format = body.get("format", "mp3")
+        if not isinstance(text, str) or not text.strip():
+            raise HTTPError(400, "text must be non-empty text")
+        if response_format not in AUDIO_TYPES:
+            raise HTTPError(400, f"format must be one of {', '.join(AUDIO_TYPES)}")
+        if body.get("normalize", True):
+            text, _ = normalize_for_speech(text)
+        if not text:
+            # Nothing speakable, e.g. a reply that was all code
+            self.write_head(writer, 204, {"Content-Length": 0})
+            await writer.drain()
+            return True
+
+        async def first(item):
+            # The status is sent once the first audio arrives, so a failed
+            # request can still get a proper error response
+            if isinstance(item, Exception):
+                raise HTTPError(502, f"Speech failed: {item}")
+            self.start_stream(writer, AUDIO_TYPES[response_format])
+            return item
+
+        async with self.slot():
+            return await self.relay(writer, self.produce_speech, session, text, response_format, first=first)
+
+    def produce_chat(self, stream, session, message, bypass_cache):
+        timer = self.metrics.start(session.id)
+        status = "ok"
+        try:
+            messages = session.conversation.build_messages(session.system_prompt, message)
+            key = None if bypass_cache else self.response_cache.make_key("gpt-4", messages)
+            reply = self.response_cache.get(key) if key else None
+            cached = reply is not None
+            if cached:
+                timer.mark("response_cache_hit")
+                timer.mark("chat_ttft")
+                stream.put(sse("token", {"text": reply}))
+            else:
+                reply = self.stream_reply(stream, messages, timer)
+            timer.mark("chat_total")
+            if key and not cached:
+                self.response_cache.put(key, "gpt-4", reply)
+            session.conversation.add_turn(message, reply)
+            session.turns += 1
+            record = self.metrics.finish(timer)
+            stream.put(sse("done", {"reply": reply, "cached": cached, "timings_ms": record["timings_ms"]}))
+        except StreamCancelled:
+            status = "cancelled"
+        except Exception as e:
+            status = "error"
+            with contextlib.suppress(StreamCancelled):
+                stream.put(sse("error", {"message": str(e)}))
+        finally:
+            if status != "ok":
+                self.metrics.finish(timer, status)
+            stream.close()
+        # Older turns are summarized after the reply has been delivered
+        session.conversation.compact()
+
+    def stream_reply(self, stream, messages, timer):
+        response = self.client.chat.completions.create(
+            model="gpt-4",
+            messages=messages,
+            stream=True
+        )
+        parts = []
+        try:
+            for chunk in response:
+                if stream.cancelled.is_set():
+                    raise StreamCancelled()
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not parts:
+                        timer.mark("chat_ttft")
+                    parts.append(delta)
+                    stream.put(sse("token", {"text": delta}))
+        finally:
+            response.close()
+        return "".join(parts)
+
+    def produce_speech(self, stream, session, text, response_format):
+        timer = self.metrics.start(session.id)
+        status = "ok"
+
+        def on_chunk(chunk):
+            timer.mark("first_audio")
+            stream.put(chunk)
+
+        try:
+            audio = self.tts_cache.speech(
+                self.client, text,
+                voice=session.settings["voice"],
+                speed=session.settings["voice_speed"],
+                response_format=response_format,
+                cancelled=stream.cancelled,
+                timer=timer,
+                on_chunk=on_chunk
+            )
+            if audio is None:
+                status = "cancelled"
+        except StreamCancelled:
+            status = "cancelled"
+        except Exception as e:
+            status = "error"
+            with contextlib.suppress(StreamCancelled):
+                stream.put(e)
+        finally:
+            self.metrics.finish(timer, status)
+            stream.close()
+
+
+def sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n".encode("utf-8")
+
+
+async def serve(server, host, port):
+    await server.start(host, port)
+    print(f"Cyber Ninja AI server listening on http://{host}:{server.port}")
+    try:
+        await server.serve_forever()
+    finally:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve Cyber Ninja AI chat and speech over HTTP")
+    parser.add_argument("--host", default="127.0.0.1", help="Interface to listen on")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY,
+                        help="Chat and speech requests sent upstream at once")
+    parser.add_argument("--max-waiting", type=int,
+                        help="Requests queued for a free slot before new ones get 503 (default 4x concurrency)")
+    parser.add_argument("--max-sessions", type=int, default=1000)
+    parser.add_argument("--settings", help="Settings file for voice, personality and caches (default settings.json)")
+    parser.add_argument("--token", default=os.getenv("CYBER_NINJA_SERVER_TOKEN"),
+                        help="Require this bearer token (or set CYBER_NINJA_SERVER_TOKEN)")
+    args = parser.parse_args()
+
+    base_dir = Path(__file__).parent.absolute()
+    load_dotenv(base_dir / ".env")
+    if args.host not in ("127.0.0.1", "localhost", "::1") and not args.token:
+        print(f"Warning: listening on {args.host} without --token; anyone who can reach it can use your API key")
+
+    settings = SettingsStore(args.settings or base_dir / "settings.json")
+    settings.load()
+    cache_dir = base_dir / "audio" / "cache"
+    metrics_file = settings["metrics_file"]
+    client = create_client()
+    warm_up(client)
+    tts_cache = TTSCache(cache_dir, max_bytes=int(settings["tts_cache_mb"] * 1024 * 1024))
+    server = ChatServer(
+        settings.items(),
+        client,
+        tts_cache,
+        ResponseCache(
+            cache_dir / "responses.db",
+            ttl=settings["response_cache_hours"] * 3600,
+            max_entries=settings["response_cache_entries"]
+        ),
+        metrics=LatencyMetrics(base_dir / metrics_file if metrics_file else None),
+        concurrency=args.concurrency,
+        max_waiting=args.max_waiting,
+        max_sessions=args.max_sessions,
+        token=args.token
+    )
+    try:
+        asyncio.run(serve(server, args.host, args.port))
+    finally:
+        tts_cache.close()
+
+
+if __name__ == "__main__":
+    try:
+        main()
+    except KeyboardInterrupt:
+        print("\nCyber Ninja AI server stopped.")
@@ -0,0 +1,145 @@
+import time
+from collections import deque
+
+import customtkinter as ctk
+
+from transcript_view import TranscriptView
+
+# Recent lines kept in memory, used as context when a chat is reopened; the
+# whole chat is in the chat log
+HISTORY_LINES = 200
+TAB_TITLE_CHARS = 18
+WELCOME = "Cyber Ninja AI: Welcome, user. I am your cyber ninja assistant. How may I assist you today?"
+
+
+class ChatTab:
+    def __init__(self, number, frame, chat_log, conversation, system_prompt):
+        # One conversation: its transcript, model context, chat log session and
+        # request queue. The window owns the request queue's handler, so it
+        # sets request_queue after creating the tab.
+        self.number = number
+        self.name = f"{number}. New chat"
+        self.frame = frame
+        self.chat_log = chat_log
+        self.conversation = conversation
+        # The personality the tab's messages are sent with; settings changes
+        # only update the tab they were made in
+        self.system_prompt = system_prompt
+        self.request_queue = None
+        self.chat_history = deque(maxlen=HISTORY_LINES)
+        self.session_id = None
+        self.current_audio = None
+        self.stream_timer = None
+        self.last_ttft = None
+        # Messages typed before the client was ready
+        self.pending_messages = []
+        # The textbox exists only while the tab is shown or was shown recently;
+        # everything it displayed can be read back from the chat log
+        self.textbox = None
+        self.transcript = None
+        self.hidden_since = None
+
+        self.frame.grid_rowconfigure(0, weight=1)
+        self.frame.grid_columnconfigure(0, weight=1)
+
+    def show(self):
+        self.hidden_since = None
+        if self.transcript is not None:
+            return
+        self.textbox = ctk.CTkTextbox(
+            self.frame,
+            corner_radius=10,
+            font=ctk.CTkFont(size=13)
+        )
+        self.textbox.grid(row=0, column=0, padx=20, pady=20, sticky="nsew")
+        self.textbox.configure(state="disabled")
+        self.transcript = TranscriptView(self.textbox, self.chat_log)
+        self.transcript.start()
+        start = 0
+        if self.session_id is not None:
+            start = self.chat_log.count(self.session_id) - len(self.chat_history)
+        self.transcript.reset(self.session_id, self.chat_history, start)
+
+    def hide(self):
+        if self.hidden_since is None:
+            self.hidden_since = time.monotonic()
+
+    def idle_for(self):
+        return 0.0 if self.hidden_since is None else time.monotonic() - self.hidden_since
+
+    def release(self):
+        # Drops the textbox and its text; replies still arriving are logged and
+        # shown when the tab is next opened
+        if self.transcript is None:
+            return
+        self.textbox.destroy()
+        self.textbox = None
+        self.transcript = None
+
+    def is_empty(self):
+        # Nothing sent yet, so opening a saved chat can reuse the tab
+        return self.session_id is None and (self.request_queue is None or self.request_queue.pending() == 0)
+
+    def title(self):
+        title = self.chat_log.title(self.session_id) if self.session_id is not None else "New chat"
+        return title if len(title) <= TAB_TITLE_CHARS else title[:TAB_TITLE_CHARS - 1] + "…"
+
+    def open_session(self, session_id, focus_seq=None):
+        # Only the tail is read; the transcript pages in earlier messages when
+        # the user scrolls up. A search hit opens the chat at that message.
+        if session_id != self.session_id:
+            total = self.chat_log.count(session_id)
+            start = max(0, total - HISTORY_LINES)
+            self.session_id = session_id
+            self.chat_history = deque(self.chat_log.read(session_id, start), maxlen=HISTORY_LINES)
+            self.restore_conversation()
+            if self.transcript and focus_seq is None:
+                self.transcript.reset(session_id, self.chat_history, start)
+        if self.transcript and focus_seq is not None:
+            self.transcript.show(session_id, focus_seq)
+
+    def ensure_session(self):
+        # Lines shown before the first message (the welcome) go in with it
+        if self.session_id is None:
+            self.session_id = self.chat_log.start_session()
+            self.chat_log.append(self.session_id, list(self.chat_history))
+            if self.transcript:
+                self.transcript.session_id = self.session_id
+
+    def record_lines(self, lines):
+        # Returns True if a new user message was logged, which renames the chat
+        self.chat_history.extend(lines)
+        if self.session_id is None:
+            return False
+        self.chat_log.append(self.session_id, lines)
+        return any(line.startswith("You: ") for line in lines)
+
+    def restore_conversation(self):
+        # Rebuild model context from the "You: " / "Cyber Ninja AI: " display lines
+        self.conversation.reset()
+        roles = {"You: ": "user", "Cyber Ninja AI: ": "assistant"}
+        for line in self.chat_history:
+            for prefix, role in roles.items():
+                if line.startswith(prefix):
+                    self.conversation.add(role, line[len(prefix):])
+                    break
+
+    def append(self, lines):
+        logged = self.record_lines(lines)
+        if self.transcript:
+            self.transcript.append(lines)
+        return logged
+
+    def begin_partial(self, text):
+        if self.transcript:
+            self.transcript.begin_partial(text)
+
+    def write_partial(self, text):
+        if self.transcript:
+            self.transcript.write_partial(text)
+
+    def end_partial(self, line):
+        logged = self.record_lines([line])
+        if self.transcript:
+            self.transcript.end_partial(line)
+        return logged
@@ -1,17 +1,40 @@
-from openai import OpenAI
+from openai_client import create_client, warm_up
+from rate_limiter import get_rate_limiter
 import os
+import argparse
+import json
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from dotenv import load_dotenv
 from pathlib import Path
 import stat
+import pygame
+from speech_pipeline import SpeechPipeline
+from speech_text import normalize_for_speech
+from tts_cache import TTSCache
+from response_cache import ResponseCache
+from conversation import ConversationHistory, summarize_messages
+from metrics import LatencyMetrics, timed
+
+SYSTEM_PROMPT = "You are a cyber ninja AI assistant with advanced capabilities. Respond in a high-tech, professional manner."
 
 class CyberNinjaChatbot:
-    def __init__(self):
+    def __init__(self, output_dir=None):
         load_dotenv()
-        self.client = OpenAI()
+        self.client = create_client()
+        warm_up(self.client)
+        self.audio_enabled = self.init_audio()
+        # Per-turn stage timings; set CYBER_NINJA_METRICS_FILE to keep a JSONL log
+        self.metrics = LatencyMetrics(os.getenv("CYBER_NINJA_METRICS_FILE"))
+        self.history = ConversationHistory(
+            summarize=lambda summary, messages: summarize_messages(self.client, summary, messages)
+        )
         try:
             # Get the absolute path to the script's directory
             base_dir = Path(__file__).resolve().parent
-            self.output_dir = base_dir / "audio"
+            self.output_dir = Path(output_dir) if output_dir else base_dir / "audio"
             
             # Create directory with full permissions if it doesn't exist
             if not self.output_dir.exists():
@@ -23,87 +46,177 @@ class CyberNinjaChatbot:
                     except Exception as perm_error:
                         print(f"Warning: Could not set directory permissions: {perm_error}")
             print(f"Audio output directory: {self.output_dir}")
+            self.tts_cache = TTSCache(self.output_dir / "cache")
+            self.response_cache = ResponseCache(self.output_dir / "cache" / "responses.db")
         except Exception as e:
             print(f"Error setting up audio directory: {e}")
             raise
         
-    def get_chat_response(self, prompt):
+    def build_messages(self, prompt):
+        return self.history.build_messages(SYSTEM_PROMPT, prompt)
+
+    def cached_reply(self, messages, bypass_cache=False, timer=None):
+        # Returns (key, reply); the key is None when the cache is bypassed
+        if bypass_cache:
+            return None, None
+        key = self.response_cache.make_key("gpt-4", messages)
+        reply = self.response_cache.get(key)
+        if reply is not None and timer:
+            timer.mark("response_cache_hit")
+        return key, reply
+
+    def get_chat_response(self, prompt, timer=None, bypass_cache=False):
         try:
-            response = self.client.chat.completions.create(
-                model="gpt-4",  # Using gpt-4 as gpt-4o was not found in documentation
-                messages=[
-                    {"role": "system", "content": "You are a cyber ninja AI assistant with advanced capabilities. Respond in a high-tech, professional manner."},
-                    {"role": "user", "content": prompt}
-                ]
-            )
-            return response.choices[0].message.content
+            messages = self.build_messages(prompt)
+            key, reply = self.cached_reply(messages, bypass_cache, timer)
+            if reply is None:
+                response = self.client.chat.completions.create(
+                    model="gpt-4",  # Using gpt-4 as gpt-4o was not found in documentation
+                    messages=messages
+                )
+                # chat_total is a mark everywhere: when the whole reply was in
+                if timer:
+                    timer.mark("chat_total")
+                reply = response.choices[0].message.content
+                if key:
+                    self.response_cache.put(key, "gpt-4", reply)
+            self.history.add_turn(prompt, reply)
+            return reply
         except Exception as e:
             print(f"Error generating chat response: {e}")
             return "System error encountered. Please try again."
 
-    def text_to_speech(self, text, filename="response.mp3"):
+    def stream_chat_response(self, prompt, timer=None, bypass_cache=False):
         try:
-            # Ensure unique filename to avoid permission issues
-            counter = 0
-            while True:
-                if counter == 0:
-                    speech_file_path = self.output_dir / filename
-                else:
-                    base, ext = os.path.splitext(filename)
-                    speech_file_path = self.output_dir / f"{base}_{counter}{ext}"
-                
-                if not speech_file_path.exists():
-                    break
-                counter += 1
+            messages = self.build_messages(prompt)
+            key, reply = self.cached_reply(messages, bypass_cache, timer)
+            if reply is not None:
+                # Replayed through the same path as a live reply so it is shown and spoken alike
+                if timer:
+                    timer.mark("chat_ttft")
+                yield reply
+                if timer:
+                    timer.mark("chat_total")
+                self.history.add_turn(prompt, reply)
+                return
 
-            # Generate speech
-            response = self.client.audio.speech.create(
-                model="tts-1",
-                voice="alloy",  # Using alloy for cyber ninja style
-                input=text
+            stream = self.client.chat.completions.create(
+                model="gpt-4",
+                messages=messages,
+                stream=True
             )
+            parts = []
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    if timer and not parts:
+                        timer.mark("chat_ttft")
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+            if timer:
+                timer.mark("chat_total")
+            reply = "".join(parts)
+            if key:
+                self.response_cache.put(key, "gpt-4", reply)
+            self.history.add_turn(prompt, reply)
+        except Exception as e:
+            print(f"Error generating chat response: {e}")
+            yield "System error encountered. Please try again."
 
-            # Write with explicit permissions
-            with open(speech_file_path, 'wb') as f:
-                for chunk in response.iter_bytes():
-                    f.write(chunk)
-            
-            # Set file permissions
-            try:
-                os.chmod(speech_file_path, 0o666)  # Read/write for everyone
-            except Exception as perm_error:
-                print(f"Warning: Could not set file permissions: {perm_error}")
-            
-            return speech_file_path
+    def text_to_speech(self, text, timer=None):
+        try:
+            # Code, markdown and URLs are rewritten or dropped before synthesis
+            spoken, removed = normalize_for_speech(text)
+            if timer:
+                timer.count("tts_chars_removed", removed)
+            if not spoken:
+                return None
+            # Served from the cache when this exact line was spoken before
+            return self.tts_cache.speech(
+                self.client,
+                spoken,
+                voice="alloy",  # Using alloy for cyber ninja style
+                timer=timer
+            )
         except Exception as e:
             print(f"Error generating speech: {e}")
             return None
 
-    def play_audio(self, file_path):
+    def init_audio(self):
         try:
-            if os.name == 'nt':  # Windows
-                # Use quotes around the path to handle spaces
-                os.system(f'start "" "{file_path.absolute()}"')
-            elif os.name == 'posix':  # macOS/Linux
-                os.system(f'afplay "{file_path}"')
-        except Exception as e:
+            pygame.mixer.init()
+            return True
+        except pygame.error as e:
+            print(f"Warning: Audio output unavailable, replies will not be spoken: {e}")
+            return False
+
+    def play_audio(self, audio, cancelled=None, timer=None):
+        # Plays encoded speech straight from memory and blocks until it has
+        # finished, so clips never overlap
+        if not self.audio_enabled or not audio:
+            return
+        try:
+            with timed(timer, "audio_load"):
+                sound = pygame.mixer.Sound(file=io.BytesIO(audio))
+            channel = sound.play()
+            if timer:
+                timer.mark("playback_start")
+            while channel is not None and channel.get_busy():
+                if cancelled is not None and cancelled.is_set():
+                    channel.stop()
+                    break
+                time.sleep(0.01)
+        except pygame.error as e:
             print(f"Error playing audio: {e}")
 
-    def run(self):
+    def play_clip(self, audio, pipeline):
+        # Sentence clips from the speech pipeline arrive in order
+        if pipeline.cancelled.is_set():
+            return
+        self.play_audio(audio, pipeline.cancelled, pipeline.timer)
+
+    def print_stats(self):
+        stats = self.tts_cache.stats()
+        print(f"TTS cache: {stats['hits']} hits, {stats['misses']} misses, "
+              f"{stats['entries']} clips ({stats['bytes'] / 1024 / 1024:.1f} MB)")
+        stats = self.response_cache.stats()
+        print(f"Response cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} replies")
+        for name in ("chat_ttft", "chat_total", "tts_synthesis", "playback_start"):
+            latency = self.metrics.percentiles(name)
+            if latency:
+                print(f"{name}: p50 {latency['p50']:.0f} ms, p95 {latency['p95']:.0f} ms, p99 {latency['p99']:.0f} ms")
+        limits = get_rate_limiter().stats()
+        if limits["throttled"] or limits["retries"]:
+            print(f"Rate limiting: {limits['throttled']} requests waited {limits['throttled_seconds']:.1f} s, "
+                  f"{limits['retries']} retries ({limits['rate_limited']} after 429s)")
+
+    def run(self, bypass_cache=False):
         print("Cyber Ninja AI: Online. Type 'exit' to terminate session.")
         while True:
             try:
                 user_input = input("\nYou: ")
                 if user_input.lower() == 'exit':
                     print("Cyber Ninja AI: Terminating session. Goodbye.")
+                    self.print_stats()
                     break
                 
-                reply = self.get_chat_response(user_input)
-                print(f"\nCyber Ninja AI: {reply}")
-                
-                audio_file = self.text_to_speech(reply)
-                if audio_file:
-                    self.play_audio(audio_file)
+                # Speak each sentence as soon as it has been generated
+                print("\nCyber Ninja AI: ", end="", flush=True)
+                timer = self.metrics.start()
+                pipeline = SpeechPipeline(self.client, self.play_clip, cache=self.tts_cache, timer=timer)
+                try:
+                    for delta in self.stream_chat_response(user_input, timer=timer, bypass_cache=bypass_cache):
+                        print(delta, end="", flush=True)
+                        pipeline.feed(delta)
+                    print()
+                    pipeline.close()
+                    # Summarize turns that left the context window while the reply plays
+                    self.history.compact()
+                    pipeline.wait()
+                    self.metrics.finish(timer)
+                except BaseException:
+                    pipeline.cancel()
+                    self.metrics.finish(timer, status="cancelled")
+                    raise
             except KeyboardInterrupt:
                 print("\nCyber Ninja AI: Detected interrupt signal. Shutting down gracefully.")
                 break
@@ -111,9 +224,164 @@ class CyberNinjaChatbot:
                 print(f"\nCyber Ninja AI: An error occurred: {e}")
                 print("Continuing operation...")
 
+    def complete(self, prompt, system_prompt=SYSTEM_PROMPT, timer=None, bypass_cache=False):
+        # Single stand-alone exchange without conversation memory; errors propagate
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": prompt}
+        ]
+        key, reply = self.cached_reply(messages, bypass_cache, timer)
+        if reply is not None:
+            return reply
+        response = self.client.chat.completions.create(
+            model="gpt-4",
+            messages=messages
+        )
+        if timer:
+            timer.mark("chat_total")
+        reply = response.choices[0].message.content
+        if key:
+            self.response_cache.put(key, "gpt-4", reply)
+        return reply
+
+    def process_batch_item(self, item, speak, voice, bypass_cache=False):
+        timer = self.metrics.start(item["id"])
+        record = {"id": item["id"], "prompt": item["prompt"]}
+        try:
+            record["reply"] = self.complete(
+                item["prompt"],
+                item.get("system", SYSTEM_PROMPT),
+                timer=timer,
+                bypass_cache=item.get("bypass_cache", bypass_cache)
+            )
+            spoken, removed = normalize_for_speech(record["reply"]) if speak else ("", 0)
+            if spoken:
+                timer.count("tts_chars_removed", removed)
+                audio = self.tts_cache.speech(
+                    self.client,
+                    spoken,
+                    voice=item.get("voice", voice),
+                    timer=timer
+                )
+                # Archived outside the cache so eviction can never remove a batch result
+                audio_path = self.output_dir / "batch" / f"{item['id']}.mp3"
+                audio_path.write_bytes(audio)
+                record["audio"] = str(audio_path)
+            record["status"] = "ok"
+        except Exception as e:
+            record["status"] = "error"
+            record["error"] = str(e)
+        timings = self.metrics.finish(timer, record["status"])["timings_ms"]
+        record["latency_ms"] = timings["total"]
+        return record
+
+    def run_batch(self, input_path, output_path, concurrency=4, speak=False, voice="alloy", bypass_cache=False):
+        # Prompts are read lazily from JSONL ({"id": ..., "prompt": ...} per line)
+        # and results appended as they finish, so a crashed run can be resumed:
+        # IDs already completed in the output file are skipped.
+        done = set()
+        if os.path.exists(output_path):
+            with open(output_path, 'rb+') as f:
+                end = 0
+                for line in f:
+                    if not line.endswith(b"\n"):
+                        # Torn last line from a crash: cut it off so the next
+                        # record starts on a line of its own
+                        f.truncate(end)
+                        break
+                    end += len(line)
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if isinstance(record, dict) and record.get("status") == "ok":
+                        done.add(str(record.get("id")))
+        if speak:
+            (self.output_dir / "batch").mkdir(parents=True, exist_ok=True)
+
+        write_lock = threading.Lock()
+        counts = {"ok": 0, "error": 0, "skipped": 0}
+        started = time.perf_counter()
+
+        def write(out, record):
+            with write_lock:
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                counts[record["status"]] += 1
+                print(f"[{counts['ok'] + counts['error']}] {record['id']}: {record['status']} "
+                      f"({record['latency_ms']:.0f} ms)")
+
+        def items():
+            # Yields (item, None), or (None, failed record) for a line that isn't
+            # a valid prompt, so one bad line doesn't stop the batch
+            with open(input_path, 'r', encoding='utf-8') as f:
+                for line_number, line in enumerate(f, 1):
+                    if not line.strip():
+                        continue
+                    try:
+                        item = json.loads(line)
+                        if not isinstance(item, dict) or not isinstance(item.get("prompt"), str):
+                            raise ValueError('expected an object with a "prompt" string')
+                    except ValueError as e:
+                        yield None, {"id": str(line_number), "status": "error",
+                                     "error": f"Invalid input line {line_number}: {e}", "latency_ms": 0.0}
+                        continue
+                    item["id"] = str(item.get("id", line_number))
+                    if item["id"] in done:
+                        counts["skipped"] += 1
+                        continue
+                    yield item, None
+
+        executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="batch")
+        in_flight = set()
+        try:
+            with open(output_path, 'a', encoding='utf-8') as out:
+                for item, failed in items():
+                    if failed:
+                        write(out, failed)
+                        continue
+                    # Keep a bounded window of work so huge prompt files stream through
+                    if len(in_flight) >= concurrency * 2:
+                        finished, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                        for future in finished:
+                            write(out, future.result())
+                    in_flight.add(executor.submit(self.process_batch_item, item, speak, voice, bypass_cache))
+                for future in wait(in_flight).done:
+                    write(out, future.result())
+        finally:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        elapsed = time.perf_counter() - started
+        processed = counts["ok"] + counts["error"]
+        print(f"Batch complete: {counts['ok']} ok, {counts['error']} errors, {counts['skipped']} skipped "
+              f"in {elapsed:.1f}s ({processed / elapsed if elapsed else 0:.2f} prompts/s)")
+        return counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cyber Ninja AI command-line assistant")
+    parser.add_argument("--batch", metavar="PROMPTS_JSONL", help="Answer every prompt in a JSONL file instead of chatting")
+    parser.add_argument("--output", default="batch_results.jsonl", help="JSONL file batch results are appended to")
+    parser.add_argument("--concurrency", type=int, default=4, help="Prompts processed in parallel in batch mode")
+    parser.add_argument("--tts", action="store_true", help="Also synthesize audio for each batch reply")
+    parser.add_argument("--voice", default="alloy", help="Voice for batch audio")
+    parser.add_argument("--no-cache", action="store_true", help="Always ask the API instead of reusing cached replies")
+    args = parser.parse_args()
+
+    bot = CyberNinjaChatbot()
+    try:
+        if args.batch:
+            bot.run_batch(args.batch, args.output, concurrency=args.concurrency, speak=args.tts, voice=args.voice,
+                          bypass_cache=args.no_cache)
+        else:
+            bot.run(bypass_cache=args.no_cache)
+    finally:
+        bot.tts_cache.close()
+
 if __name__ == "__main__":
     try:
-        bot = CyberNinjaChatbot()
-        bot.run()
+        main()
+    except KeyboardInterrupt:
+        print("\nCyber Ninja AI: Interrupted.")
     except Exception as e:
         print(f"Fatal error: {e}") 
\ No newline at end of file
@@ -0,0 +1,120 @@
+import threading
+from collections import deque
+
+try:
+    import tiktoken
+except ImportError:  # Fall back to a character-based estimate
+    tiktoken = None
+
+SUMMARY_MODEL = "gpt-3.5-turbo"
+# Every chat message carries a few tokens of role/formatting overhead
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_encoders = {}
+
+
+def count_tokens(text, model="gpt-4"):
+    if tiktoken is None:
+        return len(text) // 4 + 1
+    encoder = _encoders.get(model)
+    if encoder is None:
+        try:
+            encoder = tiktoken.encoding_for_model(model)
+        except KeyError:
+            encoder = tiktoken.get_encoding("cl100k_base")
+        _encoders[model] = encoder
+    return len(encoder.encode(text))
+
+
+def summarize_messages(client, summary, messages, model=SUMMARY_MODEL):
+    transcript = "\n".join(f"{m['role']}: {m['content']}" for m in messages)
+    response = client.chat.completions.create(
+        model=model,
+        messages=[
+            {"role": "system", "content": "Condense the conversation into a short summary of the facts, preferences and open questions the assistant must remember. Stay under 150 words."},
+            {"role": "user", "content": f"Existing summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"}
+        ]
+    )
+    return response.choices[0].message.content.strip()
+
+
+class ConversationHistory:
+    def __init__(self, max_tokens=3000, summarize=None, model="gpt-4"):
+        # max_tokens bounds the remembered context (window plus summary); the
+        # system prompt and the current user message come on top of it
+        self.max_tokens = max_tokens
+        self.summarize = summarize
+        self.model = model
+        self.lock = threading.Lock()
+        self.compact_lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            # Each entry caches its token count so the window total is a running sum
+            self.window = deque()
+            self.window_tokens = 0
+            self.summary = ""
+            self.summary_tokens = 0
+            # Messages that slid out of the window but are not summarized yet
+            self.pending = []
+
+    def add(self, role, content):
+        tokens = count_tokens(content, self.model) + MESSAGE_OVERHEAD_TOKENS
+        with self.lock:
+            self.window.append({"role": role, "content": content, "tokens": tokens})
+            self.window_tokens += tokens
+            self._slide()
+
+    def add_turn(self, user_message, reply):
+        self.add("user", user_message)
+        self.add("assistant", reply)
+
+    def _slide(self):
+        # Keep at least the latest message even if it alone is over budget
+        while self.window_tokens + self.summary_tokens > self.max_tokens and len(self.window) > 1:
+            message = self.window.popleft()
+            self.window_tokens -= message["tokens"]
+            self.pending.append(message)
+
+    def build_messages(self, system_prompt, user_message):
+        with self.lock:
+            if self.summary:
+                system_prompt = f"{system_prompt}\n\nSummary of the earlier conversation:\n{self.summary}"
+            messages = [{"role": "system", "content": system_prompt}]
+            messages.extend({"role": m["role"], "content": m["content"]} for m in self.window)
+        messages.append({"role": "user", "content": user_message})
+        return messages
+
+    def compact(self):
+        # Fold messages that left the window into the running summary. Call this
+        # after a reply is delivered so the extra request never delays a turn.
+        with self.compact_lock:
+            with self.lock:
+                pending, self.pending = self.pending, []
+            if not pending or self.summarize is None:
+                return
+
+            # Only the most recent budget's worth is summarized; anything older
+            # (e.g. after loading a long transcript) is simply forgotten
+            budget = self.max_tokens
+            recent = []
+            for message in reversed(pending):
+                budget -= message["tokens"]
+                if budget < 0:
+                    break
+                recent.append(message)
+            recent.reverse()
+            if not recent:
+                return
+
+            try:
+                summary = self.summarize(self.summary, recent)
+            except Exception as e:
+                print(f"Warning: Could not summarize conversation: {e}")
+                return
+
+            with self.lock:
+                self.summary = summary
+                self.summary_tokens = count_tokens(summary, self.model) + MESSAGE_OVERHEAD_TOKENS
+                self._slide()
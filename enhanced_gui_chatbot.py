@@ -1,14 +1,51 @@
+from metrics import LatencyMetrics, TurnTimer
+
+# Startup phases are timed from here; see report_startup()
+STARTUP = TurnTimer("startup")
+
 import customtkinter as ctk
-from openai import OpenAI
 import os
 from dotenv import load_dotenv, set_key
 from pathlib import Path
-import pygame
 import json
-from datetime import datetime
 import darkdetect
 from tkinter import filedialog
 import threading
+import itertools
+import multiprocessing
+from speech_pipeline import SpeechPipeline
+from tts_cache import TTSCache
+from response_cache import ResponseCache
+from speech_text import normalize_for_speech
+from conversation import ConversationHistory, summarize_messages
+from ui_queue import UIEventQueue
+from request_queue import RequestQueue
+from chat_log import ChatLog
+from chat_tab import ChatTab, WELCOME
+from audio_engine import AudioArbiter
+from settings_store import SettingsStore, PERSONALITY_TRAITS, VOICES, THEMES, build_system_prompt
+
+# openai (with httpx) and pygame are the slow imports; they are loaded in the
+# background once the window is on screen
+
+STARTUP.mark("imports")
+
+# Stages shown in the status bar for the last turn, in pipeline order
+STATUS_STAGES = [
+    ("chat_ttft", "TTFT"),
+    ("visible_ttft", "visible"),
+    ("chat_total", "chat"),
+    ("tts_synthesis", "TTS"),
+    ("audio_load", "load"),
+    ("playback_start", "audio")
+]
+SEARCH_DELAY_MS = 200
+SEARCH_RESULTS = 20
+AUDIO_POLL_MS = 500
+# Tabs left in the background this long give up their textbox; replies keep
+# arriving into the chat log and are shown when the tab is opened again
+TAB_RELEASE_SECONDS = 120
+TAB_CHECK_MS = 10000
 
 class APIKeyDialog(ctk.CTkToplevel):
     def __init__(self):
@@ -60,13 +97,23 @@ class CyberNinjaGUI(ctk.CTk):
         self.setup_paths()
         if not self.check_api_key():
             self.get_api_key()
-        self.initialize_client()
-        pygame.mixer.init()
         self.settings_file = Path(__file__).parent / "settings.json"
         self.load_settings()
+        STARTUP.mark("settings")
+        
+        # Set up in the background by load_services() once the window is showing;
+        # messages sent before then wait in each tab's pending_messages
+        self.client = None
+        self.audio = None
+        self.tts_cache = None
+        self.response_cache = None
+        self.services_ready = threading.Event()
+        self.sidebar_ready = False
+        self.prompt_editor = None
         
         # Configure window
         self.title("Cyber Ninja AI Assistant")
+        self.protocol("WM_DELETE_WINDOW", self.on_close)
         self.geometry("1200x800")  # Larger default size
         
         # Configure grid layout with better spacing
@@ -93,20 +140,9 @@ class CyberNinjaGUI(ctk.CTk):
         self.header_frame.grid(row=0, column=0, sticky="ew", padx=10, pady=(0, 10))
         self.create_menu()
         
-        # Create chat frame with better styling
-        self.chat_frame = ctk.CTkFrame(self.main_content, corner_radius=10)
-        self.chat_frame.grid(row=1, column=0, sticky="nsew")
-        self.chat_frame.grid_rowconfigure(0, weight=1)
-        self.chat_frame.grid_columnconfigure(0, weight=1)
-        
-        # Create chat display with better styling
-        self.chat_display = ctk.CTkTextbox(
-            self.chat_frame,
-            corner_radius=10,
-            font=ctk.CTkFont(size=13)
-        )
-        self.chat_display.grid(row=0, column=0, padx=20, pady=20, sticky="nsew")
-        self.chat_display.configure(state="disabled")
+        # One tab per conversation; each tab builds its own chat display
+        self.tabview = ctk.CTkTabview(self.main_content, corner_radius=10, command=self.on_tab_changed)
+        self.tabview.grid(row=1, column=0, sticky="nsew")
         
         # Create input area with better styling
         self.input_frame = ctk.CTkFrame(self.main_content, corner_radius=10)
@@ -122,6 +158,8 @@ class CyberNinjaGUI(ctk.CTk):
         )
         self.chat_input.grid(row=0, column=0, padx=(20, 10), pady=20, sticky="ew")
         self.chat_input.bind("<Return>", self.send_message)
+        # Shift+Enter asks the API again even if an identical question was cached
+        self.chat_input.bind("<Shift-Return>", lambda event: self.send_message(bypass_cache=True))
         
         # Send button with better styling
         self.send_button = ctk.CTkButton(
@@ -131,27 +169,149 @@ class CyberNinjaGUI(ctk.CTk):
             height=40,
             font=ctk.CTkFont(size=13, weight="bold")
         )
-        self.send_button.grid(row=0, column=1, padx=(0, 20), pady=20)
+        self.send_button.grid(row=0, column=1, padx=(0, 10), pady=20)
         self.send_button.configure(command=self.send_message)
         
+        # Cancel button aborts the reply that is currently rendering
+        self.cancel_button = ctk.CTkButton(
+            self.input_frame,
+            text="Cancel",
+            width=80,
+            height=40,
+            font=ctk.CTkFont(size=13),
+            fg_color="transparent",
+            border_width=1
+        )
+        self.cancel_button.grid(row=0, column=2, padx=(0, 20), pady=20)
+        self.cancel_button.configure(command=self.cancel_request)
+        self.chat_input.bind("<Escape>", self.cancel_request)
+        
+        # Shows how many typed-ahead messages are waiting for their turn
+        self.queue_label = ctk.CTkLabel(
+            self.input_frame,
+            text="",
+            font=ctk.CTkFont(size=11)
+        )
+        self.queue_label.grid(row=1, column=0, columnspan=3, padx=20, pady=(0, 5), sticky="w")
+        
         # Audio player with better styling
         self.player_frame = ctk.CTkFrame(self.main_content, corner_radius=10)
         self.player_frame.grid(row=3, column=0, sticky="ew", pady=(20, 0))
         self.create_audio_controls()
         
-        # Create sidebar content with better organization
-        self.create_sidebar_widgets()
+        # Status bar with the last turn's latency breakdown
+        self.status_label = ctk.CTkLabel(
+            self.main_content,
+            text="",
+            anchor="w",
+            font=ctk.CTkFont(size=11)
+        )
+        self.status_label.grid(row=4, column=0, sticky="ew", padx=10, pady=(5, 0))
         
         # Initialize state
-        self.current_audio = None
         self.is_playing = False
-        self.chat_history = []
+        # Every displayed line is appended to the chat log as it appears; a
+        # session is started when a tab's first message is sent
+        self.chat_log = ChatLog(self.output_dir / "chats.db")
+        self.tabs = {}
+        self.tab_numbers = itertools.count(1)
+        self.active_tab = None
+        self.recent_chats = {}
+        self.recent_menu = None
+        self.search_job = None
+        
+        # Speech pipelines and PCM stream players from every tab, in playback order
+        self.arbiter = AudioArbiter()
+        
+        # Worker threads never touch widgets; they post events that the Tk
+        # thread drains once per frame
+        self.ui_queue = UIEventQueue(self)
+        self.ui_queue.register("append", self.append_messages, batch=True)
+        self.ui_queue.register("stream_begin", self.begin_stream)
+        self.ui_queue.register("stream_text", self.write_stream_text, batch=True)
+        self.ui_queue.register("stream_end", self.end_stream)
+        self.ui_queue.register("play", self.play_audio)
+        self.ui_queue.register("playing", self.show_playing)
+        self.ui_queue.register("queue_status", self.update_queue_status)
+        self.ui_queue.register("metrics", self.update_status_bar)
+        self.ui_queue.register("services_ready", self.on_services_ready)
+        self.ui_queue.start()
         
-        # Welcome message
-        self.append_message("Cyber Ninja AI: Welcome, user. I am your cyber ninja assistant. How may I assist you today?")
+        metrics_file = self.settings.get("metrics_file")
+        self.metrics = LatencyMetrics(self.base_dir / metrics_file if metrics_file else None)
+        
+        # The first conversation
+        self.open_tab()
         
         # Apply theme
         self.apply_theme()
+        self.update_queue_status()
+        self.after(TAB_CHECK_MS, self.release_idle_tabs)
+        STARTUP.mark("window")
+        
+        # The rest loads once the window has been drawn and the user can type
+        self.after(0, self.start_deferred_init)
+    
+    def start_deferred_init(self):
+        self.update_idletasks()
+        STARTUP.mark("first_frame")
+        threading.Thread(target=self.load_services, name="startup", daemon=True).start()
+        # The sidebar is built on the Tk thread while the services load
+        self.after(1, self.build_sidebar)
+    
+    def build_sidebar(self):
+        with STARTUP.stage("sidebar_build"):
+            self.create_sidebar_widgets()
+        self.sidebar_ready = True
+        STARTUP.mark("sidebar")
+        self.finish_startup()
+    
+    def load_services(self):
+        # Runs on a background thread: the slow imports and device/disk setup
+        try:
+            with STARTUP.stage("client_init"):
+                self.initialize_client()
+            with STARTUP.stage("cache_init"):
+                self.initialize_caches()
+        except Exception as e:
+            self.ui_queue.post("append", None, f"Error: Could not start the assistant: {e}")
+            return
+        # Chatting works without sound, so a missing audio device isn't fatal
+        with STARTUP.stage("audio_init"):
+            self.initialize_audio()
+        self.services_ready.set()
+        self.ui_queue.post("services_ready")
+    
+    def on_services_ready(self):
+        STARTUP.mark("services")
+        for tab in list(self.tabs.values()):
+            pending, tab.pending_messages = tab.pending_messages, []
+            for message, bypass_cache in pending:
+                self.submit_message(tab, message, bypass_cache)
+        self.update_queue_status()
+        self.poll_audio()
+        self.finish_startup()
+    
+    def finish_startup(self):
+        if self.sidebar_ready and self.services_ready.is_set():
+            STARTUP.mark("ready")
+            self.report_startup()
+    
+    def report_startup(self):
+        record = STARTUP.record()
+        timings = record["timings_ms"]
+        print("Startup: " + ", ".join(f"{name} {ms:.0f} ms" for name, ms in timings.items()))
+        self.status_label.configure(
+            text=f"Ready in {timings['ready']:.0f} ms · window shown at {timings['first_frame']:.0f} ms"
+        )
+        self.metrics.write(record)
+        
+        # Set by startup_check.py: write the report there and exit
+        report_path = os.getenv("CYBER_NINJA_STARTUP_REPORT")
+        if report_path:
+            with open(report_path, 'w', encoding='utf-8') as f:
+                json.dump(record, f)
+            self.after(0, self.destroy)
     
     def setup_paths(self):
         self.base_dir = Path(__file__).parent.absolute()
@@ -175,8 +335,34 @@ class CyberNinjaGUI(ctk.CTk):
             self.quit()
     
     def initialize_client(self):
+        from openai_client import create_client, warm_up
         load_dotenv(self.env_file)
-        self.client = OpenAI()
+        self.client = create_client()
+        # Connect while the user is still typing the first message
+        warm_up(self.client)
+    
+    def initialize_audio(self):
+        from audio_engine import create_engine
+        # With audio_process on, pygame lives in a worker process and is never
+        # imported here
+        try:
+            self.audio = create_engine(self.settings["audio_process"], self.settings["volume"])
+        except Exception as e:
+            # e.g. pygame.error when there is no output device
+            print(f"Warning: Audio output unavailable, replies will not be spoken: {e}")
+            self.ui_queue.post("append", None, f"Audio output unavailable, replies will not be spoken: {e}")
+            self.audio = None
+    
+    def initialize_caches(self):
+        self.tts_cache = TTSCache(
+            self.output_dir / "cache",
+            max_bytes=int(self.settings.get("tts_cache_mb", 200) * 1024 * 1024)
+        )
+        self.response_cache = ResponseCache(
+            self.output_dir / "cache" / "responses.db",
+            ttl=self.settings.get("response_cache_hours", 24) * 3600,
+            max_entries=self.settings.get("response_cache_entries", 1000)
+        )
     
     def create_menu(self):
         self.api_button = ctk.CTkButton(
@@ -205,14 +391,12 @@ class CyberNinjaGUI(ctk.CTk):
     def create_sidebar_widgets(self):
         # Theme settings with better styling
         self.create_section_header("Theme Settings", 0)
-        themes = ["System", "Dark", "Light"]
-        self.theme_option = self.create_dropdown(themes, self.change_theme, 1)
+        self.theme_option = self.create_dropdown(list(THEMES), self.change_theme, 1)
         self.theme_option.set(self.settings["theme"])
         
         # Voice settings with better styling
         self.create_section_header("Voice Settings", 2)
-        voices = ["alloy", "echo", "fable", "onyx", "nova", "shimmer"]
-        self.voice_option = self.create_dropdown(voices, self.change_voice, 3)
+        self.voice_option = self.create_dropdown(list(VOICES), self.change_voice, 3)
         self.voice_option.set(self.settings["voice"])
         
         # Voice speed with better styling
@@ -241,10 +425,17 @@ class CyberNinjaGUI(ctk.CTk):
         )
         self.prompt_editor.grid(row=20, column=0, padx=20, pady=(0, 20), sticky="ew")
         self.prompt_editor.insert("1.0", self.settings["custom_prompt"])
+        self.prompt_editor.bind("<KeyRelease>", self.update_custom_prompt)
+        self.prompt_editor.bind("<FocusOut>", self.update_custom_prompt)
         
         # Chat controls with better styling
         self.create_section_header("Chat Controls", 21)
         self.create_chat_controls(22)
+        self.refresh_recent_chats()
+        
+        # Full-text search over every saved chat
+        self.create_section_header("Search Chats", 23)
+        self.create_search_panel(24)
         
         # Save settings with better styling
         self.save_button = ctk.CTkButton(
@@ -253,7 +444,7 @@ class CyberNinjaGUI(ctk.CTk):
             font=ctk.CTkFont(size=13, weight="bold"),
             height=40
         )
-        self.save_button.grid(row=23, column=0, padx=20, pady=(20, 20), sticky="ew")
+        self.save_button.grid(row=25, column=0, padx=20, pady=(20, 20), sticky="ew")
         self.save_button.configure(command=self.save_settings)
     
     def create_section_header(self, text, row):
@@ -313,9 +504,85 @@ class CyberNinjaGUI(ctk.CTk):
             command=self.load_chat_history
         )
         load_btn.grid(row=0, column=1, padx=(5, 0), pady=5, sticky="ew")
+        
+        # Autosaved chats, most recent first
+        self.recent_menu = ctk.CTkOptionMenu(
+            control_frame,
+            values=["No saved chats"],
+            command=self.open_recent_chat,
+            font=ctk.CTkFont(size=13),
+            height=32
+        )
+        self.recent_menu.grid(row=1, column=0, padx=(0, 5), pady=5, sticky="ew")
+        
+        new_btn = ctk.CTkButton(
+            control_frame,
+            text="New Chat",
+            font=ctk.CTkFont(size=13),
+            height=32,
+            command=self.new_chat
+        )
+        new_btn.grid(row=1, column=1, padx=(5, 0), pady=5, sticky="ew")
+        
+        close_btn = ctk.CTkButton(
+            control_frame,
+            text="Close Chat",
+            font=ctk.CTkFont(size=13),
+            height=32,
+            fg_color="transparent",
+            border_width=1,
+            command=lambda: self.close_tab(self.current_tab())
+        )
+        close_btn.grid(row=2, column=0, columnspan=2, pady=5, sticky="ew")
         control_frame.grid_columnconfigure(0, weight=1)
         control_frame.grid_columnconfigure(1, weight=1)
     
+    def create_search_panel(self, row):
+        search_frame = ctk.CTkFrame(self.sidebar, fg_color="transparent")
+        search_frame.grid(row=row, column=0, padx=20, pady=(0, 10), sticky="ew")
+        search_frame.grid_columnconfigure(0, weight=1)
+        
+        self.search_entry = ctk.CTkEntry(
+            search_frame,
+            placeholder_text="Search saved chats...",
+            height=32,
+            font=ctk.CTkFont(size=13)
+        )
+        self.search_entry.grid(row=0, column=0, pady=5, sticky="ew")
+        self.search_entry.bind("<KeyRelease>", self.schedule_search)
+        
+        self.search_results = ctk.CTkFrame(search_frame, fg_color="transparent")
+        self.search_results.grid(row=1, column=0, sticky="ew")
+        self.search_results.grid_columnconfigure(0, weight=1)
+    
+    def schedule_search(self, event=None):
+        # Searches once typing pauses rather than on every key
+        if self.search_job:
+            self.after_cancel(self.search_job)
+        self.search_job = self.after(SEARCH_DELAY_MS, self.run_search)
+    
+    def run_search(self):
+        self.search_job = None
+        for widget in self.search_results.winfo_children():
+            widget.destroy()
+        query = self.search_entry.get().strip()
+        if not query:
+            return
+        hits = self.chat_log.search(query, limit=SEARCH_RESULTS)
+        if not hits:
+            ctk.CTkLabel(self.search_results, text="No matches", font=ctk.CTkFont(size=12)).grid(row=0, column=0, sticky="w")
+            return
+        for i, (session_id, seq, title, snippet) in enumerate(hits):
+            ctk.CTkButton(
+                self.search_results,
+                text=f"{title}\n{snippet}",
+                font=ctk.CTkFont(size=11),
+                anchor="w",
+                fg_color="transparent",
+                border_width=1,
+                command=lambda s=session_id, q=seq: self.open_session(s, focus_seq=q)
+            ).grid(row=i, column=0, pady=2, sticky="ew")
+    
     def create_audio_controls(self):
         # Play button with better styling
         self.play_button = ctk.CTkButton(
@@ -353,50 +620,50 @@ class CyberNinjaGUI(ctk.CTk):
         self.player_frame.grid_columnconfigure(2, weight=1)
     
     def load_settings(self):
-        default_settings = {
-            "theme": "System",
-            "voice": "alloy",
-            "voice_speed": 1.0,
-            "volume": 0.7,
-            "formality": 0.7,
-            "tech_level": 0.8,
-            "humor": 0.3,
-            "creativity": 0.6,
-            "empathy": 0.5,
-            "efficiency": 0.7,
-            "custom_prompt": "You are a cyber ninja AI assistant. Maintain the cyber ninja theme while adjusting to the personality traits."
-        }
-        
-        if self.settings_file.exists():
-            try:
-                with open(self.settings_file, 'r') as f:
-                    self.settings = json.load(f)
-            except:
-                self.settings = default_settings
-        else:
-            self.settings = default_settings
+        self.settings = SettingsStore(self.settings_file)
+        self.settings.load()
+        self.settings.subscribe(lambda key, value: self.apply_theme(), keys=["theme"])
+        self.settings.subscribe(lambda key, value: self.apply_volume(value), keys=["volume"])
+        # Rebuilt only when the prompt or a trait changes, not on every message
+        self.system_prompt = self.settings.derived(("custom_prompt",) + PERSONALITY_TRAITS, build_system_prompt)
+        self.settings.subscribe(lambda key, value: self.update_tab_prompt(), keys=("custom_prompt",) + PERSONALITY_TRAITS)
     
     def save_settings(self):
-        self.settings["custom_prompt"] = self.prompt_editor.get("1.0", "end-1c")
-        with open(self.settings_file, 'w') as f:
-            json.dump(self.settings, f)
+        # Changes are saved automatically; this writes them out right away
+        self.update_custom_prompt()
+        self.settings.save()
+    
+    def update_custom_prompt(self, event=None):
+        if self.prompt_editor:
+            self.settings.set("custom_prompt", self.prompt_editor.get("1.0", "end-1c"))
     
     def update_personality(self, key, value):
-        self.settings[key] = value
+        self.settings.set(key, value)
     
     def change_voice(self, voice):
-        self.settings["voice"] = voice
+        self.settings.set("voice", voice)
     
     def update_voice_speed(self, speed):
-        self.settings["voice_speed"] = speed
+        self.settings.set("voice_speed", speed)
     
     def update_volume(self, volume):
-        self.settings["volume"] = volume
-        pygame.mixer.music.set_volume(volume)
+        self.settings.set("volume", volume)
+    
+    def apply_volume(self, volume):
+        if self.audio is None:
+            return  # Applied when audio finishes initializing
+        self.audio.set_volume(volume)
     
     def change_theme(self, theme):
-        self.settings["theme"] = theme
-        self.apply_theme()
+        self.settings.set("theme", theme)
+    
+    def on_close(self):
+        self.settings.flush()
+        if self.tts_cache is not None:
+            self.tts_cache.close()
+        if self.audio is not None:
+            self.audio.close()
+        self.destroy()
     
     def apply_theme(self):
         theme = self.settings["theme"]
@@ -406,129 +673,564 @@ class CyberNinjaGUI(ctk.CTk):
         ctk.set_appearance_mode(theme)
     
     def save_chat_history(self):
+        # Chats are saved automatically; this exports one as a JSON file
         file_path = filedialog.asksaveasfilename(
             defaultextension=".json",
             filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
         )
         if file_path:
-            with open(file_path, 'w', encoding='utf-8') as f:
-                json.dump(self.chat_history, f, ensure_ascii=False, indent=2)
+            tab = self.current_tab()
+            if tab.session_id is not None:
+                self.chat_log.export_json(tab.session_id, file_path)
+            else:
+                with open(file_path, 'w', encoding='utf-8') as f:
+                    json.dump(list(tab.chat_history), f, ensure_ascii=False, indent=2)
     
     def load_chat_history(self):
+        # Imports a JSON export into the chat log once, then opens it from there
         file_path = filedialog.askopenfilename(
             filetypes=[("JSON files", "*.json"), ("All files", "*.*")]
         )
         if file_path:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                self.chat_history = json.load(f)
-            
-            self.chat_display.configure(state="normal")
-            self.chat_display.delete("1.0", "end")
-            for message in self.chat_history:
-                self.chat_display.insert("end", f"{message}\n")
-            self.chat_display.configure(state="disabled")
-            self.chat_display.see("end")
+            try:
+                session_id = self.chat_log.import_json(file_path)
+            except (OSError, ValueError) as e:
+                self.append_message(f"Error: Could not load chat: {e}")
+                return
+            self.open_session(session_id)
+            self.refresh_recent_chats()
+    
+    def open_session(self, session_id, focus_seq=None):
+        # A chat that is already open is switched to; otherwise it opens in the
+        # current tab if nothing has been sent there yet, or in a new one
+        tab = next((t for t in self.tabs.values() if t.session_id == session_id), None)
+        if tab is None:
+            tab = self.current_tab()
+            if not tab.is_empty():
+                tab = self.open_tab(welcome=False)
+        self.select_tab(tab)
+        tab.open_session(session_id, focus_seq)
+        self.retitle_tab(tab)
+    
+    def new_chat(self):
+        self.open_tab()
+    
+    def open_tab(self, welcome=True):
+        number = next(self.tab_numbers)
+        frame = self.tabview.add(f"{number}. New chat")
+        conversation = ConversationHistory(
+            max_tokens=self.settings.get("history_tokens", 3000),
+            summarize=lambda summary, messages: summarize_messages(self.client, summary, messages)
+        )
+        tab = ChatTab(number, frame, self.chat_log, conversation, self.get_system_prompt())
+        # Each tab has its own queue, so a long reply in one doesn't hold up the
+        # others; replies within a tab still render in the order they were sent.
+        # Every event carries the tab it belongs to.
+        tab.request_queue = RequestQueue(
+            self.process_message,
+            lambda kind, *args: self.ui_queue.post(kind, tab, *args),
+            max_workers=self.settings.get("max_concurrent_requests", 2),
+            on_change=lambda: self.ui_queue.post("queue_status")
+        )
+        self.tabs[tab.name] = tab
+        self.select_tab(tab)
+        if welcome:
+            tab.append([WELCOME])
+        return tab
+    
+    def close_tab(self, tab):
+        tab.request_queue.shutdown()
+        if self.arbiter.cancel(tab) and self.audio is not None:
+            # The closed chat was the one speaking
+            self.audio.stop()
+        tab.release()
+        del self.tabs[tab.name]
+        self.tabview.delete(tab.name)
+        if tab is self.active_tab:
+            self.active_tab = None
+        if not self.tabs:
+            self.open_tab()
+        else:
+            self.on_tab_changed()
+    
+    def current_tab(self):
+        return self.tabs[self.tabview.get()]
+    
+    def select_tab(self, tab):
+        self.tabview.set(tab.name)
+        self.on_tab_changed()
+    
+    def on_tab_changed(self):
+        tab = self.current_tab()
+        if tab is not self.active_tab:
+            if self.active_tab is not None:
+                self.active_tab.hide()
+            self.active_tab = tab
+            tab.show()
+        self.update_queue_status()
+    
+    def retitle_tab(self, tab):
+        # Tabs are named after their chat; the number keeps names unique
+        name = f"{tab.number}. {tab.title()}"
+        if name == tab.name:
+            return
+        self.tabview.rename(tab.name, name)
+        self.tabs[name] = self.tabs.pop(tab.name)
+        tab.name = name
+        if tab is self.active_tab:
+            self.tabview.set(name)
+    
+    def release_idle_tabs(self):
+        for tab in self.tabs.values():
+            if tab is not self.active_tab and tab.idle_for() > TAB_RELEASE_SECONDS:
+                tab.release()
+        self.after(TAB_CHECK_MS, self.release_idle_tabs)
+    
+    def update_tab_prompt(self):
+        # Personality changes apply to the tab they were made in
+        if self.active_tab is not None:
+            self.active_tab.system_prompt = self.get_system_prompt()
+    
+    def refresh_recent_chats(self):
+        if self.recent_menu is None:
+            return
+        self.recent_chats = {
+            f"{title} ({count})": session_id
+            for session_id, title, updated, count in self.chat_log.sessions()
+        }
+        self.recent_menu.configure(values=list(self.recent_chats) or ["No saved chats"])
+        self.recent_menu.set("Recent chats")
+    
+    def open_recent_chat(self, label):
+        session_id = self.recent_chats.get(label)
+        self.recent_menu.set("Recent chats")
+        if session_id is not None:
+            self.open_session(session_id)
+    
+    def chat_logged(self, tab):
+        # A user message was logged: the chat moves up the recent list and may
+        # have just got its title
+        self.refresh_recent_chats()
+        self.retitle_tab(tab)
     
     def append_message(self, message):
-        self.chat_display.configure(state="normal")
-        self.chat_display.insert("end", f"{message}\n")
-        self.chat_display.configure(state="disabled")
-        self.chat_display.see("end")
-        self.chat_history.append(message)
+        tab = self.current_tab()
+        if tab.append([message]):
+            self.chat_logged(tab)
+    
+    def append_messages(self, batch):
+        # One insert per tab for every message queued since the last frame;
+        # events without a tab are shown in the current one
+        runs = []
+        for tab, message in batch:
+            tab = tab or self.current_tab()
+            if runs and runs[-1][0] is tab:
+                runs[-1][1].append(message)
+            else:
+                runs.append((tab, [message]))
+        for tab, messages in runs:
+            if self.tabs.get(tab.name) is tab and tab.append(messages):
+                self.chat_logged(tab)
     
     def get_system_prompt(self):
-        base_prompt = self.prompt_editor.get("1.0", "end-1c")
-        personality_traits = "\n".join([
-            f"- {key.replace('_', ' ').title()}: {value:.1f}"
-            for key, value in self.settings.items()
-            if key in ["formality", "tech_level", "humor", "creativity", "empathy", "efficiency"]
-        ])
-        return f"{base_prompt}\n\nPersonality Traits:\n{personality_traits}"
-    
-    def send_message(self, event=None):
+        return self.system_prompt()
+    
+    def send_message(self, event=None, bypass_cache=False):
         message = self.chat_input.get().strip()
         if not message:
             return
         
         self.chat_input.delete(0, "end")
-        self.append_message(f"You: {message}")
-        
-        # Disable input while processing
-        self.chat_input.configure(state="disabled")
-        self.send_button.configure(state="disabled")
         
-        # Create a thread for API calls
-        thread = threading.Thread(target=self.process_message, args=(message,))
-        thread.start()
+        tab = self.current_tab()
+        if not self.services_ready.is_set():
+            # Still starting up; sent as soon as the client and audio are ready
+            tab.pending_messages.append((message, bypass_cache))
+            self.update_queue_status()
+            return
+        self.submit_message(tab, message, bypass_cache)
+    
+    def submit_message(self, tab, message, bypass_cache=False):
+        tab.ensure_session()
+        # The reply's first events arrive soon; poll for them at the fast rate
+        self.ui_queue.wake()
+        # Pipelines are created here so their playback order matches submission
+        # order, across every tab
+        timer = self.metrics.start()
+        pipeline = None
+        player = None
+        if self.audio is None:
+            pass  # Nothing to play speech on
+        elif self.settings.get("pipelined_tts", True):
+            pipeline = self.create_speech_pipeline(timer, tab)
+        elif self.settings.get("stream_audio", True):
+            player = self.create_pcm_player(timer, tab)
+        request = tab.request_queue.submit(
+            message,
+            tab=tab,
+            system_prompt=tab.system_prompt,
+            pipeline=pipeline,
+            player=player,
+            timer=timer,
+            bypass_cache=bypass_cache
+        )
+        timer.request_id = request.id
+        for resource in (pipeline, player):
+            if resource:
+                request.attach(resource)
     
-    def process_message(self, message):
+    def cancel_request(self, event=None):
+        self.current_tab().request_queue.cancel()
+    
+    def update_queue_status(self):
+        tab = self.current_tab()
+        if not self.services_ready.is_set():
+            waiting = len(tab.pending_messages)
+            self.queue_label.configure(
+                text=f"Connecting… {waiting} message(s) will be sent when ready" if waiting else "Connecting…"
+            )
+            return
+        parts = []
+        waiting = tab.request_queue.pending() - 1
+        if waiting > 0:
+            parts.append(f"{waiting} more message(s) queued")
+        working = sum(1 for other in self.tabs.values() if other is not tab and other.request_queue.pending())
+        if working:
+            parts.append(f"{working} other chat(s) replying")
+        self.queue_label.configure(text=" · ".join(parts))
+    
+    def process_message(self, request):
+        # Runs on a request-queue worker; every UI update goes through emit so it
+        # is held back until earlier requests have finished rendering
+        tab = request.context["tab"]
+        
+        def emit(kind, *args):
+            tab.request_queue.emit(request, kind, *args)
+        
+        message = request.message
+        pipeline = request.context["pipeline"]
+        player = request.context.get("player")
+        timer = request.context["timer"]
+        # Set once audio is on its way; that path reports the turn's timings itself
+        audio_pending = False
+        failed = False
+        emit("append", f"You: {message}")
         try:
+            # The reply to the message before this one must be in the context.
+            # Only building the context and recording the turn are serialized;
+            # speech for the previous reply carries on meanwhile.
+            if not request.wait_for_previous_turn():
+                return
+            timer.mark("queue_wait")
+            messages = tab.conversation.build_messages(request.context["system_prompt"], message)
+            streamed = self.settings.get("stream_responses", True)
+            
+            # Identical question in an identical conversation: reuse the earlier reply
+            cache_key = None
+            reply = None
+            if not request.context.get("bypass_cache"):
+                cache_key = self.response_cache.make_key("gpt-4", messages)
+                reply = self.response_cache.get(cache_key)
+            cached = reply is not None
+            
             # Get AI response
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": self.get_system_prompt()},
-                    {"role": "user", "content": message}
-                ]
-            )
-            reply = response.choices[0].message.content
+            if cached:
+                timer.mark("response_cache_hit")
+                if streamed:
+                    self.replay_cached_reply(request, reply, on_delta=pipeline.feed if pipeline else None)
+            elif streamed:
+                reply = self.stream_chat_response(request, messages, on_delta=pipeline.feed if pipeline else None)
+            else:
+                response = self.client.chat.completions.create(
+                    model="gpt-4",
+                    messages=messages
+                )
+                timer.mark("chat_total")
+                reply = response.choices[0].message.content
+            if request.cancelled.is_set():
+                return
+            if cache_key and not cached:
+                self.response_cache.put(cache_key, "gpt-4", reply)
+            tab.conversation.add_turn(message, reply)
+            request.end_turn()
             
-            # Generate speech
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            speech_file_path = self.output_dir / f"response_{timestamp}.mp3"
+            if pipeline:
+                # Sentences are already being synthesized and played in order
+                if not streamed:
+                    pipeline.feed(reply)
+                    emit("append", f"Cyber Ninja AI: {reply}")
+                pipeline.close()
+                audio_pending = True
+                return
             
-            audio_response = self.client.audio.speech.create(
-                model="tts-1",
+            if self.audio is None:
+                # No audio output: shown but not spoken, so no speech is synthesized
+                if not streamed:
+                    emit("append", f"Cyber Ninja AI: {reply}")
+                return
+            
+            # Only the parts of the reply worth hearing are synthesized
+            spoken, removed = normalize_for_speech(reply)
+            timer.count("tts_chars_removed", removed)
+            
+            if player:
+                # Raw PCM is queued on the speech channel while it downloads
+                if not streamed:
+                    emit("append", f"Cyber Ninja AI: {reply}")
+                if not spoken:
+                    return
+                # The player reports the turn once its audio has started
+                audio_pending = True
+                self.tts_cache.speech(
+                    self.client,
+                    spoken,
+                    voice=self.settings["voice"],
+                    speed=self.settings["voice_speed"],
+                    response_format="pcm",
+                    cancelled=request.cancelled,
+                    timer=timer,
+                    on_chunk=player.feed,
+                    attach=request.attach
+                )
+                return
+            
+            # Generate speech (or reuse an identical earlier clip)
+            audio = self.tts_cache.speech(
+                self.client,
+                spoken,
                 voice=self.settings["voice"],
                 speed=self.settings["voice_speed"],
-                input=reply
-            )
-            
-            with open(speech_file_path, 'wb') as f:
-                for chunk in audio_response.iter_bytes():
-                    f.write(chunk)
+                cancelled=request.cancelled,
+                timer=timer,
+                attach=request.attach
+            ) if spoken else None
             
-            self.append_message(f"Cyber Ninja AI: {reply}")
-            self.current_audio = str(speech_file_path)
+            if not streamed:
+                emit("append", f"Cyber Ninja AI: {reply}")
             
-            # Play audio in main thread
-            self.after(0, self.play_audio)
+            # Play audio in main thread, straight from memory
+            if audio:
+                emit("play", audio, timer)
+                audio_pending = True
             
         except Exception as e:
-            self.append_message(f"Error: {str(e)}")
+            failed = True
+            if pipeline:
+                pipeline.cancel()
+            if not request.cancelled.is_set():
+                emit("append", f"Error: {str(e)}")
         
         finally:
-            # Re-enable input
-            self.after(0, lambda: self.chat_input.configure(state="normal"))
-            self.after(0, lambda: self.send_button.configure(state="normal"))
-            self.after(0, lambda: self.chat_input.focus())
-    
-    def play_audio(self):
-        if self.current_audio and os.path.exists(self.current_audio):
-            pygame.mixer.music.load(self.current_audio)
-            pygame.mixer.music.set_volume(self.settings["volume"])
-            pygame.mixer.music.play()
-            self.is_playing = True
-            self.play_button.configure(text="⏸")
+            if request.cancelled.is_set():
+                emit("append", f"Cyber Ninja AI: Request #{request.id} cancelled.")
+            if not audio_pending or failed:
+                status = "cancelled" if request.cancelled.is_set() else "error" if failed else "ok"
+                self.finish_turn(timer, status)
+            if player:
+                # Only once the turn is reported, so a failure isn't recorded
+                # as a cancellation by the player
+                if failed:
+                    player.cancel()
+                else:
+                    # Hands over the rest of the audio, or lets the next
+                    # reply's audio start if this one never played
+                    player.finish()
+            # Summarize turns that slid out of the context window off the critical path
+            tab.conversation.compact()
+    
+    def create_speech_pipeline(self, timer, tab=None):
+        # Each reply waits for the previous one to finish speaking
+        pipeline = SpeechPipeline(
+            self.client,
+            self.queue_speech_clip,
+            voice=self.settings["voice"],
+            speed=self.settings["voice_speed"],
+            cache=self.tts_cache,
+            after=self.arbiter.last(),
+            timer=timer,
+            on_finished=self.finish_speech
+        )
+        self.arbiter.add(pipeline, tab)
+        return pipeline
+    
+    def create_pcm_player(self, timer, tab=None):
+        from pcm_stream import PCMStreamPlayer
+        # Streams a whole reply's speech; queued behind any audio still playing
+        player = PCMStreamPlayer(
+            self.audio,
+            after=self.arbiter.last(),
+            timer=timer,
+            on_start=lambda: self.ui_queue.post("playing"),
+            on_finished=lambda player: self.finish_turn(
+                timer, "cancelled" if player.cancelled.is_set() else "ok"
+            )
+        )
+        self.arbiter.add(player, tab)
+        return player
+    
+    def queue_speech_clip(self, audio, pipeline):
+        # Runs on the pipeline's player thread
+        self.audio.queue_clip(
+            audio,
+            cancelled=pipeline.cancelled,
+            timer=pipeline.timer,
+            on_start=lambda: self.ui_queue.post("playing")
+        )
+    
+    def finish_speech(self, pipeline):
+        # Runs on the pipeline's player thread once its last clip is queued. The
+        # turn is timed to the start of its audio; the pipeline then stays
+        # current until the audio has played, so Stop knows what is being heard.
+        self.audio.drain(pipeline.cancelled)
+        self.finish_turn(pipeline.timer, "cancelled" if pipeline.cancelled.is_set() else "ok")
+        self.audio.wait_idle(pipeline.cancelled)
+    
+    def finish_turn(self, timer, status="ok"):
+        # May be called from any thread; only the first call per turn counts
+        record = self.metrics.finish(timer, status)
+        if record:
+            self.ui_queue.post("metrics", record)
+    
+    def update_status_bar(self, record):
+        timings = record["timings_ms"]
+        parts = [f"{label} {timings[name]:.0f} ms" for name, label in STATUS_STAGES if name in timings]
+        ttft = self.metrics.percentiles("chat_ttft")
+        if ttft:
+            parts.append(f"TTFT p50/p95/p99 {ttft['p50']:.0f}/{ttft['p95']:.0f}/{ttft['p99']:.0f} ms")
+        removed = record.get("counts", {}).get("tts_chars_removed")
+        if removed:
+            parts.append(f"{removed} chars not spoken")
+        parts.append(f"UI lag {self.ui_queue.stats()['last_latency_ms']:.0f} ms")
+        self.status_label.configure(text=f"#{record['request_id']} {record['status']} · " + " · ".join(parts))
+    
+    def show_playing(self):
+        self.is_playing = True
+        self.play_button.configure(text="⏸")
+    
+    def poll_audio(self):
+        # The play button goes back to ▶ once the audio runs out
+        if self.audio is None:
+            return
+        if self.is_playing and not self.audio.state()["busy"]:
+            self.is_playing = False
+            self.play_button.configure(text="▶")
+        self.after(AUDIO_POLL_MS, self.poll_audio)
+    
+    def stream_chat_response(self, request, messages, on_delta=None):
+        # Runs on the worker thread; tokens reach the display through the UI queue
+        timer = request.context["timer"]
+        request_queue = request.context["tab"].request_queue
+        stream = self.client.chat.completions.create(
+            model="gpt-4",
+            messages=messages,
+            stream=True
+        )
+        # Cancelling the request closes the stream and unblocks the read below
+        request.attach(stream)
+        request_queue.emit(request, "stream_begin", timer)
+        
+        parts = []
+        try:
+            for chunk in stream:
+                if request.cancelled.is_set():
+                    break
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    if not parts:
+                        timer.mark("chat_ttft")
+                    parts.append(delta)
+                    request_queue.emit(request, "stream_text", delta)
+                    if on_delta:
+                        on_delta(delta)
+        finally:
+            timer.mark("chat_total")
+            reply = "".join(parts)
+            request_queue.emit(request, "stream_end", reply)
+        return reply
+    
+    def replay_cached_reply(self, request, reply, on_delta=None):
+        # A cached reply goes through the same display and speech path as a live stream
+        timer = request.context["timer"]
+        request_queue = request.context["tab"].request_queue
+        request_queue.emit(request, "stream_begin", timer)
+        timer.mark("chat_ttft")
+        request_queue.emit(request, "stream_text", reply)
+        if on_delta:
+            on_delta(reply)
+        timer.mark("chat_total")
+        request_queue.emit(request, "stream_end", reply)
+    
+    def begin_stream(self, tab, timer):
+        # Time to first visible token is measured from when the message was sent
+        tab.stream_timer = timer
+        tab.last_ttft = None
+        tab.begin_partial("Cyber Ninja AI: ")
+    
+    def write_stream_text(self, batch):
+        # Everything that arrived since the last frame goes in as one insert per tab
+        texts = {}
+        for tab, delta in batch:
+            texts.setdefault(tab, []).append(delta)
+        for tab, deltas in texts.items():
+            if tab.last_ttft is None:
+                # Counted as visible even for a background tab: it is in the log
+                tab.stream_timer.mark("visible_ttft")
+                tab.last_ttft = tab.stream_timer.marks["visible_ttft"]
+            tab.write_partial("".join(deltas))
+    
+    def end_stream(self, tab, reply):
+        tab.end_partial(f"Cyber Ninja AI: {reply}")
+    
+    def play_audio(self, tab, audio=None, timer=None):
+        # current_audio holds the tab's last reply's encoded bytes so it can be replayed
+        if audio:
+            tab.current_audio = audio
+        if not tab.current_audio or self.audio is None:
+            if timer:
+                self.finish_turn(timer)
+            return
+        # Loading happens off the Tk thread when the audio process is on; the
+        # turn is reported once playback has started
+        started = self.audio.play_music(
+            tab.current_audio,
+            timer=timer,
+            on_start=(lambda: self.finish_turn(timer)) if timer else None
+        )
+        if not started:
+            # The audio process has stopped for good
+            if timer:
+                self.finish_turn(timer, "error")
+            return
+        self.is_playing = True
+        self.play_button.configure(text="⏸")
     
     def toggle_audio(self):
-        if not self.current_audio:
+        if self.audio is None:
+            return
+        if not self.current_tab().current_audio and not self.arbiter.active():
             return
             
         if self.is_playing:
-            pygame.mixer.music.pause()
+            self.audio.pause()
             self.play_button.configure(text="▶")
         else:
-            pygame.mixer.music.unpause()
+            self.audio.resume()
             self.play_button.configure(text="⏸")
         self.is_playing = not self.is_playing
     
     def stop_audio(self):
-        if self.current_audio:
-            pygame.mixer.music.stop()
-            self.is_playing = False
-            self.play_button.configure(text="▶")
+        # Skips the reply being heard; later replies, in any tab, still speak
+        self.arbiter.cancel_playing()
+        if self.audio is None:
+            return  # Audio isn't initialized yet, so nothing is playing
+        self.audio.stop()
+        self.is_playing = False
+        self.play_button.configure(text="▶")
 
 if __name__ == "__main__":
+    # The audio process is started by re-running this executable in frozen builds
+    multiprocessing.freeze_support()
     app = CyberNinjaGUI()
     app.mainloop() 
\ No newline at end of file
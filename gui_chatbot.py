@@ -1,11 +1,15 @@
 import customtkinter as ctk
-from openai import OpenAI
-import os
+from openai_client import create_client, warm_up
+import io
 from dotenv import load_dotenv
 from pathlib import Path
 import pygame
 import json
-from datetime import datetime
+import threading
+from tts_cache import TTSCache
+from speech_text import normalize_for_speech
+from response_cache import ResponseCache
+from conversation import ConversationHistory, summarize_messages
 
 class CyberNinjaGUI(ctk.CTk):
     def __init__(self):
@@ -13,8 +17,14 @@ class CyberNinjaGUI(ctk.CTk):
         
         # Initialize OpenAI and audio
         load_dotenv()
-        self.client = OpenAI()
+        self.client = create_client()
+        warm_up(self.client)
         self.setup_audio_directory()
+        self.tts_cache = TTSCache(self.output_dir / "cache")
+        self.response_cache = ResponseCache(self.output_dir / "cache" / "responses.db")
+        self.conversation = ConversationHistory(
+            summarize=lambda summary, messages: summarize_messages(self.client, summary, messages)
+        )
         pygame.mixer.init()
         
         # Load or create personality settings
@@ -160,40 +170,40 @@ Adjust your responses according to these traits while maintaining a cyber ninja
         self.append_message(f"You: {message}")
         
         try:
-            # Get AI response
-            response = self.client.chat.completions.create(
-                model="gpt-4",
-                messages=[
-                    {"role": "system", "content": self.get_system_prompt()},
-                    {"role": "user", "content": message}
-                ]
-            )
-            reply = response.choices[0].message.content
+            # Get AI response, reusing the reply to an identical earlier exchange
+            messages = self.conversation.build_messages(self.get_system_prompt(), message)
+            cache_key = self.response_cache.make_key("gpt-4", messages)
+            reply = self.response_cache.get(cache_key)
+            if reply is None:
+                response = self.client.chat.completions.create(
+                    model="gpt-4",
+                    messages=messages
+                )
+                reply = response.choices[0].message.content
+                self.response_cache.put(cache_key, "gpt-4", reply)
+            self.conversation.add_turn(message, reply)
             
-            # Generate speech
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            speech_file_path = self.output_dir / f"response_{timestamp}.mp3"
-            
-            audio_response = self.client.audio.speech.create(
-                model="tts-1",
-                voice=self.personality["voice"],
-                input=reply
-            )
-            
-            with open(speech_file_path, 'wb') as f:
-                for chunk in audio_response.iter_bytes():
-                    f.write(chunk)
+            # Generate speech for the readable parts (or reuse an identical earlier clip)
+            spoken, _ = normalize_for_speech(reply)
+            audio = self.tts_cache.speech(
+                self.client,
+                spoken,
+                voice=self.personality["voice"]
+            ) if spoken else None
             
             self.append_message(f"Cyber Ninja AI: {reply}")
-            self.current_audio = str(speech_file_path)
+            self.current_audio = audio
             self.play_audio()
+            # The summary request runs off the Tk thread so the window stays responsive
+            threading.Thread(target=self.conversation.compact, name="compact", daemon=True).start()
             
         except Exception as e:
             self.append_message(f"Error: {str(e)}")
     
     def play_audio(self):
-        if self.current_audio and os.path.exists(self.current_audio):
-            pygame.mixer.music.load(self.current_audio)
+        if self.current_audio:
+            # Played from memory; the clip only touches disk through the TTS cache
+            pygame.mixer.music.load(io.BytesIO(self.current_audio), "mp3")
             pygame.mixer.music.play()
             self.is_playing = True
             self.play_button.configure(text="⏸")
@@ -218,4 +228,5 @@ Adjust your responses according to these traits while maintaining a cyber ninja
 
 if __name__ == "__main__":
     app = CyberNinjaGUI()
-    app.mainloop() 
\ No newline at end of file
+    app.mainloop()
+    app.tts_cache.close() 
\ No newline at end of file
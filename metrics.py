@@ -0,0 +1,138 @@
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from pathlib import Path
+
+
+class TurnTimer:
+    def __init__(self, request_id=None):
+        self.request_id = request_id
+        self.timestamp = time.time()
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        # Both dicts hold seconds: marks are offsets from the start of the turn
+        # (first occurrence wins), stages are summed durations
+        self.marks = {}
+        self.stages = {}
+        # Overlapping stages: how many are running and since when, per name
+        self.running = {}
+        self.running_since = {}
+        # Non-time quantities worth logging with the turn, e.g. characters
+        self.counts = {}
+        self.finished = False
+
+    def mark(self, name):
+        offset = time.monotonic() - self.started
+        with self.lock:
+            self.marks.setdefault(name, offset)
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name, amount):
+        with self.lock:
+            self.counts[name] = self.counts.get(name, 0) + amount
+
+    @contextmanager
+    def stage(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - start)
+
+    @contextmanager
+    def overlapping(self, name):
+        # Like stage(), for work run by parallel workers: the stage is the wall
+        # time during which at least one was running, so it never exceeds the turn
+        with self.lock:
+            if not self.running.get(name):
+                self.running_since[name] = time.monotonic()
+            self.running[name] = self.running.get(name, 0) + 1
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.running[name] -= 1
+                if not self.running[name]:
+                    elapsed = time.monotonic() - self.running_since.pop(name)
+                    self.stages[name] = self.stages.get(name, 0.0) + elapsed
+
+    def record(self, status="ok"):
+        with self.lock:
+            timings = {**self.marks, **self.stages}
+            counts = dict(self.counts)
+        timings["total"] = time.monotonic() - self.started
+        record = {
+            "request_id": self.request_id,
+            "timestamp": self.timestamp,
+            "status": status,
+            "timings_ms": {name: round(seconds * 1000, 2) for name, seconds in timings.items()}
+        }
+        if counts:
+            record["counts"] = counts
+        return record
+
+
+@contextmanager
+def timed(timer, name, overlapping=False):
+    # Lets call sites instrument a stage whether or not they were given a timer
+    if timer is None:
+        yield
+    else:
+        with (timer.overlapping(name) if overlapping else timer.stage(name)):
+            yield
+
+
+class LatencyMetrics:
+    def __init__(self, jsonl_path=None, window=1000):
+        self.jsonl_path = Path(jsonl_path) if jsonl_path else None
+        self.lock = threading.Lock()
+        # Rolling window of samples per timing name, in milliseconds
+        self.samples = defaultdict(lambda: deque(maxlen=window))
+        self.last = None
+
+    def start(self, request_id=None):
+        return TurnTimer(request_id)
+
+    def finish(self, timer, status="ok"):
+        with timer.lock:
+            if timer.finished:
+                return None
+            timer.finished = True
+        record = timer.record(status)
+        with self.lock:
+            for name, ms in record["timings_ms"].items():
+                self.samples[name].append(ms)
+            self.last = record
+        self.write(record)
+        return record
+
+    def write(self, record):
+        # Appends one record to the JSONL log; also used for the startup report
+        if not self.jsonl_path:
+            return
+        with self.lock:
+            try:
+                with open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                    f.write(json.dumps(record) + "\n")
+            except OSError as e:
+                print(f"Warning: Could not write metrics: {e}")
+
+    def percentiles(self, name, points=(50, 95, 99)):
+        with self.lock:
+            values = sorted(self.samples.get(name, ()))
+        if not values:
+            return None
+        return {
+            f"p{p}": values[min(len(values) - 1, int(round(p / 100 * (len(values) - 1))))]
+            for p in points
+        }
+
+    def summary(self):
+        with self.lock:
+            names = list(self.samples)
+        return {name: self.percentiles(name) for name in names}
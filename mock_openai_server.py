@@ -0,0 +1,262 @@
+import argparse
+import io
+import json
+import sys
+import threading
+import time
+import wave
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Stand-in for the OpenAI endpoints this project uses, for benchmarks and local
+# testing without API costs. Point a client at it with
+# OpenAI(base_url=server.base_url, api_key="mock").
+
+REPLY_TEXT = (
+    "Cyber ninja protocols engaged. Scanning the request across the neural grid. "
+    "The answer is assembled from shadow caches and delivered with precision. "
+    "Stay vigilant, user, and keep your keys rotated. "
+)
+
+
+class MockConfig:
+    def __init__(self, latency_ms=200, token_rate=50.0, reply_tokens=120,
+                 audio_latency_ms=150, audio_bytes=48000, audio_rate=200000, audio_bytes_per_char=0,
+                 fail_first=0, fail_status=503):
+        self.latency_ms = latency_ms          # delay before the first chat token
+        self.token_rate = token_rate          # chat tokens per second after that
+        self.reply_tokens = reply_tokens      # words per reply
+        self.audio_latency_ms = audio_latency_ms
+        self.audio_bytes = audio_bytes        # speech payload size
+        self.audio_rate = audio_rate          # speech bytes per second
+        self.audio_bytes_per_char = audio_bytes_per_char  # grows the payload for long input
+        self.fail_first = fail_first          # chat/speech requests answered with fail_status first
+        self.fail_status = fail_status
+
+    def to_dict(self):
+        return dict(self.__dict__)
+
+
+def reply_tokens(count):
+    words = REPLY_TEXT.split(" ")
+    return [words[i % len(words)] + " " for i in range(count) if words[i % len(words)]]
+
+
+def audio_payload(size, response_format):
+    if response_format == "wav":
+        buffer = io.BytesIO()
+        with wave.open(buffer, "wb") as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(24000)
+            wav.writeframes(b"\0" * max(0, size - 44))
+        return buffer.getvalue()
+    return b"\0" * size
+
+
+class MockOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    @property
+    def config(self):
+        return self.server.config
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        self.server.count(self.path)
+        if self.server.take_failure():
+            self.send_json(self.config.fail_status, {"error": {"message": "Injected failure"}},
+                           {"retry-after-ms": "10"})
+        elif self.path.endswith("/chat/completions"):
+            self.chat_completions(body)
+        elif self.path.endswith("/audio/speech"):
+            self.speech(body)
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+
+    def do_GET(self):
+        # Cheap endpoint for connection warm-up
+        self.server.count(self.path)
+        if self.path.endswith("/models"):
+            self.send_json(200, {"object": "list", "data": [{"id": "gpt-4", "object": "model"}]})
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown endpoint {self.path}"}})
+
+    def rate_limit_headers(self):
+        self.send_header("x-ratelimit-limit-requests", "10000")
+        self.send_header("x-ratelimit-remaining-requests", "9999")
+        self.send_header("x-ratelimit-reset-requests", "6ms")
+        self.send_header("x-ratelimit-limit-tokens", "1000000")
+        self.send_header("x-ratelimit-remaining-tokens", "999000")
+        self.send_header("x-ratelimit-reset-tokens", "60ms")
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.rate_limit_headers()
+        self.end_headers()
+        self.wfile.write(data)
+
+    def start_chunked(self, content_type):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        self.rate_limit_headers()
+        self.end_headers()
+
+    def write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+    def chat_completions(self, body):
+        model = body.get("model", "gpt-4")
+        tokens = reply_tokens(self.config.reply_tokens)
+        delay = 1.0 / self.config.token_rate if self.config.token_rate else 0
+        time.sleep(self.config.latency_ms / 1000)
+
+        if not body.get("stream"):
+            time.sleep(delay * len(tokens))
+            prompt_tokens = sum(len(str(m.get("content", ""))) // 4 for m in body.get("messages", []))
+            self.send_json(200, {
+                "id": "chatcmpl-mock",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": "stop"
+                }],
+                "usage": {
+                    "prompt_tokens": prompt_tokens,
+                    "completion_tokens": len(tokens),
+                    "total_tokens": prompt_tokens + len(tokens)
+                }
+            })
+            return
+
+        self.start_chunked("text/event-stream")
+        try:
+            for i, token in enumerate(tokens):
+                if i:
+                    time.sleep(delay)
+                delta = {"content": token}
+                if i == 0:
+                    delta["role"] = "assistant"
+                self.write_event(model, delta, None)
+            self.write_event(model, {}, "stop")
+            self.write_chunk(b"data: [DONE]\n\n")
+            self.end_chunked()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client cancelled the stream
+            self.close_connection = True
+
+    def write_event(self, model, delta, finish_reason):
+        chunk = {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+        self.write_chunk(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+
+    def speech(self, body):
+        size = max(self.config.audio_bytes, len(body.get("input", "")) * self.config.audio_bytes_per_char)
+        payload = audio_payload(size, body.get("response_format", "mp3"))
+        time.sleep(self.config.audio_latency_ms / 1000)
+        content_type = {"wav": "audio/wav", "pcm": "audio/pcm"}.get(body.get("response_format"), "audio/mpeg")
+        self.start_chunked(content_type)
+        chunk_size = 4096
+        delay = chunk_size / self.config.audio_rate if self.config.audio_rate else 0
+        try:
+            for start in range(0, len(payload), chunk_size):
+                if start:
+                    time.sleep(delay)
+                self.write_chunk(payload[start:start + chunk_size])
+            self.end_chunked()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+
+class MockOpenAIServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, config=None, host="127.0.0.1", port=0):
+        super().__init__((host, port), MockOpenAIHandler)
+        self.config = config or MockConfig()
+        self.counts = {}
+        self.counts_lock = threading.Lock()
+        self.failures_left = self.config.fail_first
+        self.thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def handle_error(self, request, client_address):
+        # Clients dropping idle keep-alive connections is normal, not an error
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        super().handle_error(request, client_address)
+
+    def count(self, path):
+        with self.counts_lock:
+            self.counts[path] = self.counts.get(path, 0) + 1
+
+    def take_failure(self):
+        with self.counts_lock:
+            if self.failures_left <= 0:
+                return False
+            self.failures_left -= 1
+            return True
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the OpenAI chat and speech APIs")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=200)
+    parser.add_argument("--token-rate", type=float, default=50.0)
+    parser.add_argument("--reply-tokens", type=int, default=120)
+    parser.add_argument("--audio-latency-ms", type=float, default=150)
+    parser.add_argument("--audio-bytes", type=int, default=48000)
+    parser.add_argument("--audio-rate", type=float, default=200000)
+    parser.add_argument("--audio-bytes-per-char", type=int, default=0)
+    parser.add_argument("--fail-first", type=int, default=0, help="Fail this many chat/speech requests first")
+    parser.add_argument("--fail-status", type=int, default=503)
+    args = parser.parse_args()
+
+    config = MockConfig(args.latency_ms, args.token_rate, args.reply_tokens,
+                        args.audio_latency_ms, args.audio_bytes, args.audio_rate, args.audio_bytes_per_char,
+                        args.fail_first, args.fail_status)
+    server = MockOpenAIServer(config, port=args.port)
+    print(f"Mock OpenAI server listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
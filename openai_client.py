@@ -0,0 +1,107 @@
+import os
+import threading
+import urllib.request
+
+try:
+    # Newer openai releases are built on the httpx2 fork rather than httpx
+    import httpx2 as httpx
+except ImportError:
+    import httpx
+from openai import OpenAI
+
+from rate_limiter import RateLimitedTransport, get_rate_limiter
+
+# Idle connections are kept long enough to survive the user typing a message,
+# so the first request after a pause doesn't pay for a new TLS handshake
+POOL_LIMITS = httpx.Limits(max_connections=20, max_keepalive_connections=10, keepalive_expiry=120.0)
+# Reads stay generous for long streamed replies; connecting shouldn't take long
+DEFAULT_TIMEOUT = httpx.Timeout(60.0, connect=5.0, pool=10.0)
+# Concurrent warm-up requests, one per connection: chat and TTS run side by side
+WARM_UP_CONNECTIONS = 2
+
+
+def http2_enabled():
+    # HTTP/2 needs the optional h2 package (pip install "httpx[http2]");
+    # CYBER_NINJA_HTTP2=0 turns it off
+    if os.getenv("CYBER_NINJA_HTTP2", "1") == "0":
+        return False
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def rate_limited_transport(proxy=None):
+    transport = httpx.HTTPTransport(limits=POOL_LIMITS, http2=http2_enabled(), proxy=proxy)
+    return RateLimitedTransport(get_rate_limiter(), transport)
+
+
+def proxy_mounts():
+    # httpx only reads HTTP(S)_PROXY, ALL_PROXY and NO_PROXY when it builds its
+    # own transport, so the same routes are mounted here, each rate limited.
+    # A None mount sends that host straight to the default transport.
+    proxies = urllib.request.getproxies()
+    no_proxy = [host.strip() for host in proxies.get("no", "").split(",") if host.strip()]
+    if "*" in no_proxy:
+        return {}
+    mounts = {}
+    for scheme in ("http", "https"):
+        proxy = proxies.get(scheme) or proxies.get("all")
+        if proxy:
+            mounts[f"{scheme}://"] = rate_limited_transport(proxy if "://" in proxy else f"http://{proxy}")
+    if not mounts:
+        return {}
+    for host in no_proxy:
+        if "://" in host:
+            mounts[host] = None
+        elif host.lower() == "localhost" or host.replace(".", "").isdigit():
+            mounts[f"all://{host}"] = None
+        else:
+            # example.com also covers its subdomains
+            mounts[f"all://*{host}"] = None
+    return mounts
+
+
+_shared_http_client = None
+_shared_lock = threading.Lock()
+
+
+def get_http_client():
+    # One connection pool per process: every OpenAI client, including ones
+    # rebuilt after the API key changes, reuses the same warm connections
+    global _shared_http_client
+    with _shared_lock:
+        if _shared_http_client is None:
+            _shared_http_client = httpx.Client(
+                transport=rate_limited_transport(),
+                mounts=proxy_mounts(),
+                timeout=DEFAULT_TIMEOUT
+            )
+        return _shared_http_client
+
+
+def create_client(**kwargs):
+    # Every frontend builds its OpenAI client here so all chat and TTS traffic
+    # shares the process-wide connection pool and rate limiter. The limiter's
+    # transport owns retries for chat and TTS calls (the same statuses and
+    # errors the SDK would retry), so the SDK's own retry loop is turned off;
+    # other endpoints, only used for warm-up, aren't retried.
+    kwargs.setdefault("timeout", DEFAULT_TIMEOUT)
+    return OpenAI(http_client=get_http_client(), max_retries=0, **kwargs)
+
+
+def warm_up(client, connections=WARM_UP_CONNECTIONS):
+    # Opens connections to the API host in the background (DNS, TCP and TLS)
+    # while the user is still typing. /models is free and not rate limited;
+    # failures are ignored since the real request will report them.
+    def fetch():
+        try:
+            client.with_options(timeout=10.0).models.list()
+        except Exception:
+            pass
+
+    threads = [threading.Thread(target=fetch, name="warm-up", daemon=True) for _ in range(connections)]
+    for thread in threads:
+        thread.start()
+    return threads
@@ -0,0 +1,103 @@
+import queue
+import threading
+
+# The speech API's "pcm" format: 24 kHz, 16-bit signed little-endian, mono
+PCM_SAMPLE_RATE = 24000
+PCM_SAMPLE_WIDTH = 2
+PCM_CHANNELS = 1
+PCM_FRAME_BYTES = PCM_SAMPLE_WIDTH * PCM_CHANNELS
+
+
+def init_mixer():
+    # Running the mixer at the TTS format lets PCM chunks be queued as they
+    # arrive, without resampling. allowedchanges=0 makes SDL convert to the
+    # device format itself instead of handing us a different mixer format.
+    import pygame
+    pygame.mixer.init(frequency=PCM_SAMPLE_RATE, size=-16, channels=PCM_CHANNELS, allowedchanges=0)
+
+
+class PCMStreamPlayer:
+    def __init__(self, engine, chunk_ms=200, after=None, timer=None, on_start=None, on_finished=None):
+        # feed() is called from the download thread with raw PCM as it arrives;
+        # every chunk_ms of audio becomes a clip that the player thread queues
+        # on the audio engine
+        self.engine = engine
+        self.chunk_bytes = int(PCM_SAMPLE_RATE * chunk_ms / 1000) * PCM_FRAME_BYTES
+        # Playback starts only once the previous reply's audio is done
+        self.after = after
+        self.timer = timer
+        self.on_start = on_start
+        # on_finished(player) runs on the player thread once the audio has
+        # started (or never will), e.g. to report the turn's timings
+        self.on_finished = on_finished
+        self.pending = bytearray()
+        # Whole chunks waiting for their turn to play; None marks the end. The
+        # download only ever adds to it, so it keeps reading the response
+        # however long the previous reply takes to play.
+        self.chunks = queue.Queue()
+        self.finished = False
+        self.cancelled = threading.Event()
+        self.done = threading.Event()
+        self.player = threading.Thread(target=self._play_in_order, name="pcm-player", daemon=True)
+        self.player.start()
+
+    def feed(self, data):
+        if self.cancelled.is_set():
+            return
+        self.pending += data
+        while len(self.pending) >= self.chunk_bytes:
+            self.chunks.put(bytes(self.pending[:self.chunk_bytes]))
+            del self.pending[:self.chunk_bytes]
+
+    def finish(self):
+        # The download is over: queues whatever is left, dropping a trailing
+        # partial frame. Returns straight away; the player is done once the
+        # audio has played.
+        if self.finished:
+            return
+        self.finished = True
+        usable = len(self.pending) - len(self.pending) % PCM_FRAME_BYTES
+        if usable and not self.cancelled.is_set():
+            self.chunks.put(bytes(self.pending[:usable]))
+        self.pending.clear()
+        self.chunks.put(None)
+
+    def cancel(self):
+        self.cancelled.set()
+        # Wakes the player thread if it is waiting for the next chunk
+        self.chunks.put(None)
+        self.done.set()
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def _play_in_order(self):
+        try:
+            self._play_chunks()
+        except Exception as e:
+            print(f"Error playing audio: {e}")
+            self.cancelled.set()
+        finally:
+            try:
+                if self.on_finished:
+                    self.on_finished(self)
+                if not self.cancelled.is_set():
+                    self.engine.wait_idle(self.cancelled)
+            finally:
+                self.done.set()
+
+    def _play_chunks(self):
+        if self.after is not None:
+            while not self.after.wait(0.05) and not self.cancelled.is_set():
+                pass
+            self.after = None
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None or self.cancelled.is_set():
+                break
+            # The engine waits while earlier chunks are still queued, which
+            # paces this thread to playback; the download is unaffected
+            self.engine.queue_clip(chunk, "pcm", cancelled=self.cancelled, timer=self.timer,
+                                   on_start=self.on_start)
+        # The turn's timings include when its audio actually started
+        self.engine.drain(self.cancelled)
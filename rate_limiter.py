@@ -0,0 +1,235 @@
+import json
+import random
+import re
+import threading
+import time
+
+try:
+    # Newer openai releases are built on the httpx2 fork rather than httpx
+    import httpx2 as httpx
+except ImportError:
+    import httpx
+
+# Starting budgets per minute; they are replaced by the limits the API reports
+# in its x-ratelimit-* response headers. TTS "tokens" are input characters.
+DEFAULT_LIMITS = {
+    "chat": {"requests": 500, "tokens": 30000},
+    "tts": {"requests": 50, "tokens": 100000},
+}
+# Completion tokens reserved per chat request when the body doesn't set max_tokens
+DEFAULT_COMPLETION_TOKENS = 256
+# The statuses the OpenAI SDK retries itself, whose retry loop the transport replaces
+RETRY_STATUSES = {408, 409, 429, 500, 502, 503, 504}
+# Failures before any of the response arrived, including a read timeout while
+# waiting for its headers
+RETRY_ERRORS = (httpx.TimeoutException, httpx.ConnectError, httpx.RemoteProtocolError)
+
+DURATION_PART = re.compile(r'(\d+(?:\.\d+)?)(ms|h|m|s)')
+DURATION_UNITS = {"h": 3600, "m": 60, "s": 1, "ms": 0.001}
+
+
+def parse_duration(value):
+    # Reset headers look like "1s", "6m0s" or "250ms"
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parts = DURATION_PART.findall(value)
+    if not parts:
+        return None
+    return sum(float(amount) * DURATION_UNITS[unit] for amount, unit in parts)
+
+
+class TokenBucket:
+    def __init__(self, per_minute):
+        self.capacity = float(per_minute)
+        self.available = float(per_minute)
+        self.updated = time.monotonic()
+
+    @property
+    def rate(self):
+        return self.capacity / 60.0
+
+    def refill(self, now):
+        self.available = min(self.capacity, self.available + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        # Requests larger than the whole bucket go through once it is full
+        amount = min(amount, self.capacity)
+        if self.available >= amount:
+            return 0.0
+        return (amount - self.available) / self.rate if self.rate else 1.0
+
+    def sync(self, limit, remaining, now):
+        if limit:
+            self.capacity = float(limit)
+        if remaining is not None:
+            # The server's count is authoritative both ways: it can also report
+            # more headroom than the local estimate, e.g. after a quiet spell
+            self.available = min(self.capacity, float(remaining))
+        self.updated = now
+
+
+class RateLimiter:
+    def __init__(self, limits=None, max_retries=5, base_delay=0.5, max_delay=30.0):
+        limits = limits or DEFAULT_LIMITS
+        self.buckets = {
+            kind: {"requests": TokenBucket(limit["requests"]), "tokens": TokenBucket(limit["tokens"])}
+            for kind, limit in limits.items()
+        }
+        self.paused_until = {kind: 0.0 for kind in limits}
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.lock = threading.Lock()
+        self.counters = {"requests": 0, "throttled": 0, "throttled_seconds": 0.0, "retries": 0, "rate_limited": 0}
+
+    @staticmethod
+    def kind_for(url):
+        path = url.path
+        if path.endswith("/chat/completions"):
+            return "chat"
+        if path.endswith("/audio/speech"):
+            return "tts"
+        return None
+
+    def acquire(self, kind, tokens):
+        waited = 0.0
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                requests_bucket = self.buckets[kind]["requests"]
+                tokens_bucket = self.buckets[kind]["tokens"]
+                requests_bucket.refill(now)
+                tokens_bucket.refill(now)
+                delay = max(
+                    self.paused_until[kind] - now,
+                    requests_bucket.wait_time(1),
+                    tokens_bucket.wait_time(tokens)
+                )
+                if delay <= 0:
+                    requests_bucket.available -= 1
+                    tokens_bucket.available -= min(tokens, tokens_bucket.capacity)
+                    self.counters["requests"] += 1
+                    if waited:
+                        self.counters["throttled"] += 1
+                        self.counters["throttled_seconds"] += waited
+                    return waited
+            delay = min(delay, self.max_delay)
+            time.sleep(delay)
+            waited += delay
+
+    def observe(self, kind, headers):
+        # Adapt the buckets to what the server says is left this minute
+        limit_requests = headers.get("x-ratelimit-limit-requests")
+        limit_tokens = headers.get("x-ratelimit-limit-tokens")
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        if not (limit_requests or limit_tokens or remaining_requests or remaining_tokens):
+            return
+        with self.lock:
+            now = time.monotonic()
+            self.buckets[kind]["requests"].sync(_number(limit_requests), _number(remaining_requests), now)
+            self.buckets[kind]["tokens"].sync(_number(limit_tokens), _number(remaining_tokens), now)
+
+    def backoff(self, kind, attempt, headers):
+        # Honor Retry-After when given, otherwise jittered exponential backoff.
+        # The pause applies to every caller of this kind, not just the one that hit it.
+        retry_after = parse_duration(headers.get("retry-after"))
+        if retry_after is None and headers.get("retry-after-ms"):
+            retry_after = float(headers["retry-after-ms"]) / 1000
+        if retry_after is None:
+            retry_after = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        retry_after = min(retry_after, self.max_delay)
+        with self.lock:
+            self.paused_until[kind] = max(self.paused_until[kind], time.monotonic() + retry_after)
+            self.counters["retries"] += 1
+        return retry_after
+
+    def note_rate_limited(self):
+        with self.lock:
+            self.counters["rate_limited"] += 1
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+            for kind, buckets in self.buckets.items():
+                stats[f"{kind}_rpm"] = buckets["requests"].capacity
+                stats[f"{kind}_tpm"] = buckets["tokens"].capacity
+        return stats
+
+
+def _number(value):
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def estimate_tokens(kind, request):
+    try:
+        body = json.loads(request.content or b"{}")
+    except ValueError:
+        return 1
+    if kind == "tts":
+        return len(body.get("input", ""))
+    prompt = sum(len(str(message.get("content") or "")) for message in body.get("messages", []))
+    return prompt // 4 + (body.get("max_tokens") or DEFAULT_COMPLETION_TOKENS)
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    # Wraps the HTTP transport so every chat and TTS call made through the
+    # client waits for budget, adapts to rate-limit headers and retries
+    # throttled or failed requests with backoff
+    def __init__(self, limiter, transport=None):
+        self.limiter = limiter
+        self.transport = transport or httpx.HTTPTransport()
+
+    def handle_request(self, request):
+        kind = self.limiter.kind_for(request.url)
+        if kind is None:
+            return self.transport.handle_request(request)
+
+        tokens = estimate_tokens(kind, request)
+        attempt = 0
+        while True:
+            self.limiter.acquire(kind, tokens)
+            try:
+                response = self.transport.handle_request(request)
+            except RETRY_ERRORS:
+                if attempt >= self.limiter.max_retries:
+                    raise
+                # acquire() sits out the pause set by backoff()
+                self.limiter.backoff(kind, attempt, {})
+                attempt += 1
+                continue
+
+            self.limiter.observe(kind, response.headers)
+            if response.status_code not in RETRY_STATUSES or attempt >= self.limiter.max_retries:
+                return response
+            if response.status_code == 429:
+                self.limiter.note_rate_limited()
+            response.read()
+            response.close()
+            self.limiter.backoff(kind, attempt, response.headers)
+            attempt += 1
+
+    def close(self):
+        self.transport.close()
+
+
+_shared_limiter = None
+_shared_lock = threading.Lock()
+
+
+def get_rate_limiter():
+    # One limiter per process so the CLI, every GUI request and batch workers
+    # all draw from the same budget
+    global _shared_limiter
+    with _shared_lock:
+        if _shared_limiter is None:
+            _shared_limiter = RateLimiter()
+        return _shared_limiter
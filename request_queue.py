@@ -0,0 +1,152 @@
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+
+class ChatRequest:
+    def __init__(self, request_id, message, **context):
+        self.id = request_id
+        self.message = message
+        self.context = context
+        self.submitted = time.perf_counter()
+        self.cancelled = threading.Event()
+        self.future = None
+        self.done = False
+        # UI events held back until every earlier request has finished rendering
+        self.buffer = []
+        self.resources = []
+        self.lock = threading.Lock()
+        # Requests run side by side, but each turn's context needs the turn
+        # before it: set once this request has recorded its turn or given up
+        self.previous = None
+        self.turn_done = threading.Event()
+
+    def wait_for_previous_turn(self):
+        # Blocks until the request submitted before this one has ended its turn.
+        # Returns False if this request was cancelled while waiting.
+        previous = self.previous
+        while previous is not None and not previous.turn_done.wait(0.05):
+            if self.cancelled.is_set():
+                return False
+        # Drop the link so finished requests can be freed
+        self.previous = None
+        return not self.cancelled.is_set()
+
+    def end_turn(self):
+        self.turn_done.set()
+
+    def attach(self, resource):
+        # Anything with close() or cancel() (chat streams, speech pipelines) is
+        # torn down when the request is cancelled
+        with self.lock:
+            if not self.cancelled.is_set():
+                self.resources.append(resource)
+                return
+        self._release(resource)
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled.set()
+            resources, self.resources = self.resources, []
+        for resource in resources:
+            self._release(resource)
+
+    def _release(self, resource):
+        try:
+            if hasattr(resource, "cancel"):
+                resource.cancel()
+            else:
+                resource.close()
+        except Exception as e:
+            print(f"Warning: Could not cancel request resource: {e}")
+
+
+class RequestQueue:
+    def __init__(self, handler, post, max_workers=2, on_change=None):
+        # handler(request) runs on a pool thread, even for requests cancelled
+        # while queued, so it can report them; post(kind, *args) delivers UI
+        # events, and emit() routes through it in submission order. A handler
+        # that builds on earlier turns calls request.wait_for_previous_turn()
+        # first and request.end_turn() once its own turn is recorded.
+        self.handler = handler
+        self.post = post
+        self.on_change = on_change
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="chat")
+        self.ids = itertools.count(1)
+        self.lock = threading.Lock()
+        self.last_submitted = None
+        # Requests that have not finished rendering, oldest (the head) first
+        self.requests = OrderedDict()
+
+    def submit(self, message, **context):
+        request = ChatRequest(next(self.ids), message, **context)
+        with self.lock:
+            self.requests[request.id] = request
+            request.previous, self.last_submitted = self.last_submitted, request
+        request.future = self.executor.submit(self._run, request)
+        self._changed()
+        return request
+
+    def _run(self, request):
+        try:
+            self.handler(request)
+        except Exception as e:
+            print(f"Error processing request {request.id}: {e}")
+        finally:
+            request.end_turn()
+            self.finish(request)
+
+    def emit(self, request, kind, *args):
+        with self.lock:
+            if self._is_head(request):
+                self.post(kind, *args)
+            else:
+                request.buffer.append((kind, args))
+
+    def finish(self, request):
+        with self.lock:
+            request.done = True
+            # Hand the display to the next request(s), flushing what they buffered
+            while self.requests:
+                head = next(iter(self.requests.values()))
+                for kind, args in head.buffer:
+                    self.post(kind, *args)
+                head.buffer = []
+                if not head.done:
+                    break
+                del self.requests[head.id]
+        self._changed()
+
+    def cancel(self, request_id=None):
+        # Cancels the given request, or the one currently rendering
+        with self.lock:
+            if request_id is None:
+                request = next(iter(self.requests.values()), None)
+            else:
+                request = self.requests.get(request_id)
+        if request is not None:
+            request.cancel()
+        return request
+
+    def cancel_all(self):
+        with self.lock:
+            requests = list(self.requests.values())
+        for request in requests:
+            self.cancel(request.id)
+
+    def pending(self):
+        with self.lock:
+            return len(self.requests)
+
+    def shutdown(self):
+        self.cancel_all()
+        self.executor.shutdown(wait=False)
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change()
+
+    def _is_head(self, request):
+        return next(iter(self.requests), None) == request.id
@@ -0,0 +1,194 @@
+import json
+import math
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+SCHEMA_VERSION = 1
+VOICES = ("alloy", "echo", "fable", "onyx", "nova", "shimmer")
+THEMES = ("System", "Dark", "Light")
+PERSONALITY_TRAITS = ("formality", "tech_level", "humor", "creativity", "empathy", "efficiency")
+
+# name: (default, allowed) where allowed is a tuple of choices for strings or a
+# (min, max) range for numbers; None allows any value of the default's type.
+# Floats are rounded to two places, so slider jitter isn't a change.
+SCHEMA = {
+    "theme": ("System", THEMES),
+    "voice": ("alloy", VOICES),
+    "voice_speed": (1.0, (0.5, 2.0)),
+    "volume": (0.7, (0.0, 1.0)),
+    "formality": (0.7, (0.0, 1.0)),
+    "tech_level": (0.8, (0.0, 1.0)),
+    "humor": (0.3, (0.0, 1.0)),
+    "creativity": (0.6, (0.0, 1.0)),
+    "empathy": (0.5, (0.0, 1.0)),
+    "efficiency": (0.7, (0.0, 1.0)),
+    "stream_responses": (True, None),
+    "pipelined_tts": (True, None),
+    "stream_audio": (True, None),
+    "audio_process": (True, None),
+    "tts_cache_mb": (200, (0, None)),
+    "history_tokens": (3000, (100, None)),
+    "max_concurrent_requests": (2, (1, 16)),
+    "metrics_file": ("", None),
+    "response_cache_hours": (24, (0, None)),
+    "response_cache_entries": (1000, (0, None)),
+    "custom_prompt": ("You are a cyber ninja AI assistant. Maintain the cyber ninja theme while adjusting to the personality traits.", None),
+}
+
+
+def validate(key, value):
+    # Returns the value coerced to the schema's type, or raises ValueError
+    if key not in SCHEMA:
+        return value  # Unknown keys are kept for newer or hand-edited files
+    default, allowed = SCHEMA[key]
+    if isinstance(default, bool):
+        if not isinstance(value, bool):
+            raise ValueError(f"{key} must be true or false")
+    elif isinstance(default, (int, float)):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            raise ValueError(f"{key} must be a number")
+        # json reads NaN and Infinity, which would slip past the range check
+        if not math.isfinite(value):
+            raise ValueError(f"{key} must be a finite number")
+        if isinstance(default, float):
+            value = round(float(value), 2)
+        elif isinstance(value, float) and not value.is_integer():
+            raise ValueError(f"{key} must be a whole number")
+        else:
+            # 3.0 from a hand-edited file is accepted as 3
+            value = int(value)
+        low, high = allowed
+        if (low is not None and value < low) or (high is not None and value > high):
+            raise ValueError(f"{key} must be between {low} and {high if high is not None else 'any'}")
+    elif not isinstance(value, str):
+        raise ValueError(f"{key} must be text")
+    elif allowed and value not in allowed:
+        raise ValueError(f"{key} must be one of {', '.join(allowed)}")
+    return value
+
+
+def build_system_prompt(settings):
+    # settings is anything indexable by key: a SettingsStore, or a dict of
+    # per-session overrides in server mode
+    personality_traits = "\n".join(
+        f"- {key.replace('_', ' ').title()}: {settings[key]:.1f}" for key in PERSONALITY_TRAITS
+    )
+    return f"{settings['custom_prompt']}\n\nPersonality Traits:\n{personality_traits}"
+
+
+def migrate(data):
+    # Files from before versioning hold the same keys; later schema changes
+    # add a step here for each version they replace
+    version = data.pop("version", 0)
+    if version > SCHEMA_VERSION:
+        print(f"Warning: settings file is from a newer version ({version}); unknown settings are kept as they are")
+    return data
+
+
+class SettingsStore:
+    def __init__(self, path, save_delay=0.5):
+        self.path = Path(path)
+        self.save_delay = save_delay
+        self.values = {key: default for key, (default, _) in SCHEMA.items()}
+        self.listeners = []
+        self.lock = threading.Lock()
+        self.save_timer = None
+
+    def load(self):
+        if not self.path.exists():
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if not isinstance(data, dict):
+                raise ValueError("expected a JSON object")
+        except (OSError, ValueError) as e:
+            # Keep the unreadable file so the next save doesn't destroy it
+            backup = self.path.with_suffix(".json.bad")
+            print(f"Warning: Could not read {self.path.name} ({e}); using defaults, old file kept as {backup.name}")
+            try:
+                os.replace(self.path, backup)
+            except OSError:
+                pass
+            return
+        for key, value in migrate(data).items():
+            try:
+                self.values[key] = validate(key, value)
+            except ValueError as e:
+                print(f"Warning: Ignoring setting {e}; using {self.values.get(key)!r}")
+
+    def __getitem__(self, key):
+        return self.values[key]
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def items(self):
+        return self.values.items()
+
+    def set(self, key, value):
+        # Validates, notifies subscribers and schedules a save; setting a key to
+        # the value it already has does nothing
+        value = validate(key, value)
+        with self.lock:
+            if self.values.get(key) == value:
+                return False
+            self.values[key] = value
+            listeners = [callback for keys, callback in self.listeners if keys is None or key in keys]
+        for callback in listeners:
+            callback(key, value)
+        self.schedule_save()
+        return True
+
+    def subscribe(self, callback, keys=None):
+        # callback(key, value) runs on the thread that changed the setting
+        with self.lock:
+            self.listeners.append((set(keys) if keys else None, callback))
+
+    def derived(self, keys, build):
+        # A cached value computed from settings, rebuilt only after one of keys changes
+        cache = {}
+        self.subscribe(lambda key, value: cache.clear(), keys)
+
+        def get():
+            if "value" not in cache:
+                cache["value"] = build(self)
+            return cache["value"]
+        return get
+
+    def schedule_save(self):
+        # Debounced: a slider drag produces one write after it stops
+        with self.lock:
+            if self.save_timer:
+                self.save_timer.cancel()
+            self.save_timer = threading.Timer(self.save_delay, self.save)
+            self.save_timer.start()
+
+    def flush(self):
+        with self.lock:
+            pending = self.save_timer is not None
+            if pending:
+                self.save_timer.cancel()
+        if pending:
+            self.save()
+
+    def save(self):
+        # Written to a temp file and renamed over the old one, so a crash mid-write
+        # leaves the previous settings intact
+        with self.lock:
+            self.save_timer = None
+            data = {"version": SCHEMA_VERSION, **self.values}
+        tmp_path = None
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=self.path.parent, prefix=f".{self.path.name}.", suffix=".tmp")
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Warning: Could not save settings: {e}")
+            if tmp_path and os.path.exists(tmp_path):
+                os.unlink(tmp_path)
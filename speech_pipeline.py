@@ -0,0 +1,157 @@
+import queue
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from tts_cache import download_speech
+from speech_text import SpeechNormalizer
+
+# A sentence ends at terminal punctuation (optionally followed by closing quotes
+# or brackets) and whitespace, or at a blank line
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?…])["\')\]]*\s+|\n\s*\n')
+
+
+class SentenceSplitter:
+    def __init__(self, min_length=20):
+        # Very short sentences ("Greetings.") are merged with the next one so we
+        # don't pay a full TTS round trip for a single word
+        self.min_length = min_length
+        self.buffer = ""
+
+    def feed(self, text):
+        self.buffer += text
+        sentences = []
+        start = 0
+        pending = ""
+        for match in SENTENCE_BOUNDARY.finditer(self.buffer):
+            pending += self.buffer[start:match.end()]
+            start = match.end()
+            if len(pending.strip()) >= self.min_length:
+                sentences.append(pending.strip())
+                pending = ""
+        self.buffer = pending + self.buffer[start:]
+        return sentences
+
+    def flush(self):
+        remainder = self.buffer.strip()
+        self.buffer = ""
+        return [remainder] if remainder else []
+
+
+class SpeechPipeline:
+    def __init__(self, client, play_clip, voice="alloy", speed=1.0, model="tts-1",
+                 response_format="mp3", max_workers=2, cache=None, after=None,
+                 timer=None, on_finished=None):
+        self.client = client
+        self.cache = cache
+        self.timer = timer
+        self.on_finished = on_finished
+        # Playback starts only once the pipeline for the previous reply is done
+        self.after = after
+        self.play_clip = play_clip
+        self.voice = voice
+        self.speed = speed
+        self.model = model
+        self.response_format = response_format
+
+        # Markdown, code and URLs are rewritten for speech before sentences are cut
+        self.normalizer = SpeechNormalizer()
+        self.splitter = SentenceSplitter()
+        self.cancelled = threading.Event()
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts")
+        # Futures in submission order; None marks the end of the reply
+        self.clips = queue.Queue()
+        self.closed = False
+        # submit() runs on the chat worker while cancel() runs on the Tk thread;
+        # nothing may reach the executor after it has been shut down
+        self.lock = threading.Lock()
+        self.player = threading.Thread(target=self._play_in_order, daemon=True)
+        self.player.start()
+
+    def feed(self, text):
+        for sentence in self.splitter.feed(self.normalizer.feed(text)):
+            self.submit(sentence)
+
+    def submit(self, sentence):
+        with self.lock:
+            if self.cancelled.is_set() or self.closed:
+                return
+            self.clips.put(self.executor.submit(self._synthesize, sentence))
+
+    def close(self):
+        if self.closed:
+            return
+        for sentence in self.splitter.feed(self.normalizer.flush()) + self.splitter.flush():
+            self.submit(sentence)
+        if self.timer:
+            self.timer.count("tts_chars_removed", self.normalizer.removed_chars)
+        with self.lock:
+            if self.closed:
+                return  # Cancelled meanwhile
+            self.closed = True
+            self.clips.put(None)
+            self.executor.shutdown(wait=False)
+
+    def cancel(self):
+        with self.lock:
+            self.cancelled.set()
+            # Drop everything that has not started synthesizing yet
+            while True:
+                try:
+                    future = self.clips.get_nowait()
+                except queue.Empty:
+                    break
+                if future is not None:
+                    future.cancel()
+            self.closed = True
+            self.clips.put(None)
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    def wait(self, timeout=None):
+        self.player.join(timeout)
+        return not self.player.is_alive()
+
+    def _synthesize(self, sentence):
+        if self.cancelled.is_set():
+            return None
+        if self.cache:
+            return self.cache.speech(
+                self.client, sentence, self.voice, self.speed, self.model, self.response_format,
+                cancelled=self.cancelled, timer=self.timer
+            )
+        return download_speech(
+            self.client, sentence, self.voice, self.speed, self.model, self.response_format,
+            cancelled=self.cancelled, timer=self.timer
+        )
+
+    def _play_in_order(self):
+        try:
+            self._play_clips()
+        finally:
+            if self.on_finished:
+                self.on_finished(self)
+
+    def _play_clips(self):
+        # Synthesis keeps going in the executor while we wait for our turn
+        if self.after is not None:
+            while not self.after.wait(0.05) and not self.cancelled.is_set():
+                pass
+            self.after = None
+        while True:
+            future = self.clips.get()
+            if future is None:
+                break
+            if self.cancelled.is_set():
+                future.cancel()
+                continue
+            try:
+                audio = future.result()
+            except Exception as e:
+                print(f"Error generating speech: {e}")
+                continue
+            if audio and not self.cancelled.is_set():
+                try:
+                    # The sink may block until it can take another clip; it gets
+                    # the pipeline so it can check for cancellation and record timings
+                    self.play_clip(audio, self)
+                except Exception as e:
+                    print(f"Error playing audio: {e}")
@@ -0,0 +1,156 @@
+import re
+from urllib.parse import urlparse
+
+# Turns chat markdown into text worth reading aloud: code blocks are summarized,
+# links and URLs shortened, tables and lists flattened, abbreviations expanded
+
+FENCE = re.compile(r'^\s*(```|~~~)\s*([\w+#.-]*)')
+TABLE_ROW = re.compile(r'^\s*\|.*\|\s*$')
+TABLE_DIVIDER = re.compile(r'^[\s|:-]+$')
+HEADING = re.compile(r'^\s*#{1,6}\s+')
+LIST_ITEM = re.compile(r'^\s*(?:[-*+]|\d+[.)])\s+')
+BLOCKQUOTE = re.compile(r'^\s*>\s?')
+RULE = re.compile(r'^\s*([-*_])(\s*\1){2,}\s*$')
+
+IMAGE = re.compile(r'!\[([^\]]*)\]\([^)]*\)')
+LINK = re.compile(r'\[([^\]]+)\]\([^)]*\)')
+URL = re.compile(r'\bhttps?://[^\s)>\]]+|\bwww\.[^\s)>\]]+')
+INLINE_CODE = re.compile(r'`([^`]+)`')
+EMPHASIS = re.compile(r'(\*\*|__|\*)(?=\S)(.+?)(?<=\S)\1')
+ABBREVIATIONS = [
+    (re.compile(r'\be\.g\.(?=\s|,|$)', re.IGNORECASE), "for example"),
+    (re.compile(r'\bi\.e\.(?=\s|,|$)', re.IGNORECASE), "that is"),
+    (re.compile(r'\betc\.(?=\s|,|$)'), "et cetera"),
+    (re.compile(r'\bvs\.?(?=\s)'), "versus"),
+    (re.compile(r'\bapprox\.(?=\s)'), "approximately"),
+    (re.compile(r'\bw/(?=\s)'), "with"),
+]
+# Last place a partial line can be cut without splitting a sentence
+SENTENCE_CUT = re.compile(r'.*[.!?…]["\')\]]*\s+', re.DOTALL)
+
+
+def shorten_url(match):
+    url = match.group(0).rstrip(".,;:!?")
+    host = urlparse(url if "://" in url else f"http://{url}").netloc
+    host = host[4:] if host.startswith("www.") else host
+    return host + match.group(0)[len(url):]
+
+
+def spoken_inline(text):
+    text = IMAGE.sub(r'\1', text)
+    text = LINK.sub(r'\1', text)
+    text = URL.sub(shorten_url, text)
+    text = INLINE_CODE.sub(r'\1', text)
+    text = EMPHASIS.sub(r'\2', text)
+    for pattern, replacement in ABBREVIATIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+def end_sentence(text):
+    # Flattened headings, list items and table rows still get a pause after them
+    text = text.rstrip()
+    if text and text[-1] not in ".!?:;,…":
+        text += "."
+    return text
+
+
+class SpeechNormalizer:
+    def __init__(self):
+        # Streaming-safe: feed() takes deltas and returns only text whose
+        # meaning can't change with what comes next
+        self.pending = ""
+        self.mid_line = False
+        # Whether the current line is a heading or list item
+        self.in_item = False
+        self.fence = None
+        self.fence_lines = 0
+        self.input_chars = 0
+        self.output_chars = 0
+
+    @property
+    def removed_chars(self):
+        return max(0, self.input_chars - self.output_chars)
+
+    def feed(self, text):
+        self.input_chars += len(text)
+        self.pending += text
+        out = []
+        while "\n" in self.pending:
+            line, self.pending = self.pending.split("\n", 1)
+            out.append(self._line(line, end_of_line=True))
+        out.append(self._partial())
+        return self._emit("".join(out))
+
+    def flush(self):
+        out = self._line(self.pending, end_of_line=True) if self.pending else ""
+        self.pending = ""
+        if self.fence is not None:
+            # Reply ended inside an unterminated code block
+            out += self._fence_summary()
+        return self._emit(out)
+
+    def _emit(self, text):
+        self.output_chars += len(text)
+        return text
+
+    def _partial(self):
+        # Speak the finished sentences of a long line without waiting for its end,
+        # unless the line may still turn out to be code or a table
+        if self.fence is not None or not self.pending.strip():
+            return ""
+        head = self.pending.lstrip()
+        if head[0] in "`~|":
+            return ""
+        match = SENTENCE_CUT.match(self.pending)
+        if not match:
+            return ""
+        ready, self.pending = self.pending[:match.end()], self.pending[match.end():]
+        return self._line(ready, end_of_line=False)
+
+    def _line(self, line, end_of_line):
+        line_start = not self.mid_line
+        self.mid_line = not end_of_line
+
+        fence = FENCE.match(line) if line_start else None
+        if self.fence is not None:
+            if fence and fence.group(1) == self.fence[0]:
+                return self._fence_summary()
+            self.fence_lines += 1
+            return ""
+        if fence:
+            self.fence = (fence.group(1), fence.group(2))
+            self.fence_lines = 0
+            return ""
+
+        if line_start:
+            if RULE.match(line):
+                return ""
+            if TABLE_ROW.match(line):
+                if TABLE_DIVIDER.match(line):
+                    return ""
+                cells = [cell.strip() for cell in line.strip().strip("|").split("|")]
+                return end_sentence(spoken_inline(", ".join(cell for cell in cells if cell))) + "\n"
+            marker = HEADING.match(line) or LIST_ITEM.match(line)
+            self.in_item = bool(marker)
+            line = line[marker.end():] if marker else BLOCKQUOTE.sub("", line)
+
+        text = spoken_inline(line)
+        if not end_of_line:
+            return text
+        return (end_sentence(text) if self.in_item else text) + "\n"
+
+    def _fence_summary(self):
+        language = self.fence[1]
+        lines = self.fence_lines
+        self.fence = None
+        self.fence_lines = 0
+        label = f"{language} code" if language else "code"
+        return f"There's a {lines}-line {label} block on screen.\n\n"
+
+
+def normalize_for_speech(text):
+    # Returns (spoken text, characters removed)
+    normalizer = SpeechNormalizer()
+    spoken = normalizer.feed(text) + normalizer.flush()
+    return spoken.strip(), normalizer.removed_chars
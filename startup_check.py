@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# Launches the built app, waits for the startup report it writes when
+# CYBER_NINJA_STARTUP_REPORT is set, and fails if the window took too long to
+# appear. On Linux without a display the app runs inside xvfb-run.
+#
+# Right after a build the app's files are usually still in the OS file cache,
+# so the first launch is not a cold start; --drop-caches evicts the cache
+# before it (Linux, as root) to measure a real one.
+
+DEFAULT_EXECUTABLE = Path(__file__).parent / "dist" / "CyberNinjaAI" / (
+    "CyberNinjaAI.exe" if sys.platform == "win32" else "CyberNinjaAI"
+)
+
+
+def display_prefix():
+    if sys.platform != "linux" or os.getenv("DISPLAY"):
+        return []
+    xvfb_run = shutil.which("xvfb-run")
+    if not xvfb_run:
+        sys.exit("No display available and xvfb-run is not installed")
+    return [xvfb_run, "-a"]
+
+
+def drop_caches():
+    if sys.platform != "linux":
+        sys.exit("--drop-caches is only supported on Linux")
+    subprocess.run(["sync"], check=True)
+    try:
+        with open("/proc/sys/vm/drop_caches", 'w') as f:
+            f.write("3\n")
+    except OSError as e:
+        sys.exit(f"Could not drop the file cache ({e}); run as root or leave out --drop-caches")
+
+
+def launch(command, timeout):
+    # Returns the app's startup timings, measured from the moment it was launched
+    with tempfile.TemporaryDirectory() as tmp:
+        report_path = Path(tmp) / "startup.json"
+        env = dict(os.environ, CYBER_NINJA_STARTUP_REPORT=str(report_path))
+        env.setdefault("SDL_AUDIODRIVER", "dummy")
+        # Keeps the API key dialog from blocking startup; nothing is sent with it
+        env.setdefault("OPENAI_API_KEY", "sk-startup-check")
+
+        launched = time.time()
+        process = subprocess.Popen(command, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        try:
+            _, stderr = process.communicate(timeout=timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.communicate()
+            print(f"Timed out after {timeout:.0f} s without a startup report")
+            return None
+        if not report_path.exists():
+            print(f"Exited with code {process.returncode} without a startup report")
+            print(stderr.decode(errors="replace")[-2000:])
+            return None
+        with open(report_path, 'r', encoding='utf-8') as f:
+            record = json.load(f)
+
+    # The app's timer starts when its module begins importing; everything before
+    # that is bootloader unpacking and interpreter startup
+    timings = record["timings_ms"]
+    before_python = (record["timestamp"] - launched) * 1000
+    return {
+        "interpreter": before_python,
+        "window": before_python + timings["first_frame"],
+        "ready": before_python + timings["ready"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check how quickly the built app shows its window")
+    parser.add_argument("--runs", type=int, default=3, help="Launches to time; the first one is checked")
+    parser.add_argument("--max-window-ms", type=float, default=3000,
+                        help="Fail if the first launch takes longer than this to show the window")
+    parser.add_argument("--drop-caches", action="store_true",
+                        help="Drop the OS file cache before the first launch so it is a real cold start (Linux, root)")
+    parser.add_argument("--timeout", type=float, default=60, help="Seconds to wait for each launch")
+    parser.add_argument("command", nargs=argparse.REMAINDER,
+                        help="Command to launch (default: the onedir build in dist/)")
+    options = parser.parse_args()
+
+    command = [arg for arg in options.command if arg != "--"] or [str(DEFAULT_EXECUTABLE)]
+    command = display_prefix() + command
+
+    # Without dropping the cache the first launch may still find the app's
+    # files in memory, so it is only called a cold start when it really is one
+    first_label = "cold start" if options.drop_caches else "first launch"
+    runs = []
+    for i in range(options.runs):
+        if i == 0 and options.drop_caches:
+            drop_caches()
+        result = launch(command, options.timeout)
+        if result is None:
+            return 1
+        runs.append(result)
+        label = first_label if i == 0 else "warm"
+        print(f"Run {i + 1} ({label}): " + ", ".join(f"{name} {ms:.0f} ms" for name, ms in result.items()))
+
+    first = runs[0]["window"]
+    if len(runs) > 1:
+        print(f"Warm median: window {statistics.median(r['window'] for r in runs[1:]):.0f} ms")
+    if first > options.max_window_ms:
+        print(f"FAIL: {first_label} took {first:.0f} ms to show the window (limit {options.max_window_ms:.0f} ms)")
+        return 1
+    print(f"OK: {first_label} showed the window in {first:.0f} ms (limit {options.max_window_ms:.0f} ms)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,9 @@
+import os
+import sys
+from pathlib import Path
+
+# The app's modules live at the repository root rather than in a package
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Anything that opens the pygame mixer gets a silent device
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
@@ -0,0 +1,172 @@
+import queue
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import audio_engine
+from audio_engine import AUDIO_UNAVAILABLE, AudioArbiter, AudioProcessEngine
+from metrics import TurnTimer
+
+
+class FakePlayer:
+    def __init__(self):
+        self.done = threading.Event()
+        self.cancelled = False
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def cancel(self):
+        self.cancelled = True
+        self.done.set()
+
+
+def players(count):
+    return [FakePlayer() for _ in range(count)]
+
+
+def test_new_players_wait_for_the_last_unfinished_one():
+    arbiter = AudioArbiter()
+    assert arbiter.last() is None
+    first, second = players(2)
+    arbiter.add(first)
+    arbiter.add(second)
+    assert arbiter.last() is second
+    second.done.set()
+    assert arbiter.last() is first
+    first.done.set()
+    assert arbiter.last() is None
+    assert not arbiter.active()
+
+
+def test_cancel_playing_skips_only_the_reply_being_heard():
+    arbiter = AudioArbiter()
+    first, second, third = players(3)
+    for player in (first, second, third):
+        arbiter.add(player)
+    assert arbiter.cancel_playing()
+    assert first.cancelled
+    assert not second.cancelled and not third.cancelled
+    assert arbiter.cancel_playing()
+    assert second.cancelled and not third.cancelled
+    assert arbiter.last() is third
+
+
+def test_cancel_playing_with_nothing_queued():
+    arbiter = AudioArbiter()
+    assert not arbiter.cancel_playing()
+    finished = FakePlayer()
+    finished.done.set()
+    arbiter.add(finished)
+    assert not arbiter.cancel_playing()
+    assert not finished.cancelled
+
+
+def test_cancel_by_owner_reports_whether_the_heard_reply_was_stopped():
+    arbiter = AudioArbiter()
+    tab_a, tab_b = object(), object()
+    a1, b1, a2 = players(3)
+    arbiter.add(a1, tab_a)
+    arbiter.add(b1, tab_b)
+    arbiter.add(a2, tab_a)
+
+    assert not arbiter.cancel(tab_b)
+    assert b1.cancelled and not a1.cancelled
+    assert arbiter.cancel(tab_a)
+    assert a1.cancelled and a2.cancelled
+    assert not arbiter.active()
+
+
+def test_cancel_everything():
+    arbiter = AudioArbiter()
+    queued = players(3)
+    for player in queued:
+        arbiter.add(player, object())
+    assert arbiter.cancel()
+    assert all(player.cancelled for player in queued)
+    assert not arbiter.cancel()
+
+
+class FakeWorker:
+    # Both the audio process and the GUI's end of its pipe: music is reported
+    # as started straight away, and as over with the next state report
+    def __init__(self, alive=True):
+        self.alive = alive
+        self.exitcode = None if alive else AUDIO_UNAVAILABLE
+        self.sent = []
+        self.events = queue.Queue()
+
+    def start(self):
+        if not self.alive:
+            self.events.put(None)
+
+    def is_alive(self):
+        return self.alive
+
+    def join(self, timeout=None):
+        pass
+
+    def send(self, message):
+        self.sent.append(message)
+        if message[0] == "music":
+            self.events.put(("started", message[1], True))
+            self.events.put(("state", {"busy": False, "paused": False, "queued": 0, "position_ms": -1}))
+
+    def recv(self):
+        event = self.events.get()
+        if event is None:
+            raise EOFError
+        return event
+
+    def close(self):
+        self.events.put(None)
+
+
+@pytest.fixture
+def start_engine(monkeypatch):
+    engines = []
+
+    def start(worker):
+        context = SimpleNamespace(
+            Pipe=lambda: (worker, SimpleNamespace(close=lambda: None)),
+            Process=lambda **kwargs: worker
+        )
+        monkeypatch.setattr(audio_engine.multiprocessing, "get_context", lambda method: context)
+        engine = AudioProcessEngine()
+        engines.append(engine)
+        return engine
+
+    yield start
+    for engine in engines:
+        engine.outbox.put(None)
+
+
+def test_music_starts_and_reports_back(start_engine):
+    worker = FakeWorker()
+    engine = start_engine(worker)
+    timer = TurnTimer()
+    started = threading.Event()
+    assert engine.play_music(b"mp3 bytes", timer=timer, on_start=started.set)
+    assert started.wait(2)
+    assert "playback_start" in timer.marks
+    assert worker.sent[0][0] == "music" and worker.sent[0][2] == b"mp3 bytes"
+    assert engine.wait_idle()
+
+
+def test_music_is_refused_once_audio_is_off(start_engine):
+    worker = FakeWorker(alive=False)
+    engine = start_engine(worker)
+    # The worker found no audio device, which a restart won't fix
+    engine.set_volume(0.5)
+    deadline = time.monotonic() + 2
+    while not engine.failed and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert engine.failed
+
+    started = []
+    assert not engine.play_music(b"mp3 bytes", on_start=lambda: started.append(True))
+    assert not engine.state()["busy"]
+    assert started == []
+    assert worker.sent == []
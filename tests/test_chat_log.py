@@ -0,0 +1,123 @@
+import json
+
+import pytest
+
+from chat_log import TITLE_CHARS, ChatLog, title_for
+
+
+@pytest.fixture
+def log(tmp_path):
+    log = ChatLog(tmp_path / "chats.db")
+    yield log
+    log.close()
+
+
+def test_lines_are_appended_in_order_and_read_by_range(log):
+    session = log.start_session()
+    log.append(session, [f"line {i}" for i in range(5)])
+    log.append(session, ["line 5"])
+    assert log.count(session) == 6
+    assert log.read(session) == [f"line {i}" for i in range(6)]
+    assert log.read(session, 2, 3) == ["line 2", "line 3", "line 4"]
+    assert log.read(session, 10) == []
+
+
+def test_sessions_are_named_after_the_first_question(log):
+    session = log.start_session()
+    log.append(session, ["Cyber Ninja AI: Ready."])
+    assert log.title(session) == "New chat"
+    log.append(session, ["You:   How do   I start?", "You: Something else"])
+    assert log.title(session) == "How do I start?"
+    assert title_for("You: " + "x" * 100) == "x" * (TITLE_CHARS - 1) + "…"
+
+
+def test_recent_sessions_skip_empty_ones(log):
+    first = log.start_session()
+    log.append(first, ["You: one"])
+    log.start_session()
+    second = log.start_session()
+    log.append(second, ["You: two"])
+    log.append(first, ["You: again"])
+    assert [row[0] for row in log.sessions()] == [first, second]
+    assert log.sessions()[0][3] == 2
+
+
+def test_sessions_survive_reopening(tmp_path):
+    log = ChatLog(tmp_path / "chats.db")
+    session = log.start_session()
+    log.append(session, ["You: remember me"])
+    log.close()
+    reopened = ChatLog(tmp_path / "chats.db")
+    assert reopened.read(session) == ["You: remember me"]
+    reopened.close()
+
+
+def test_json_round_trip_imports_each_file_once(log, tmp_path):
+    session = log.start_session()
+    lines = ["You: héllo", 'Cyber Ninja AI: "quoted"\nsecond line']
+    log.append(session, lines)
+    path = tmp_path / "export.json"
+    log.export_json(session, path, batch=1)
+    assert json.loads(path.read_text(encoding="utf-8")) == lines
+
+    imported = log.import_json(path)
+    assert imported != session
+    assert log.read(imported) == lines
+    # Imported chats are named after their file
+    assert log.title(imported) == "export"
+    assert log.import_json(path) == imported
+
+
+def test_empty_session_exports_an_empty_list(log, tmp_path):
+    path = tmp_path / "empty.json"
+    log.export_json(log.start_session(), path)
+    assert json.loads(path.read_text(encoding="utf-8")) == []
+
+
+def test_search_finds_every_word_with_a_prefix_last(log):
+    cooking = log.start_session()
+    log.append(cooking, ["You: How long do I boil pasta?", "Cyber Ninja AI: Boil the pasta for ten minutes."])
+    coding = log.start_session()
+    log.append(coding, ["You: Why does my Python loop never end?"])
+
+    assert {hit[0] for hit in log.search("pasta")} == {cooking}
+    assert [hit[:2] for hit in log.search("python loo")] == [(coding, 0)]
+    # Every word must match
+    assert log.search("pasta python") == []
+    assert log.search("!!!") == []
+
+
+def test_search_returns_titles_and_snippets(log):
+    session = log.start_session()
+    long_line = "Cyber Ninja AI: " + "filler " * 30 + "the secret word is shuriken " + "more " * 30
+    log.append(session, ["You: Tell me a secret", long_line])
+    [(session_id, seq, title, snippet)] = log.search("shuriken")
+    assert (session_id, seq, title) == (session, 1, "Tell me a secret")
+    assert "shuriken" in snippet
+    assert snippet.startswith("…") and snippet.endswith("…")
+
+
+def test_search_ignores_case_and_accents(log):
+    session = log.start_session()
+    log.append(session, ["You: Café crème recipes"])
+    assert len(log.search("CAFE creme")) == 1
+
+
+def test_best_matches_come_first_and_limit_applies(log):
+    session = log.start_session()
+    log.append(session, [f"You: ninja number {i}" for i in range(30)] + ["You: ninja ninja ninja"])
+    hits = log.search("ninja", limit=5)
+    assert len(hits) == 5
+    assert hits[0][1] == 30
+
+
+def test_logs_written_before_the_index_are_indexed_on_open(tmp_path):
+    log = ChatLog(tmp_path / "chats.db")
+    session = log.start_session()
+    log.append(session, ["You: indexed later"])
+    log.db.execute("DELETE FROM messages_fts")
+    log.db.commit()
+    log.close()
+    reopened = ChatLog(tmp_path / "chats.db")
+    assert [hit[:2] for hit in reopened.search("indexed")] == [(session, 0)]
+    reopened.close()
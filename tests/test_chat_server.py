@@ -0,0 +1,169 @@
+import asyncio
+import http.client
+import json
+import socket
+import threading
+import time
+
+import pytest
+
+from chat_server import ChatServer
+from mock_openai_server import MockConfig, MockOpenAIServer
+from openai_client import create_client
+from response_cache import ResponseCache
+from settings_store import SettingsStore
+from tts_cache import TTSCache
+
+TOKEN = "secret"
+AUTH = {"Authorization": f"Bearer {TOKEN}"}
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    tmp_path = tmp_path_factory.mktemp("server")
+    mock = MockOpenAIServer(MockConfig(latency_ms=20, token_rate=500, reply_tokens=20,
+                                       audio_bytes=20000, audio_rate=1000000)).start()
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    server = ChatServer(
+        SettingsStore(tmp_path / "settings.json").items(),
+        create_client(base_url=mock.base_url, api_key="mock"),
+        TTSCache(tmp_path / "cache"),
+        ResponseCache(tmp_path / "responses.db"),
+        concurrency=2, max_waiting=1, token=TOKEN
+    )
+    asyncio.run_coroutine_threadsafe(server.start("127.0.0.1", 0), loop).result()
+    yield server
+    asyncio.run_coroutine_threadsafe(server.close(), loop).result(10)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+    server.tts_cache.close()
+    server.response_cache.close()
+    mock.stop()
+
+
+def call(server, method, path, body=None, headers=AUTH):
+    connection = http.client.HTTPConnection("127.0.0.1", server.port, timeout=30)
+    try:
+        connection.request(method, path, json.dumps(body) if body is not None else None, headers)
+        response = connection.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        connection.close()
+
+
+def new_session(server, **overrides):
+    status, _, data = call(server, "POST", "/sessions", overrides)
+    assert status == 201
+    return json.loads(data)["session_id"]
+
+
+def events(data):
+    # SSE body -> [(event, data)]
+    parsed = []
+    for block in data.decode().split("\n\n"):
+        fields = dict(line.split(": ", 1) for line in block.splitlines() if ": " in line)
+        if "event" in fields:
+            parsed.append((fields["event"], json.loads(fields["data"])))
+    return parsed
+
+
+def test_requests_need_the_token(server):
+    assert call(server, "GET", "/health", headers={})[0] == 401
+    assert call(server, "GET", "/health", headers={"Authorization": "Bearer wrong"})[0] == 401
+    assert call(server, "GET", "/health")[0] == 200
+
+
+def test_sessions_take_personality_overrides(server):
+    session_id = new_session(server, humor=0.9, voice="nova")
+    session = server.sessions[session_id]
+    assert "- Humor: 0.9" in session.system_prompt
+    assert session.info()["settings"]["voice"] == "nova"
+    assert call(server, "POST", "/sessions", {"humor": 5})[0] == 400
+    # Only personality and voice settings can be overridden
+    assert call(server, "POST", "/sessions", {"volume": 0.1})[0] == 400
+
+
+def test_chat_streams_tokens_then_done(server):
+    session_id = new_session(server)
+    status, headers, data = call(server, "POST", f"/sessions/{session_id}/chat", {"message": "hello there"})
+    assert status == 200
+    assert headers["Content-Type"].startswith("text/event-stream")
+    stream = events(data)
+    tokens = [payload for event, payload in stream if event == "token"]
+    kind, done = stream[-1]
+    assert kind == "done"
+    assert tokens
+    assert "".join(token["text"] for token in tokens) == done["reply"]
+    assert "timings_ms" in done
+
+
+def test_same_question_in_a_new_session_is_replayed_from_the_cache(server):
+    first = new_session(server, custom_prompt="Cache test.")
+    _, _, data = call(server, "POST", f"/sessions/{first}/chat", {"message": "cache me"})
+    reply = events(data)[-1][1]["reply"]
+    second = new_session(server, custom_prompt="Cache test.")
+    _, _, data = call(server, "POST", f"/sessions/{second}/chat", {"message": "Cache me?"})
+    done = events(data)[-1][1]
+    assert done["reply"] == reply
+    assert "response_cache_hit" in done["timings_ms"]
+
+
+def test_speech_streams_audio(server):
+    session_id = new_session(server)
+    status, headers, data = call(server, "POST", f"/sessions/{session_id}/speech",
+                                 {"text": "Hello **there**", "format": "wav"})
+    assert status == 200
+    assert headers["Content-Type"] == "audio/wav"
+    assert len(data) > 0
+    assert call(server, "POST", f"/sessions/{session_id}/speech", {"text": "x", "format": "ogg"})[0] == 400
+    assert call(server, "POST", f"/sessions/{session_id}/speech", {"text": ""})[0] == 400
+    # Nothing left to say once the text is normalized for speech
+    assert call(server, "POST", f"/sessions/{session_id}/speech", {"text": "---"})[0] == 204
+
+
+def test_unknown_routes_and_sessions(server):
+    assert call(server, "GET", "/nope")[0] == 404
+    assert call(server, "POST", "/sessions/missing/chat", {"message": "x"})[0] == 404
+    assert call(server, "GET", "/sessions")[0] == 405
+    session_id = new_session(server)
+    assert call(server, "DELETE", f"/sessions/{session_id}")[0] == 204
+    assert call(server, "GET", f"/sessions/{session_id}")[0] == 404
+
+
+def test_overload_gets_503_with_retry_after(server):
+    sessions = [new_session(server) for _ in range(6)]
+    results = []
+
+    def chat(session_id, i):
+        status, headers, _ = call(server, "POST", f"/sessions/{session_id}/chat",
+                                  {"message": f"busy {i}", "bypass_cache": True})
+        results.append((status, headers.get("Retry-After")))
+
+    threads = [threading.Thread(target=chat, args=(session_id, i)) for i, session_id in enumerate(sessions)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(30)
+    statuses = sorted(status for status, _ in results)
+    assert 200 in statuses and 503 in statuses
+    assert all(retry_after for status, retry_after in results if status == 503)
+
+
+def test_client_disconnect_frees_the_session(server):
+    session_id = new_session(server)
+    body = json.dumps({"message": "a long one", "bypass_cache": True}).encode()
+    with socket.create_connection(("127.0.0.1", server.port)) as sock:
+        sock.sendall(
+            f"POST /sessions/{session_id}/chat HTTP/1.1\r\nHost: test\r\nAuthorization: Bearer {TOKEN}\r\n"
+            f"Content-Length: {len(body)}\r\n\r\n".encode() + body
+        )
+        assert sock.recv(100).startswith(b"HTTP/1.1 200")
+    deadline = time.monotonic() + 5
+    while time.monotonic() < deadline:
+        _, _, data = call(server, "GET", f"/sessions/{session_id}")
+        if not json.loads(data)["busy"]:
+            break
+        time.sleep(0.05)
+    assert not json.loads(data)["busy"]
@@ -0,0 +1,65 @@
+import json
+
+import pytest
+
+from mock_openai_server import MockConfig, MockOpenAIServer
+
+
+@pytest.fixture(scope="module")
+def mock_api():
+    mock = MockOpenAIServer(MockConfig(latency_ms=5, token_rate=1000, reply_tokens=10, audio_bytes=2000)).start()
+    yield mock
+    mock.stop()
+
+
+@pytest.fixture
+def bot(mock_api, tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_BASE_URL", mock_api.base_url)
+    monkeypatch.setenv("OPENAI_API_KEY", "mock")
+    monkeypatch.delenv("CYBER_NINJA_METRICS_FILE", raising=False)
+    from chatbot import CyberNinjaChatbot
+    bot = CyberNinjaChatbot(output_dir=tmp_path / "audio")
+    yield bot
+    bot.tts_cache.close()
+
+
+def write_lines(path, lines):
+    path.write_text("".join(f"{line}\n" for line in lines), encoding="utf-8")
+
+
+def read_records(path):
+    return [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines()]
+
+
+def test_batch_answers_every_prompt_and_records_bad_lines(bot, tmp_path):
+    prompts = tmp_path / "prompts.jsonl"
+    output = tmp_path / "results.jsonl"
+    write_lines(prompts, [
+        json.dumps({"id": "a", "prompt": "Hello"}),
+        "{not json",
+        json.dumps({"id": "b"}),
+        "",
+        json.dumps({"prompt": "No id given"}),
+    ])
+    counts = bot.run_batch(prompts, output, concurrency=2)
+    assert counts == {"ok": 2, "error": 2, "skipped": 0}
+    records = {record["id"]: record for record in read_records(output)}
+    assert records["a"]["status"] == "ok" and records["a"]["reply"]
+    assert records["5"]["status"] == "ok"
+    assert records["2"]["error"].startswith("Invalid input line 2")
+    assert records["3"]["error"].startswith("Invalid input line 3")
+
+
+def test_resumed_batch_skips_done_prompts_and_drops_a_torn_line(bot, tmp_path):
+    prompts = tmp_path / "prompts.jsonl"
+    output = tmp_path / "results.jsonl"
+    write_lines(prompts, [json.dumps({"id": name, "prompt": f"Say {name}"}) for name in "abc"])
+    done = json.dumps({"id": "a", "status": "ok", "reply": "A", "latency_ms": 1.0})
+    failed = json.dumps({"id": "b", "status": "error", "error": "boom", "latency_ms": 1.0})
+    output.write_text(f'{done}\n{failed}\n{{"id": "c", "sta', encoding="utf-8")
+
+    counts = bot.run_batch(prompts, output, concurrency=2)
+    assert counts == {"ok": 2, "error": 0, "skipped": 1}
+    records = read_records(output)
+    assert records[:2] == [json.loads(done), json.loads(failed)]
+    assert sorted(record["id"] for record in records[2:]) == ["b", "c"]
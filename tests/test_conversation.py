@@ -0,0 +1,98 @@
+import threading
+
+from conversation import MESSAGE_OVERHEAD_TOKENS, ConversationHistory, count_tokens
+
+
+def cost(text):
+    return count_tokens(text) + MESSAGE_OVERHEAD_TOKENS
+
+
+def contents(messages):
+    return [m["content"] for m in messages]
+
+
+def test_messages_are_built_around_the_window():
+    history = ConversationHistory(max_tokens=1000)
+    history.add_turn("Hi", "Hello!")
+    messages = history.build_messages("Be brief.", "How are you?")
+    assert [m["role"] for m in messages] == ["system", "user", "assistant", "user"]
+    assert contents(messages) == ["Be brief.", "Hi", "Hello!", "How are you?"]
+
+
+def test_oldest_messages_slide_out_of_the_budget():
+    text = "word " * 20
+    history = ConversationHistory(max_tokens=cost(text) * 3)
+    for i in range(5):
+        history.add("user", f"{text}{i}")
+    assert len(history.window) <= 3
+    assert history.window_tokens <= history.max_tokens
+    assert contents(history.window)[-1].endswith("4")
+    assert len(history.pending) == 5 - len(history.window)
+
+
+def test_latest_message_is_kept_even_over_budget():
+    history = ConversationHistory(max_tokens=5)
+    history.add("user", "This message alone is longer than the whole budget.")
+    assert len(history.window) == 1
+
+
+def test_compact_folds_pending_messages_into_the_summary():
+    calls = []
+
+    def summarize(summary, messages):
+        calls.append((summary, contents(messages)))
+        return "They said hello."
+
+    text = "word " * 20
+    history = ConversationHistory(max_tokens=cost(text) * 3, summarize=summarize)
+    for i in range(4):
+        history.add("user", f"{text}{i}")
+    pending = contents(history.pending)
+    history.compact()
+    assert calls == [("", pending)]
+    system = history.build_messages("Be brief.", "Next")[0]["content"]
+    assert system.endswith("Summary of the earlier conversation:\nThey said hello.")
+    # The summary counts against the budget too
+    assert history.window_tokens + history.summary_tokens <= history.max_tokens
+
+
+def test_compact_without_pending_messages_does_nothing():
+    history = ConversationHistory(summarize=lambda summary, messages: 1 / 0)
+    history.add_turn("Hi", "Hello!")
+    history.compact()
+    assert history.summary == ""
+
+
+def test_failed_summary_keeps_the_old_one(capsys):
+    def summarize(summary, messages):
+        raise RuntimeError("API down")
+
+    history = ConversationHistory(max_tokens=cost("x") + 1, summarize=summarize)
+    history.summary = "Earlier."
+    history.add_turn("x", "y")
+    history.compact()
+    assert history.summary == "Earlier."
+    assert "Could not summarize" in capsys.readouterr().out
+
+
+def test_compact_can_run_while_turns_are_added():
+    started = threading.Event()
+    release = threading.Event()
+
+    def summarize(summary, messages):
+        started.set()
+        release.wait(5)
+        return "Summary."
+
+    history = ConversationHistory(max_tokens=cost("x") * 2, summarize=summarize)
+    history.add_turn("x", "y")
+    history.add_turn("x", "y")
+    thread = threading.Thread(target=history.compact)
+    thread.start()
+    assert started.wait(5)
+    # The summary request doesn't hold the lock turns are recorded under
+    history.add_turn("still", "works")
+    assert contents(history.build_messages("S", "next"))[-2] == "works"
+    release.set()
+    thread.join(5)
+    assert history.summary == "Summary."
@@ -0,0 +1,203 @@
+import threading
+from types import SimpleNamespace
+
+import pygame
+import pytest
+
+import audio_engine
+from audio_engine import AudioArbiter
+from conversation import ConversationHistory
+from enhanced_gui_chatbot import CyberNinjaGUI
+from metrics import LatencyMetrics, TurnTimer
+from request_queue import RequestQueue
+
+
+class FakeButton:
+    def __init__(self):
+        self.text = "▶"
+
+    def configure(self, text):
+        self.text = text
+
+
+class HeadlessGUI:
+    # The GUI's logic without any Tk widgets, as in benchmark.py
+    load_services = CyberNinjaGUI.load_services
+    initialize_audio = CyberNinjaGUI.initialize_audio
+    submit_message = CyberNinjaGUI.submit_message
+    process_message = CyberNinjaGUI.process_message
+    finish_turn = CyberNinjaGUI.finish_turn
+    play_audio = CyberNinjaGUI.play_audio
+    toggle_audio = CyberNinjaGUI.toggle_audio
+    stop_audio = CyberNinjaGUI.stop_audio
+    poll_audio = CyberNinjaGUI.poll_audio
+    apply_volume = CyberNinjaGUI.apply_volume
+    stream_chat_response = CyberNinjaGUI.stream_chat_response
+    begin_stream = CyberNinjaGUI.begin_stream
+    write_stream_text = CyberNinjaGUI.write_stream_text
+    end_stream = CyberNinjaGUI.end_stream
+
+    def __init__(self):
+        self.settings = {"audio_process": False, "volume": 0.7, "voice": "alloy", "voice_speed": 1.0,
+                         "stream_responses": False, "pipelined_tts": True}
+        self.events = []
+        self.ui_queue = SimpleNamespace(post=lambda *event: self.events.append(event), wake=lambda: None)
+        self.services_ready = threading.Event()
+        self.audio = None
+        self.arbiter = AudioArbiter()
+        self.metrics = LatencyMetrics()
+        self.play_button = FakeButton()
+        self.is_playing = False
+        self.scheduled = []
+        self.tab = SimpleNamespace(current_audio=None)
+
+    def initialize_client(self):
+        self.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+            create=lambda **request: SimpleNamespace(
+                choices=[SimpleNamespace(message=SimpleNamespace(content="Shown, not spoken."))]
+            )
+        )))
+
+    def initialize_caches(self):
+        self.tts_cache = SimpleNamespace(speech=lambda *args, **kwargs: pytest.fail("speech was synthesized"))
+
+    def current_tab(self):
+        return self.tab
+
+    def after(self, ms, callback):
+        self.scheduled.append(callback)
+
+
+@pytest.fixture
+def gui(monkeypatch):
+    def no_device(use_process, volume):
+        # What LocalAudioEngine raises on a machine without sound
+        raise pygame.error("No available audio device")
+
+    monkeypatch.setattr(audio_engine, "create_engine", no_device)
+    gui = HeadlessGUI()
+    gui.load_services()
+    return gui
+
+
+def test_startup_carries_on_without_an_audio_device(gui):
+    assert gui.services_ready.is_set()
+    assert gui.audio is None
+    kind, tab, message = gui.events[0]
+    assert message.startswith("Audio output unavailable")
+    assert gui.events[-1] == ("services_ready",)
+
+
+def test_audio_controls_do_nothing_without_audio(gui):
+    gui.tab.current_audio = b"clip"
+    gui.toggle_audio()
+    gui.stop_audio()
+    gui.poll_audio()
+    gui.apply_volume(0.3)
+    assert gui.play_button.text == "▶"
+    assert gui.scheduled == []
+
+
+def test_turn_is_closed_when_there_is_nothing_to_play_on(gui):
+    timer = gui.metrics.start("r1")
+    gui.play_audio(gui.tab, b"clip", timer)
+    assert timer.finished
+    assert gui.events[-1][0] == "metrics"
+
+
+def test_replies_are_shown_but_not_synthesized_without_audio(gui):
+    conversation = ConversationHistory()
+    posted = []
+    tab = SimpleNamespace(conversation=conversation, system_prompt="Be brief.", ensure_session=lambda: None)
+    tab.request_queue = RequestQueue(gui.process_message, lambda *event: posted.append(event))
+    gui.submit_message(tab, "Hello", bypass_cache=True)
+    tab.request_queue.executor.shutdown(wait=True)
+    assert ("append", "Cyber Ninja AI: Shown, not spoken.") in posted
+    assert gui.metrics.last["status"] == "ok"
+
+
+def test_turn_is_closed_when_the_audio_process_refuses_music(gui):
+    gui.audio = SimpleNamespace(play_music=lambda data, timer=None, on_start=None: False)
+    timer = gui.metrics.start("r1")
+    gui.play_audio(gui.tab, b"clip", timer)
+    assert gui.metrics.last["status"] == "error"
+    assert gui.play_button.text == "▶"
+
+
+def stream_chunk(content):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+
+class FakeTab:
+    # A chat tab's streaming display, as ChatTab hands it to the transcript
+    def __init__(self):
+        self.text = ""
+        self.writes = 0
+        self.lines = []
+        self.emitted = []
+        self.request_queue = SimpleNamespace(emit=lambda request, *event: self.emitted.append(event))
+
+    def begin_partial(self, text):
+        self.text = text
+
+    def write_partial(self, text):
+        self.text += text
+        self.writes += 1
+
+    def end_partial(self, line):
+        self.lines.append(line)
+        self.text = ""
+
+
+def stream_request(tab, cancelled=None):
+    return SimpleNamespace(context={"timer": TurnTimer(), "tab": tab}, attach=lambda stream: None,
+                           cancelled=cancelled or threading.Event())
+
+
+def test_tokens_are_emitted_as_they_arrive():
+    gui = HeadlessGUI()
+    chunks = [stream_chunk("Cyber "), SimpleNamespace(choices=[]), stream_chunk(None), stream_chunk("ninja.")]
+    gui.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        create=lambda model, messages, stream: iter(chunks)
+    )))
+    tab = FakeTab()
+    request = stream_request(tab)
+    spoken = []
+    assert gui.stream_chat_response(request, [], on_delta=spoken.append) == "Cyber ninja."
+    timer = request.context["timer"]
+    assert tab.emitted == [("stream_begin", timer), ("stream_text", "Cyber "), ("stream_text", "ninja."),
+                           ("stream_end", "Cyber ninja.")]
+    assert spoken == ["Cyber ", "ninja."]
+    assert timer.marks["chat_ttft"] <= timer.marks["chat_total"]
+
+
+def test_cancelling_ends_the_stream_with_what_arrived():
+    gui = HeadlessGUI()
+    cancelled = threading.Event()
+
+    def chunks():
+        yield stream_chunk("Partial ")
+        cancelled.set()
+        yield stream_chunk("never shown")
+
+    gui.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        create=lambda model, messages, stream: chunks()
+    )))
+    tab = FakeTab()
+    assert gui.stream_chat_response(stream_request(tab, cancelled), []) == "Partial "
+    assert tab.emitted[-1] == ("stream_end", "Partial ")
+
+
+def test_a_frame_of_tokens_is_one_write_per_tab():
+    gui = HeadlessGUI()
+    first, second = FakeTab(), FakeTab()
+    for tab in (first, second):
+        gui.begin_stream(tab, TurnTimer())
+    gui.write_stream_text([(first, "Cyber "), (second, "Other "), (first, "ninja")])
+    gui.write_stream_text([(first, ".")])
+    assert first.text == "Cyber Ninja AI: Cyber ninja."
+    assert first.writes == 2 and second.writes == 1
+    # Time to the first visible token is taken once per reply
+    assert first.last_ttft == first.stream_timer.marks["visible_ttft"]
+    gui.end_stream(first, "Cyber ninja.")
+    assert first.lines == ["Cyber Ninja AI: Cyber ninja."]
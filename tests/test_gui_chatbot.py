@@ -0,0 +1,176 @@
+import io
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+import gui_chatbot
+from conversation import ConversationHistory
+from response_cache import ResponseCache
+from tts_cache import TTSCache
+
+
+class FakeMusic:
+    # Stands in for pygame.mixer.music
+    def __init__(self):
+        self.loaded = []
+        self.calls = []
+
+    def load(self, source, namehint=""):
+        self.loaded.append((source, namehint))
+
+    def play(self):
+        self.calls.append("play")
+
+    def pause(self):
+        self.calls.append("pause")
+
+    def unpause(self):
+        self.calls.append("unpause")
+
+    def stop(self):
+        self.calls.append("stop")
+
+
+class FakeClient:
+    def __init__(self, reply):
+        self.reply = reply
+        self.chats = 0
+        self.spoken = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create_chat))
+        self.audio = SimpleNamespace(speech=SimpleNamespace(
+            with_streaming_response=SimpleNamespace(create=self.create_speech)
+        ))
+
+    def create_chat(self, model, messages):
+        self.chats += 1
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.reply))])
+
+    @contextmanager
+    def create_speech(self, model, voice, speed, response_format, input):
+        self.spoken.append(input)
+        yield SimpleNamespace(iter_bytes=lambda: iter([b"ID3", input.encode()]))
+
+
+class FakeButton:
+    def __init__(self):
+        self.text = "▶"
+
+    def configure(self, text):
+        self.text = text
+
+
+class FakeEntry:
+    def __init__(self, text):
+        self.text = text
+
+    def get(self):
+        return self.text
+
+    def delete(self, start, end):
+        self.text = ""
+
+
+class HeadlessGUI:
+    # The classic GUI's logic without any Tk widgets
+    send_message = gui_chatbot.CyberNinjaGUI.send_message
+    play_audio = gui_chatbot.CyberNinjaGUI.play_audio
+    toggle_audio = gui_chatbot.CyberNinjaGUI.toggle_audio
+    stop_audio = gui_chatbot.CyberNinjaGUI.stop_audio
+    get_system_prompt = gui_chatbot.CyberNinjaGUI.get_system_prompt
+
+    def __init__(self, client, cache_dir):
+        self.client = client
+        self.tts_cache = TTSCache(cache_dir)
+        self.response_cache = ResponseCache(cache_dir / "responses.db")
+        self.conversation = ConversationHistory()
+        self.personality = {"voice": "alloy", "formality": 0.7, "tech_level": 0.8, "humor": 0.3}
+        self.messages = []
+        self.play_button = FakeButton()
+        self.current_audio = None
+        self.is_playing = False
+
+    def append_message(self, message):
+        self.messages.append(message)
+
+    def ask(self, message):
+        self.chat_input = FakeEntry(message)
+        self.send_message()
+
+    def close(self):
+        self.tts_cache.close()
+        self.response_cache.close()
+
+
+@pytest.fixture
+def music(monkeypatch):
+    music = FakeMusic()
+    monkeypatch.setattr(gui_chatbot, "pygame", SimpleNamespace(mixer=SimpleNamespace(music=music)))
+    return music
+
+
+@pytest.fixture
+def make_gui(tmp_path):
+    guis = []
+
+    def make(reply):
+        gui = HeadlessGUI(FakeClient(reply), tmp_path / "cache")
+        guis.append(gui)
+        return gui
+
+    yield make
+    for gui in guis:
+        gui.close()
+
+
+def test_replies_are_played_straight_from_memory(make_gui, music, tmp_path):
+    gui = make_gui("Greetings, **user**.")
+    gui.ask("Hello")
+    assert gui.messages == ["You: Hello", "Cyber Ninja AI: Greetings, **user**."]
+    assert gui.client.spoken == ["Greetings, user."]
+    source, hint = music.loaded[0]
+    assert isinstance(source, io.BytesIO) and hint == "mp3"
+    assert source.getvalue() == b"ID3Greetings, user."
+    assert music.calls == ["play"]
+    assert gui.is_playing and gui.play_button.text == "⏸"
+    # Nothing is written for playback; the clip reaches disk only through the cache
+    gui.tts_cache.close()
+    assert [path.name for path in tmp_path.iterdir()] == ["cache"]
+    assert len(list((tmp_path / "cache").glob("*.mp3"))) == 1
+
+
+def test_a_repeated_exchange_reuses_the_reply_and_its_clip(make_gui, music):
+    first = make_gui("Greetings, user.")
+    first.ask("Hello")
+    first.tts_cache.writer.shutdown(wait=True)
+    # A fresh conversation asking the same thing, sharing the caches on disk
+    second = make_gui("A different reply.")
+    second.ask("Hello")
+    assert second.client.chats == 0
+    assert second.client.spoken == []
+    assert second.messages[-1] == "Cyber Ninja AI: Greetings, user."
+    assert music.loaded[-1][0].getvalue() == b"ID3Greetings, user."
+
+
+def test_a_reply_with_nothing_to_say_is_not_played(make_gui, music):
+    # A horizontal rule alone has nothing worth reading out
+    gui = make_gui("---")
+    gui.ask("Draw a line")
+    assert gui.client.spoken == []
+    assert music.loaded == []
+    assert gui.current_audio is None
+    gui.toggle_audio()
+    gui.stop_audio()
+    assert music.calls == []
+
+
+def test_pause_resume_and_stop(make_gui, music):
+    gui = make_gui("Greetings, user.")
+    gui.ask("Hello")
+    gui.toggle_audio()
+    assert not gui.is_playing and gui.play_button.text == "▶"
+    gui.toggle_audio()
+    assert gui.is_playing and gui.play_button.text == "⏸"
+    gui.stop_audio()
+    assert music.calls == ["play", "pause", "unpause", "stop"]
+    assert gui.play_button.text == "▶"
@@ -0,0 +1,72 @@
+import json
+import threading
+import time
+
+from metrics import LatencyMetrics, TurnTimer, timed
+
+
+def test_marks_keep_the_first_occurrence_and_stages_add_up():
+    timer = TurnTimer("r1")
+    timer.mark("chat_ttft")
+    time.sleep(0.01)
+    timer.mark("chat_ttft")
+    timer.add("audio_load", 0.25)
+    timer.add("audio_load", 0.25)
+    timer.count("tts_chars_removed", 3)
+    record = timer.record("cancelled")
+    assert record["request_id"] == "r1"
+    assert record["status"] == "cancelled"
+    assert record["timings_ms"]["chat_ttft"] < 10
+    assert record["timings_ms"]["audio_load"] == 500.0
+    assert record["counts"] == {"tts_chars_removed": 3}
+
+
+def test_overlapping_stages_count_wall_time_once():
+    timer = TurnTimer()
+
+    def work(seconds):
+        with timed(timer, "tts_synthesis", overlapping=True):
+            time.sleep(seconds)
+
+    threads = [threading.Thread(target=work, args=(0.1,)) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    work(0.05)
+    record = timer.record()
+    # Four parallel downloads plus one more, not five summed
+    assert 140 <= record["timings_ms"]["tts_synthesis"] <= record["timings_ms"]["total"]
+
+
+def test_timed_without_a_timer_does_nothing():
+    with timed(None, "anything"):
+        pass
+    with timed(None, "anything", overlapping=True):
+        pass
+
+
+def test_finish_records_a_turn_once_and_logs_it(tmp_path):
+    path = tmp_path / "metrics.jsonl"
+    metrics = LatencyMetrics(path)
+    timer = metrics.start("r1")
+    timer.mark("chat_total")
+    assert metrics.finish(timer)["request_id"] == "r1"
+    assert metrics.finish(timer, "error") is None
+    lines = path.read_text().splitlines()
+    assert len(lines) == 1
+    assert json.loads(lines[0])["status"] == "ok"
+    assert metrics.last["request_id"] == "r1"
+
+
+def test_percentiles_over_the_rolling_window():
+    metrics = LatencyMetrics(window=100)
+    for ms in range(1, 201):
+        timer = TurnTimer()
+        timer.add("chat_ttft", ms / 1000)
+        metrics.finish(timer)
+    latency = metrics.percentiles("chat_ttft")
+    # Only the last 100 samples, 101..200 ms
+    assert latency == {"p50": 151.0, "p95": 195.0, "p99": 199.0}
+    assert metrics.percentiles("missing") is None
+    assert set(metrics.summary()) == {"chat_ttft", "total"}
@@ -0,0 +1,71 @@
+import pytest
+
+import openai_client
+from mock_openai_server import MockConfig, MockOpenAIServer
+from openai_client import create_client, get_http_client, warm_up
+from rate_limiter import get_rate_limiter
+
+
+@pytest.fixture
+def fresh_pool(monkeypatch):
+    # Each test builds the shared pool from its own environment
+    for name in ("HTTP_PROXY", "HTTPS_PROXY", "ALL_PROXY", "NO_PROXY"):
+        monkeypatch.delenv(name, raising=False)
+        monkeypatch.delenv(name.lower(), raising=False)
+    monkeypatch.setattr(openai_client, "_shared_http_client", None)
+    yield
+    if openai_client._shared_http_client is not None:
+        openai_client._shared_http_client.close()
+
+
+def start_mock(**kwargs):
+    return MockOpenAIServer(MockConfig(latency_ms=5, token_rate=1000, reply_tokens=5, **kwargs)).start()
+
+
+def ask(client):
+    response = client.chat.completions.create(model="gpt-4", messages=[{"role": "user", "content": "Hi"}])
+    return response.choices[0].message.content
+
+
+def test_clients_share_one_warm_pool(fresh_pool):
+    mock = start_mock()
+    try:
+        first = create_client(base_url=mock.base_url, api_key="mock")
+        second = create_client(base_url=mock.base_url, api_key="other")
+        assert first._client is second._client is get_http_client()
+        for thread in warm_up(first):
+            thread.join(5)
+        assert mock.counts["/v1/models"] == 2
+        assert ask(second)
+    finally:
+        mock.stop()
+
+
+@pytest.mark.parametrize("status", [408, 429, 503])
+def test_failed_requests_are_retried_by_the_transport(fresh_pool, status):
+    mock = start_mock(fail_first=2, fail_status=status)
+    retries = get_rate_limiter().stats()["retries"]
+    try:
+        client = create_client(base_url=mock.base_url, api_key="mock")
+        assert ask(client)
+        # Two failures, then the answer: retried once each, not by the SDK as well
+        assert mock.counts["/v1/chat/completions"] == 3
+        assert get_rate_limiter().stats()["retries"] == retries + 2
+    finally:
+        mock.stop()
+
+
+def test_proxy_settings_are_honored(fresh_pool, monkeypatch):
+    # The mock server doubles as a plain HTTP proxy: it sees the full URL
+    proxy = start_mock()
+    direct = start_mock()
+    monkeypatch.setenv("HTTP_PROXY", proxy.base_url.rsplit("/", 1)[0])
+    monkeypatch.setenv("NO_PROXY", "localhost,127.0.0.1")
+    try:
+        assert ask(create_client(base_url="http://api.example.test/v1", api_key="mock"))
+        assert proxy.counts == {"http://api.example.test/v1/chat/completions": 1}
+        assert ask(create_client(base_url=direct.base_url, api_key="mock"))
+        assert direct.counts == {"/v1/chat/completions": 1}
+    finally:
+        proxy.stop()
+        direct.stop()
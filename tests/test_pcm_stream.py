@@ -0,0 +1,106 @@
+import threading
+
+from pcm_stream import PCM_FRAME_BYTES, PCMStreamPlayer
+
+
+class FakeEngine:
+    # Records what would have been played; queue_clip can be held to stand in
+    # for a speech channel that is still busy
+    def __init__(self):
+        self.clips = []
+        self.calls = []
+        self.busy = threading.Event()
+        self.busy.set()
+
+    def queue_clip(self, data, kind, cancelled=None, timer=None, on_start=None):
+        self.busy.wait(5)
+        self.clips.append(data)
+        self.calls.append("queue")
+        if on_start and len(self.clips) == 1:
+            on_start()
+
+    def drain(self, cancelled=None):
+        self.calls.append("drain")
+        return True
+
+    def wait_idle(self, cancelled=None):
+        self.calls.append("wait_idle")
+        return True
+
+
+def make_player(engine, **kwargs):
+    # 10 ms chunks: 240 frames
+    return PCMStreamPlayer(engine, chunk_ms=10, **kwargs)
+
+
+def test_chunks_play_in_order_and_a_partial_frame_is_dropped():
+    engine = FakeEngine()
+    finished = []
+    started = []
+    player = make_player(engine, on_start=lambda: started.append(True),
+                         on_finished=lambda p: finished.append(list(engine.calls)))
+    data = bytes(range(256)) * 8  # 2048 bytes: four whole chunks and some
+    for i in range(0, len(data), 100):
+        player.feed(data[i:i + 100])
+    player.feed(b"\x01")  # Half a frame
+    player.finish()
+    assert player.wait(5)
+
+    assert b"".join(engine.clips) == data
+    assert all(len(clip) == player.chunk_bytes for clip in engine.clips[:-1])
+    assert len(engine.clips[-1]) % PCM_FRAME_BYTES == 0
+    assert started == [True]
+    # The turn is reported once the audio was handed over, before it played out
+    assert finished == [["queue"] * len(engine.clips) + ["drain"]]
+    assert engine.calls[-1] == "wait_idle"
+
+
+def test_the_download_is_never_held_up_by_playback():
+    engine = FakeEngine()
+    previous = threading.Event()
+    player = make_player(engine, after=previous)
+    # The previous reply is still playing: feeding and finishing return at once
+    player.feed(b"\x00" * player.chunk_bytes * 20)
+    player.finish()
+    assert engine.clips == []
+    assert not player.wait(0.1)
+
+    # Once it is done, the buffered audio plays, paced by the engine
+    engine.busy.clear()
+    previous.set()
+    assert not player.wait(0.1)
+    engine.busy.set()
+    assert player.wait(5)
+    assert len(engine.clips) == 20
+
+
+def test_cancel_stops_playback_and_still_reports_the_turn():
+    engine = FakeEngine()
+    previous = threading.Event()
+    finished = threading.Event()
+    player = make_player(engine, after=previous,
+                         on_finished=lambda p: finished.set() if p.cancelled.is_set() else None)
+    player.feed(b"\x00" * player.chunk_bytes * 3)
+    player.cancel()
+    # Done straight away, so the next reply doesn't wait for this one
+    assert player.wait(0)
+    assert finished.wait(5)
+    player.feed(b"\x00" * player.chunk_bytes)
+    player.finish()
+    previous.set()
+    player.player.join(5)
+    assert engine.clips == []
+    assert "wait_idle" not in engine.calls
+
+
+def test_a_playback_error_cancels_the_player():
+    class BrokenEngine(FakeEngine):
+        def queue_clip(self, *args, **kwargs):
+            raise RuntimeError("device gone")
+
+    finished = []
+    player = make_player(BrokenEngine(), on_finished=lambda p: finished.append(p.cancelled.is_set()))
+    player.feed(b"\x00" * player.chunk_bytes)
+    player.finish()
+    assert player.wait(5)
+    assert finished == [True]
@@ -0,0 +1,133 @@
+import time
+
+import pytest
+
+from rate_limiter import RateLimitedTransport, RateLimiter, TokenBucket, httpx, parse_duration
+
+
+@pytest.mark.parametrize("value, seconds", [
+    ("1s", 1.0),
+    ("6m0s", 360.0),
+    ("250ms", 0.25),
+    ("1h2m3.5s", 3723.5),
+    ("2", 2.0),
+    ("", None),
+    (None, None),
+    ("soon", None),
+])
+def test_parse_duration(value, seconds):
+    assert parse_duration(value) == seconds
+
+
+def test_bucket_waits_for_refill():
+    bucket = TokenBucket(60)
+    bucket.available = 0.0
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    bucket.refill(bucket.updated + 0.5)
+    assert bucket.available == pytest.approx(0.5)
+    # Larger than the whole bucket: goes through once it is full
+    assert bucket.wait_time(1000) == pytest.approx(59.5)
+
+
+def test_sync_follows_the_server_both_ways():
+    bucket = TokenBucket(100)
+    now = time.monotonic()
+    bucket.sync(None, 10, now)
+    assert bucket.available == 10
+    bucket.sync(None, 80, now)
+    assert bucket.available == 80
+    # Never more than the (possibly new) limit
+    bucket.sync(50, 80, now)
+    assert bucket.capacity == 50
+    assert bucket.available == 50
+
+
+def test_observe_reads_rate_limit_headers():
+    limiter = RateLimiter()
+    limiter.observe("chat", {
+        "x-ratelimit-limit-requests": "100",
+        "x-ratelimit-remaining-requests": "7",
+        "x-ratelimit-limit-tokens": "bogus",
+    })
+    assert limiter.buckets["chat"]["requests"].capacity == 100
+    assert limiter.buckets["chat"]["requests"].available == 7
+    assert limiter.buckets["chat"]["tokens"].capacity == 30000
+
+
+def test_backoff_honors_retry_after_and_pauses_every_caller():
+    limiter = RateLimiter(max_delay=10)
+    assert limiter.backoff("tts", 0, {"retry-after": "2"}) == 2.0
+    assert limiter.backoff("tts", 0, {"retry-after-ms": "1500"}) == 1.5
+    assert limiter.backoff("tts", 0, {"retry-after": "1m"}) == 10
+    assert limiter.paused_until["tts"] > time.monotonic() + 9
+    assert limiter.paused_until["chat"] == 0.0
+    assert limiter.stats()["retries"] == 3
+
+
+def test_backoff_without_retry_after_is_jittered_and_capped():
+    limiter = RateLimiter(base_delay=0.5, max_delay=4)
+    delays = [limiter.backoff("chat", attempt, {}) for attempt in range(10)]
+    assert all(0 <= delay <= 4 for delay in delays)
+
+
+def test_transport_retries_rate_limited_requests():
+    statuses = [429, 503, 200]
+    seen = []
+
+    def handler(request):
+        seen.append(request.url.path)
+        return httpx.Response(statuses[len(seen) - 1], headers={"retry-after-ms": "1"}, json={})
+
+    limiter = RateLimiter()
+    transport = RateLimitedTransport(limiter, httpx.MockTransport(handler))
+    with httpx.Client(transport=transport, base_url="http://api.test/v1") as client:
+        response = client.post("/audio/speech", json={"input": "hello"})
+    assert response.status_code == 200
+    assert len(seen) == 3
+    stats = limiter.stats()
+    assert stats["retries"] == 2
+    assert stats["rate_limited"] == 1
+
+
+@pytest.mark.parametrize("failure", [
+    httpx.Response(408, headers={"retry-after-ms": "1"}),
+    httpx.Response(409, headers={"retry-after-ms": "1"}),
+    httpx.ReadTimeout("no response headers yet"),
+])
+def test_transport_retries_what_the_sdk_would(failure):
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        if len(seen) == 1:
+            if isinstance(failure, Exception):
+                raise failure
+            return failure
+        return httpx.Response(200, json={})
+
+    limiter = RateLimiter(base_delay=0.01)
+    transport = RateLimitedTransport(limiter, httpx.MockTransport(handler))
+    with httpx.Client(transport=transport, base_url="http://api.test/v1") as client:
+        response = client.post("/chat/completions", json={"messages": []})
+    assert response.status_code == 200
+    assert len(seen) == 2
+    assert limiter.stats()["retries"] == 1
+
+
+def test_transport_gives_up_after_max_retries():
+    limiter = RateLimiter(max_retries=2)
+    transport = RateLimitedTransport(limiter, httpx.MockTransport(
+        lambda request: httpx.Response(429, headers={"retry-after-ms": "1"})
+    ))
+    with httpx.Client(transport=transport, base_url="http://api.test/v1") as client:
+        response = client.post("/chat/completions", json={"messages": []})
+    assert response.status_code == 429
+    assert limiter.stats()["retries"] == 2
+
+
+def test_other_endpoints_are_not_limited():
+    limiter = RateLimiter()
+    transport = RateLimitedTransport(limiter, httpx.MockTransport(lambda request: httpx.Response(500)))
+    with httpx.Client(transport=transport, base_url="http://api.test/v1") as client:
+        assert client.get("/models").status_code == 500
+    assert limiter.stats()["requests"] == 0
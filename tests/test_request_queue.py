@@ -0,0 +1,122 @@
+import threading
+import time
+
+from request_queue import RequestQueue
+
+
+def make_queue(handler, max_workers=3):
+    posted = []
+    queue = RequestQueue(handler, lambda kind, *args: posted.append((kind, *args)), max_workers=max_workers)
+    return queue, posted
+
+
+def wait_all(requests):
+    for request in requests:
+        request.future.result(timeout=5)
+
+
+def test_events_are_posted_in_submission_order():
+    queue = None
+
+    def handler(request):
+        # Later requests finish first
+        time.sleep(0.01 * (5 - request.message))
+        queue.emit(request, "token", request.message, "a")
+        queue.emit(request, "token", request.message, "b")
+
+    queue, posted = make_queue(handler)
+    wait_all([queue.submit(i) for i in range(5)])
+    assert posted == [("token", i, part) for i in range(5) for part in "ab"]
+    assert queue.pending() == 0
+    queue.shutdown()
+
+
+def test_head_posts_straight_away_and_later_requests_wait():
+    release = threading.Event()
+    queue = None
+
+    def handler(request):
+        if request.message == "first":
+            queue.emit(request, "token", "first")
+            release.wait(5)
+        else:
+            queue.emit(request, "token", "second")
+
+    queue, posted = make_queue(handler)
+    first = queue.submit("first")
+    second = queue.submit("second")
+    second.future.result(timeout=5)
+    assert posted == [("token", "first")]
+    release.set()
+    first.future.result(timeout=5)
+    assert posted == [("token", "first"), ("token", "second")]
+    queue.shutdown()
+
+
+def test_cancel_releases_attached_resources():
+    class Resource:
+        closed = False
+
+        def close(self):
+            self.closed = True
+
+    started = threading.Event()
+    resource = Resource()
+    late = Resource()
+
+    def handler(request):
+        request.attach(resource)
+        started.set()
+        request.cancelled.wait(5)
+        request.attach(late)
+
+    queue, _ = make_queue(handler)
+    request = queue.submit("hello")
+    assert started.wait(5)
+    assert queue.cancel() is request
+    request.future.result(timeout=5)
+    assert request.cancelled.is_set()
+    # Attached after the cancel: released on the spot
+    assert resource.closed and late.closed
+    queue.shutdown()
+
+
+def test_cancelled_request_does_not_block_later_turns():
+    context = []
+    gate = threading.Event()
+
+    def handler(request):
+        if request.message == 0:
+            gate.wait(5)
+        if not request.wait_for_previous_turn():
+            return
+        context.append(request.message)
+        request.end_turn()
+
+    queue, _ = make_queue(handler, max_workers=4)
+    requests = [queue.submit(i) for i in range(6)]
+    requests[3].cancel()
+    gate.set()
+    wait_all(requests)
+    assert context == [0, 1, 2, 4, 5]
+    queue.shutdown()
+
+
+def test_turns_are_recorded_in_order_while_requests_overlap():
+    context = []
+    seen = {}
+
+    def handler(request):
+        if not request.wait_for_previous_turn():
+            return
+        seen[request.message] = list(context)
+        time.sleep(0.005 * (request.message % 3))
+        context.append(request.message)
+        request.end_turn()
+
+    queue, _ = make_queue(handler)
+    wait_all([queue.submit(i) for i in range(8)])
+    assert context == list(range(8))
+    # Every turn was built with all the turns before it
+    assert all(seen[i] == list(range(i)) for i in range(8))
+    queue.shutdown()
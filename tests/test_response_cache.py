@@ -0,0 +1,74 @@
+import pytest
+
+import response_cache
+from response_cache import ResponseCache, normalize_text
+
+
+def request(message, context=()):
+    return [{"role": "system", "content": "Be brief."}, *context, {"role": "user", "content": message}]
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = ResponseCache(tmp_path / "responses.db", max_entries=3)
+    yield cache
+    cache.close()
+
+
+def test_normalize_text():
+    assert normalize_text("  What can   you DO?! ") == "what can you do"
+    assert normalize_text("Hello.\n") == "hello"
+
+
+def test_same_question_with_different_spelling_hits(cache):
+    cache.put(cache.make_key("gpt-4", request("What can you do?")), "gpt-4", "Plenty.")
+    assert cache.get(cache.make_key("gpt-4", request("what can you do"))) == "Plenty."
+    assert cache.stats() == {"hits": 1, "misses": 0, "entries": 1}
+
+
+def test_context_and_model_are_part_of_the_key(cache):
+    key = cache.make_key("gpt-4", request("Why?"))
+    assert cache.make_key("gpt-3.5-turbo", request("Why?")) != key
+    earlier = [{"role": "user", "content": "Tell me a fact."}, {"role": "assistant", "content": "Sky is blue."}]
+    assert cache.make_key("gpt-4", request("Why?", earlier)) != key
+    # Only the last message is normalized
+    shouted = [{"role": "user", "content": "TELL ME A FACT."}, earlier[1]]
+    assert cache.make_key("gpt-4", request("Why?", shouted)) != cache.make_key("gpt-4", request("Why?", earlier))
+
+
+def test_replies_expire(cache, monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr(response_cache.time, "time", lambda: now)
+    cache.put("key", "gpt-4", "Old news.")
+    now += cache.ttl - 1
+    assert cache.get("key") == "Old news."
+    now += 2
+    assert cache.get("key") is None
+    # Expired rows are dropped on the next write
+    cache.put("other", "gpt-4", "Fresh.")
+    assert cache.stats()["entries"] == 1
+
+
+def test_least_recently_used_replies_are_dropped(cache, monkeypatch):
+    now = 1_000_000.0
+    monkeypatch.setattr(response_cache.time, "time", lambda: now)
+    for key in "abc":
+        now += 1
+        cache.put(key, "gpt-4", key.upper())
+    now += 1
+    assert cache.get("a") == "A"
+    now += 1
+    cache.put("d", "gpt-4", "D")
+    assert cache.get("b") is None
+    assert [cache.get(key) for key in "acd"] == ["A", "C", "D"]
+
+
+def test_replies_survive_reopening(tmp_path):
+    cache = ResponseCache(tmp_path / "responses.db")
+    cache.put("key", "gpt-4", "Kept.")
+    cache.close()
+    reopened = ResponseCache(tmp_path / "responses.db")
+    assert reopened.get("key") == "Kept."
+    reopened.clear()
+    assert reopened.get("key") is None
+    reopened.close()
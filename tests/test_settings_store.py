@@ -0,0 +1,133 @@
+import json
+import time
+
+import pytest
+
+from settings_store import SCHEMA, SCHEMA_VERSION, SettingsStore, build_system_prompt, validate
+
+
+@pytest.mark.parametrize("key, value, expected", [
+    ("voice", "nova", "nova"),
+    ("volume", 1, 1.0),
+    ("humor", 0.33333, 0.33),
+    ("stream_responses", False, False),
+    ("history_tokens", 4000, 4000),
+    ("max_concurrent_requests", 4.0, 4),
+    ("not_in_schema", [1, 2], [1, 2]),
+])
+def test_valid_values_are_coerced(key, value, expected):
+    result = validate(key, value)
+    assert result == expected
+    assert type(result) is type(expected)
+
+
+@pytest.mark.parametrize("key, value", [
+    ("voice", "robot"),
+    ("voice", 3),
+    ("volume", 1.5),
+    ("volume", "loud"),
+    ("volume", True),
+    ("volume", float("nan")),
+    ("voice_speed", float("inf")),
+    ("humor", float("-inf")),
+    ("stream_responses", 1),
+    ("history_tokens", 50),
+    ("max_concurrent_requests", 1.5),
+    ("tts_cache_mb", float("inf")),
+    ("response_cache_entries", float("nan")),
+    ("custom_prompt", None),
+])
+def test_invalid_values_are_rejected(key, value):
+    with pytest.raises(ValueError):
+        validate(key, value)
+
+
+def test_defaults_pass_their_own_schema():
+    for key, (default, _) in SCHEMA.items():
+        assert validate(key, default) == default
+
+
+def test_load_keeps_valid_values_and_falls_back_on_invalid_ones(tmp_path, capsys):
+    path = tmp_path / "settings.json"
+    # json writes float("nan") as NaN, as a hand edit might
+    path.write_text(json.dumps({"voice": "echo", "volume": 7, "max_concurrent_requests": 2.5, "extra": 1,
+                                "voice_speed": float("nan")}))
+    store = SettingsStore(path)
+    store.load()
+    assert store["voice"] == "echo"
+    assert store["volume"] == SCHEMA["volume"][0]
+    assert store["max_concurrent_requests"] == SCHEMA["max_concurrent_requests"][0]
+    assert store["voice_speed"] == SCHEMA["voice_speed"][0]
+    assert store["extra"] == 1
+    assert capsys.readouterr().out.count("Ignoring setting") == 3
+
+
+def test_unreadable_file_is_kept_aside(tmp_path):
+    path = tmp_path / "settings.json"
+    path.write_text("{not json")
+    store = SettingsStore(path)
+    store.load()
+    assert store["voice"] == "alloy"
+    assert not path.exists()
+    assert (tmp_path / "settings.json.bad").read_text() == "{not json"
+
+
+def test_saves_are_debounced_and_atomic(tmp_path):
+    path = tmp_path / "settings.json"
+    store = SettingsStore(path, save_delay=0.05)
+    for volume in (0.1, 0.2, 0.3):
+        store.set("volume", volume)
+    assert not path.exists()
+    time.sleep(0.3)
+    data = json.loads(path.read_text())
+    assert data["volume"] == 0.3
+    assert data["version"] == SCHEMA_VERSION
+    assert [p.name for p in tmp_path.iterdir()] == ["settings.json"]
+
+    reloaded = SettingsStore(path)
+    reloaded.load()
+    assert reloaded["volume"] == 0.3
+    assert "version" not in reloaded.values
+
+
+def test_flush_writes_a_pending_save_straight_away(tmp_path):
+    path = tmp_path / "settings.json"
+    store = SettingsStore(path, save_delay=60)
+    store.set("theme", "Dark")
+    store.flush()
+    assert json.loads(path.read_text())["theme"] == "Dark"
+
+
+def test_subscribers_see_only_real_changes_to_their_keys(tmp_path):
+    store = SettingsStore(tmp_path / "settings.json", save_delay=60)
+    voice_changes, all_changes = [], []
+    store.subscribe(lambda key, value: voice_changes.append(value), keys=["voice"])
+    store.subscribe(lambda key, value: all_changes.append(key))
+    assert store.set("voice", "onyx")
+    assert not store.set("voice", "onyx")
+    store.set("humor", 0.9)
+    assert voice_changes == ["onyx"]
+    assert all_changes == ["voice", "humor"]
+    with pytest.raises(ValueError):
+        store.set("voice", "robot")
+    store.flush()
+
+
+def test_derived_values_are_rebuilt_after_their_keys_change(tmp_path):
+    store = SettingsStore(tmp_path / "settings.json", save_delay=60)
+    builds = []
+
+    def build(settings):
+        builds.append(1)
+        return build_system_prompt(settings)
+
+    prompt = store.derived(["humor", "custom_prompt"], build)
+    assert prompt() is prompt()
+    assert "- Humor: 0.3" in prompt()
+    store.set("voice", "nova")
+    prompt()
+    assert len(builds) == 1
+    store.set("humor", 0.9)
+    assert "- Humor: 0.9" in prompt()
+    assert len(builds) == 2
+    store.flush()
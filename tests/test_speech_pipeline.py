@@ -0,0 +1,90 @@
+import threading
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+from speech_pipeline import SentenceSplitter, SpeechPipeline
+
+
+class SlowSpeechClient:
+    # The audio for a sentence is the sentence itself; shorter sentences take
+    # longer, so clips finish synthesizing out of order
+    def __init__(self):
+        self.audio = SimpleNamespace(speech=SimpleNamespace(
+            with_streaming_response=SimpleNamespace(create=self.create)
+        ))
+
+    @contextmanager
+    def create(self, model, voice, speed, response_format, input):
+        time.sleep(max(0.0, 0.1 - len(input) / 1000))
+        yield SimpleNamespace(iter_bytes=lambda: iter([input.encode()]))
+
+
+def test_splitter_merges_short_sentences_and_keeps_the_rest():
+    splitter = SentenceSplitter(min_length=20)
+    assert splitter.feed("Greetings. I am a cyber ninja. And") == ["Greetings. I am a cyber ninja."]
+    assert splitter.feed(" you are?\n\nNew para") == []
+    assert splitter.flush() == ["And you are?\n\nNew para"]
+    assert splitter.flush() == []
+
+
+def test_clips_play_in_order_after_the_previous_reply():
+    played = []
+    previous = threading.Event()
+    pipeline = SpeechPipeline(SlowSpeechClient(), lambda audio, p: played.append(audio.decode()),
+                              max_workers=3, after=SimpleNamespace(wait=previous.wait))
+    pipeline.feed("This first sentence is rather long, as sentences go. The second one is short!")
+    pipeline.feed(" And a **third** one to finish.")
+    pipeline.close()
+    assert not pipeline.wait(0.3)
+    assert played == []
+    previous.set()
+    assert pipeline.wait(5)
+    assert played == [
+        "This first sentence is rather long, as sentences go.",
+        "The second one is short!",
+        "And a third one to finish."
+    ]
+
+
+def test_on_finished_runs_once_playback_ends():
+    finished = []
+    pipeline = SpeechPipeline(SlowSpeechClient(), lambda audio, p: None, on_finished=finished.append)
+    pipeline.feed("Just one sentence to say.")
+    pipeline.close()
+    assert pipeline.wait(5)
+    assert finished == [pipeline]
+
+
+def test_cancel_stops_playback_and_later_submits():
+    played = []
+    pipeline = SpeechPipeline(SlowSpeechClient(), lambda audio, p: played.append(audio))
+    pipeline.cancel()
+    # The chat worker may still be feeding when the Tk thread cancels
+    pipeline.feed("A sentence that arrives too late.")
+    pipeline.close()
+    assert pipeline.wait(5)
+    assert played == []
+
+
+@pytest.mark.parametrize("attempt", range(5))
+def test_cancel_racing_submit_never_raises(attempt):
+    pipeline = SpeechPipeline(SlowSpeechClient(), lambda audio, p: None)
+    errors = []
+
+    def feed():
+        try:
+            for i in range(200):
+                pipeline.submit(f"Sentence number {i}.")
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=feed)
+    thread.start()
+    pipeline.cancel()
+    thread.join(5)
+    pipeline.close()
+    assert errors == []
+    assert pipeline.wait(5)
@@ -0,0 +1,80 @@
+import pytest
+
+from speech_text import SpeechNormalizer, normalize_for_speech
+
+REPLY = """# Setup
+
+Install it with `pip`, e.g. in a venv. See [the docs](https://docs.example.com/install) or https://www.example.com/faq.
+
+```python
+import app
+app.run()
+```
+
+| Option | Default |
+|--------|---------|
+| debug  | off     |
+
+- **Fast** start
+- Small footprint
+
+---
+> Quoted advice.
+"""
+
+
+def spoken(text):
+    return normalize_for_speech(text)[0]
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("Plain sentence.", "Plain sentence."),
+    ("Some **bold** and *italic* and `code`.", "Some bold and italic and code."),
+    ("Read [the guide](http://x.com/guide).", "Read the guide."),
+    ("![diagram](img.png) shows it", "diagram shows it"),
+    ("Go to https://www.example.com/a/b?q=1.", "Go to example.com."),
+    ("Fruit, e.g. apples, i.e. food, etc. and more", "Fruit, for example apples, that is food, et cetera and more"),
+    ("cats vs dogs", "cats versus dogs"),
+])
+def test_inline_markdown(text, expected):
+    assert spoken(text) == expected
+
+
+def test_code_blocks_are_summarized():
+    assert spoken("Look:\n```js\na()\nb()\nc()\n```\nDone.") == \
+        "Look:\nThere's a 3-line js code block on screen.\n\nDone."
+    # An unterminated block still gets its summary
+    assert spoken("```\nx = 1") == "There's a 1-line code block on screen."
+
+
+def test_headings_lists_and_tables_become_sentences():
+    assert spoken("## Steps\n1. Open it\n2) Close it\n* Done") == "Steps.\nOpen it.\nClose it.\nDone."
+    assert spoken("| a | b |\n|---|:-:|\n| 1 | 2 |") == "a, b.\n1, 2."
+    assert spoken("Above\n\n***\n\n> Quote") == "Above\n\n\nQuote"
+
+
+def test_removed_characters_are_counted():
+    text, removed = normalize_for_speech(REPLY)
+    assert "import app" not in text
+    assert removed > len("import app\napp.run()")
+
+
+@pytest.mark.parametrize("size", [1, 3, 7, 50])
+def test_streamed_deltas_match_the_whole_reply(size):
+    normalizer = SpeechNormalizer()
+    out = "".join(normalizer.feed(REPLY[i:i + size]) for i in range(0, len(REPLY), size))
+    out += normalizer.flush()
+    assert out.strip() == spoken(REPLY)
+
+
+def test_finished_sentences_are_released_before_the_line_ends():
+    normalizer = SpeechNormalizer()
+    assert normalizer.feed("First sentence. Second") == "First sentence. "
+    assert normalizer.feed(" one.") == ""
+    assert normalizer.flush() == "Second one.\n"
+
+
+def test_possible_code_or_table_lines_are_held_back():
+    normalizer = SpeechNormalizer()
+    assert normalizer.feed("`` Not done. ") == ""
+    assert normalizer.feed("| a. b ") == ""
@@ -0,0 +1,101 @@
+import sys
+
+import pytest
+
+import startup_check
+
+# Stands in for the built app: writes the report the real one writes once its
+# window is up
+FAKE_APP = """
+import json, os, sys, time
+report = os.environ.get("CYBER_NINJA_STARTUP_REPORT")
+if "--no-report" in sys.argv:
+    sys.stderr.write("Traceback: no display")
+    sys.exit(2)
+if "--hang" in sys.argv:
+    time.sleep(30)
+with open(report, "w") as f:
+    json.dump({"timestamp": time.time(), "timings_ms": {"first_frame": 100.0, "ready": 250.0}}, f)
+"""
+
+
+def fake_app(*args):
+    return [sys.executable, "-c", FAKE_APP, *args]
+
+
+def test_launch_adds_interpreter_startup_to_the_app_timings():
+    result = startup_check.launch(fake_app(), timeout=30)
+    assert result["interpreter"] >= 0
+    assert result["window"] - result["interpreter"] == pytest.approx(100.0)
+    assert result["ready"] - result["interpreter"] == pytest.approx(250.0)
+
+
+def test_launch_without_a_report_shows_why(capsys):
+    assert startup_check.launch(fake_app("--no-report"), timeout=30) is None
+    out = capsys.readouterr().out
+    assert "Exited with code 2" in out
+    assert "no display" in out
+
+
+def test_launch_gives_up_on_a_hung_app(capsys):
+    assert startup_check.launch(fake_app("--hang"), timeout=1) is None
+    assert "Timed out" in capsys.readouterr().out
+
+
+@pytest.fixture
+def run_main(monkeypatch):
+    monkeypatch.setattr(startup_check, "display_prefix", lambda: [])
+
+    def run(*args):
+        monkeypatch.setattr(sys, "argv", ["startup_check.py", *args, "--", *fake_app()])
+        return startup_check.main()
+
+    return run
+
+
+def test_first_launch_is_checked_against_the_limit(run_main, capsys):
+    assert run_main("--runs", "2", "--max-window-ms", "60000") == 0
+    out = capsys.readouterr().out
+    assert "Run 1 (first launch)" in out and "Run 2 (warm)" in out
+    assert "OK: first launch" in out
+
+    assert run_main("--runs", "1", "--max-window-ms", "0") == 1
+    assert "FAIL: first launch" in capsys.readouterr().out
+
+
+def test_only_a_dropped_cache_counts_as_a_cold_start(run_main, monkeypatch, capsys):
+    dropped = []
+    monkeypatch.setattr(startup_check, "drop_caches", lambda: dropped.append(True))
+    assert run_main("--runs", "2", "--drop-caches", "--max-window-ms", "60000") == 0
+    out = capsys.readouterr().out
+    assert dropped == [True]
+    assert "Run 1 (cold start)" in out and "OK: cold start" in out
+
+
+def test_drop_caches_needs_linux(monkeypatch):
+    monkeypatch.setattr(startup_check.sys, "platform", "darwin")
+    with pytest.raises(SystemExit, match="only supported on Linux"):
+        startup_check.drop_caches()
+
+
+def test_drop_caches_explains_a_permission_error(monkeypatch):
+    def denied(path, mode="r"):
+        raise PermissionError(13, "Permission denied", path)
+
+    monkeypatch.setattr(startup_check.sys, "platform", "linux")
+    monkeypatch.setattr(startup_check.subprocess, "run", lambda *args, **kwargs: None)
+    monkeypatch.setattr(startup_check, "open", denied, raising=False)
+    with pytest.raises(SystemExit, match="run as root"):
+        startup_check.drop_caches()
+
+
+def test_display_prefix_uses_xvfb_only_without_a_display(monkeypatch):
+    monkeypatch.setattr(startup_check.sys, "platform", "linux")
+    monkeypatch.setattr(startup_check.shutil, "which", lambda name: "/usr/bin/xvfb-run")
+    monkeypatch.setenv("DISPLAY", ":0")
+    assert startup_check.display_prefix() == []
+    monkeypatch.delenv("DISPLAY")
+    assert startup_check.display_prefix() == ["/usr/bin/xvfb-run", "-a"]
+    monkeypatch.setattr(startup_check.shutil, "which", lambda name: None)
+    with pytest.raises(SystemExit, match="xvfb-run is not installed"):
+        startup_check.display_prefix()
@@ -0,0 +1,179 @@
+import pytest
+
+from chat_log import ChatLog
+from transcript_view import TranscriptView
+
+REPLY = "Cyber Ninja AI: "
+
+
+class FakeText:
+    # Just enough of a Tk text widget: "line.column" indices, "end", and a
+    # scroll position of VISIBLE lines starting at top
+    VISIBLE = 20
+
+    def __init__(self):
+        self.content = ""
+        self.top = 1
+        self.tags = {}
+
+    def lines(self):
+        return (self.content + "\n").split("\n")
+
+    def offset(self, index):
+        if index == "end":
+            return len(self.content)
+        line, column = map(int, index.split("."))
+        lines = self.lines()
+        if line > len(lines):
+            return len(self.content)
+        return sum(len(text) + 1 for text in lines[:line - 1]) + column
+
+    def configure(self, **options):
+        pass
+
+    def insert(self, index, text):
+        at = self.offset(index)
+        self.content = self.content[:at] + text + self.content[at:]
+
+    def delete(self, start, end):
+        start, end = self.offset(start), self.offset(end)
+        self.content = self.content[:start] + self.content[end:]
+
+    def yview(self, *args):
+        if args:
+            self.top = max(1, int(args[0].split(".")[0]))
+            return None
+        count = len(self.lines())
+        return (self.top - 1) / count, min(1.0, (self.top - 1 + self.VISIBLE) / count)
+
+    def index(self, index):
+        return f"{self.top}.0"
+
+    def see(self, index):
+        self.top = max(1, len(self.lines()) - self.VISIBLE + 1)
+
+    def scroll_to_top(self):
+        self.top = 1
+
+    def after(self, ms, callback):
+        pass
+
+    def tag_config(self, tag, **options):
+        pass
+
+    def tag_add(self, tag, start, end):
+        self.tags[tag] = (start, end)
+
+
+class Chat:
+    # A session in the log and a view of it, kept in step like the GUI does
+    def __init__(self, tmp_path):
+        self.log = ChatLog(tmp_path / "chats.db")
+        self.text = FakeText()
+        self.view = TranscriptView(self.text, self.log, max_messages=30, page_messages=10)
+        self.session = self.log.start_session()
+        self.view.reset(self.session, [])
+        self.messages = []
+
+    def send(self, message):
+        self.messages.append(message)
+        self.log.append(self.session, [message])
+        self.view.append([message])
+
+    def stream(self, *parts, finish=True):
+        self.view.begin_partial(REPLY)
+        for part in parts:
+            self.view.write_partial(part)
+        if finish:
+            self.finish_stream("".join(parts))
+
+    def finish_stream(self, reply):
+        line = REPLY + reply
+        self.messages.append(line)
+        self.log.append(self.session, [line])
+        self.view.end_partial(line)
+
+    def shown(self):
+        # The widget must hold exactly the messages the view says it does
+        view = self.view
+        expected = self.messages[view.first_seq:view.first_seq + len(view.heights)]
+        text = self.text.content
+        if view.partial:
+            text = text[:text.rindex(REPLY)]
+        assert text == "".join(f"{message}\n" for message in expected)
+        return expected
+
+    def scroll_up(self, times=1):
+        for _ in range(times):
+            self.text.scroll_to_top()
+            self.view.check_scroll()
+
+    def scroll_down(self, times=1):
+        for _ in range(times):
+            self.text.see("end")
+            self.view.check_scroll()
+
+
+@pytest.fixture
+def chat(tmp_path):
+    chat = Chat(tmp_path)
+    for i in range(100):
+        if i % 3 == 0:
+            chat.stream(f"reply {i}", "\nwith a second line")
+        else:
+            chat.send(f"You: message {i}" + "\nmore" * (i % 4))
+    yield chat
+    chat.log.close()
+
+
+def test_widget_keeps_only_the_latest_window(chat):
+    shown = chat.shown()
+    assert len(shown) == 30
+    assert shown[-1] == chat.messages[-1]
+    assert chat.view.following
+
+
+def test_scrolling_up_pages_in_older_messages_and_back(chat):
+    chat.scroll_up(20)
+    assert chat.view.first_seq == 0
+    assert not chat.view.following
+    assert len(chat.shown()) == 30
+
+    chat.scroll_down(20)
+    assert chat.view.following
+    assert chat.shown()[-1] == chat.messages[-1]
+
+
+def test_messages_arriving_while_scrolled_up_show_on_the_way_back(chat):
+    chat.scroll_up(3)
+    assert not chat.view.following
+    top = chat.shown()
+    chat.send("You: sent while reading")
+    chat.stream("answered while reading")
+    assert chat.shown() == top
+
+    chat.scroll_down(20)
+    assert chat.shown()[-2:] == ["You: sent while reading", REPLY + "answered while reading"]
+
+
+def test_scrolling_away_mid_reply_drops_the_partial_text(chat):
+    chat.stream("half of a rep", finish=False)
+    chat.scroll_up(5)
+    assert not chat.view.partial
+    chat.shown()
+    chat.finish_stream("half of a reply")
+    chat.scroll_down(20)
+    assert chat.shown()[-1] == REPLY + "half of a reply"
+
+
+def test_show_opens_the_window_around_a_message_and_highlights_it(chat):
+    chat.view.show(chat.session, 42)
+    shown = chat.shown()
+    assert chat.messages[42] in shown
+    assert not chat.view.following
+    start, end = chat.text.tags["highlight"]
+    lines = chat.text.lines()[int(start.split(".")[0]) - 1:int(end.split(".")[0]) - 1]
+    assert "\n".join(lines) == chat.messages[42]
+
+    chat.view.show(chat.session, len(chat.messages) - 1)
+    assert chat.view.following
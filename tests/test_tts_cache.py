@@ -0,0 +1,194 @@
+import json
+import threading
+from contextlib import contextmanager
+from types import SimpleNamespace
+
+import pytest
+
+import tts_cache
+from metrics import TurnTimer
+from tts_cache import TTSCache, split_text
+
+
+class FakeSpeechClient:
+    # Stands in for client.audio.speech.with_streaming_response.create; the
+    # audio for a text is the text itself, sent in two pieces
+    def __init__(self, fail_on=None, hold_on=None):
+        self.requests = []
+        self.fail_on = fail_on
+        # Requests for text containing hold_on wait until release is set
+        self.hold_on = hold_on
+        self.release = threading.Event()
+        self.lock = threading.Lock()
+        self.audio = SimpleNamespace(speech=SimpleNamespace(
+            with_streaming_response=SimpleNamespace(create=self.create)
+        ))
+
+    @contextmanager
+    def create(self, model, voice, speed, response_format, input):
+        with self.lock:
+            self.requests.append(input)
+        if self.fail_on and self.fail_on in input:
+            raise RuntimeError("synthesis failed")
+        if self.hold_on and self.hold_on in input:
+            self.release.wait(5)
+        data = input.encode()
+        yield SimpleNamespace(iter_bytes=lambda: iter([data[:1], data[1:]]))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = TTSCache(tmp_path / "cache", max_bytes=30)
+    yield cache
+    cache.close()
+
+
+def test_least_recently_used_clips_are_evicted(cache):
+    for name in "abc":
+        cache.put(name, b"x" * 10)
+    # Reading "a" makes "b" the least recently used
+    assert cache.get("a") == b"x" * 10
+    cache.put("d", b"x" * 10)
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["bytes"] == 30
+    assert not (cache.cache_dir / "b.mp3").exists()
+
+
+def test_oversized_clip_is_kept_alone(cache):
+    cache.put("a", b"x" * 10)
+    cache.put("big", b"x" * 100)
+    assert cache.stats()["entries"] == 1
+    assert cache.get("big") is not None
+
+
+def test_zero_budget_never_writes(tmp_path):
+    cache = TTSCache(tmp_path, max_bytes=0)
+    assert cache.put("a", b"audio") is None
+    cache.write_later("b", b"audio")
+    cache.close()
+    assert cache.stats()["entries"] == 0
+
+
+def test_hits_save_the_index_later_not_on_every_hit(tmp_path):
+    cache = TTSCache(tmp_path, max_bytes=100)
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    saved = cache.index_file.read_text()
+    assert cache.get("a") == b"1"
+    assert cache.index_file.read_text() == saved
+    assert cache.save_timer is not None
+    cache.close()
+    # The hit moved "a" to the most recently used end
+    assert list(json.loads(cache.index_file.read_text())) == ["b", "a"]
+
+    reopened = TTSCache(tmp_path, max_bytes=100)
+    assert list(reopened.entries) == ["b", "a"]
+    reopened.close()
+
+
+def test_hits_are_served_while_a_clip_is_being_written(tmp_path, monkeypatch):
+    cache = TTSCache(tmp_path, max_bytes=100)
+    cache.put("a", b"1")
+    writing = threading.Event()
+    release = threading.Event()
+
+    def slow_open(path, mode="r", *args, **kwargs):
+        if str(path).endswith(".part"):
+            writing.set()
+            release.wait(5)
+        return open(path, mode, *args, **kwargs)
+
+    monkeypatch.setattr(tts_cache, "open", slow_open, raising=False)
+    writer = threading.Thread(target=cache.put, args=("b", b"2"))
+    writer.start()
+    assert writing.wait(5)
+    assert cache.get("a") == b"1"
+    assert cache.lookup("b") is None
+    release.set()
+    writer.join(5)
+    assert cache.get("b") == b"2"
+    assert list(json.loads(cache.index_file.read_text())) == ["a", "b"]
+    assert list(tmp_path.glob("*.part")) == []
+    cache.close()
+
+
+def test_index_skips_clips_deleted_behind_its_back(tmp_path):
+    cache = TTSCache(tmp_path, max_bytes=100)
+    cache.put("a", b"1")
+    cache.put("b", b"2")
+    cache.close()
+    (tmp_path / "a.mp3").unlink()
+    reopened = TTSCache(tmp_path, max_bytes=100)
+    assert list(reopened.entries) == ["b"]
+    reopened.close()
+
+
+def test_speech_downloads_once_and_then_hits(tmp_path):
+    cache = TTSCache(tmp_path)
+    client = FakeSpeechClient()
+    timer = TurnTimer()
+    assert cache.speech(client, "Hello there.", "alloy", timer=timer) == b"Hello there."
+    assert cache.speech(client, "Hello there.", "alloy", timer=timer) == b"Hello there."
+    assert client.requests == ["Hello there."]
+    assert "tts_cache_hit" in timer.marks
+    assert cache.speech(client, "Hello there.", "nova") == b"Hello there."
+    assert len(client.requests) == 2
+    cache.close()
+    assert cache.stats()["entries"] == 2
+
+
+def test_cancelled_download_returns_none(tmp_path):
+    cache = TTSCache(tmp_path)
+    cancelled = threading.Event()
+    cancelled.set()
+    assert cache.speech(FakeSpeechClient(), "Hello", "alloy", cancelled=cancelled) is None
+    cache.close()
+    assert cache.stats()["entries"] == 0
+
+
+def test_long_text_is_chunked_and_stitched_in_order(tmp_path):
+    cache = TTSCache(tmp_path, chunk_chars=25)
+    client = FakeSpeechClient()
+    text = "First sentence here. Second sentence here. Third sentence here."
+    pieces = []
+    audio = cache.speech(client, text, "alloy", on_chunk=pieces.append)
+    chunks = split_text(text, 25)
+    assert len(chunks) == 3
+    assert audio == "".join(chunks).encode()
+    assert b"".join(pieces) == audio
+    assert sorted(client.requests) == sorted(chunks)
+    cache.close()
+
+
+def test_failed_chunk_stops_its_siblings(tmp_path):
+    cache = TTSCache(tmp_path, chunk_chars=25, max_workers=1)
+    client = FakeSpeechClient(fail_on="First", hold_on="Second")
+    text = "First sentence here. Second sentence here. Third sentence here."
+    with pytest.raises(RuntimeError):
+        cache.speech(client, text, "alloy")
+    client.release.set()
+    cache.close()
+    # The second chunk's download was dropped and the third, still queued
+    # behind it, never started
+    assert sorted(client.requests) == ["First sentence here.", "Second sentence here."]
+    assert cache.stats()["entries"] == 0
+
+
+@pytest.mark.parametrize("text, max_chars, expected", [
+    ("Short text.", 100, ["Short text."]),
+    ("One. Two. Three.", 9, ["One. Two.", "Three."]),
+    ("Para one.\n\nPara two.", 100, ["Para one. Para two."]),
+    ("Para one.\n\nPara two.", 12, ["Para one.", "Para two."]),
+    ("abcdefghij", 4, ["abcd", "efgh", "ij"]),
+    ("", 10, []),
+])
+def test_split_text(text, max_chars, expected):
+    assert split_text(text, max_chars) == expected
+
+
+def test_split_text_keeps_chunks_within_limit():
+    text = ("A fairly long sentence that keeps going. " * 40) + "\n\n" + "word " * 300
+    chunks = split_text(text, 120)
+    assert all(len(chunk) <= 120 for chunk in chunks)
+    assert " ".join(chunks).split() == text.split()
@@ -0,0 +1,115 @@
+import itertools
+import threading
+
+import ui_queue
+from ui_queue import ACTIVE_INTERVAL_MS, IDLE_INTERVAL_MS, UIEventQueue
+
+
+class FakeRoot:
+    # Records Tk after() calls instead of running a main loop
+    def __init__(self):
+        self.scheduled = []
+        self.ids = itertools.count()
+
+    def after(self, ms, callback):
+        after_id = next(self.ids)
+        self.scheduled.append((after_id, ms, callback))
+        return after_id
+
+    def after_cancel(self, after_id):
+        self.scheduled = [entry for entry in self.scheduled if entry[0] != after_id]
+
+    def run_next(self):
+        _, ms, callback = self.scheduled.pop(0)
+        callback()
+        return ms
+
+    def next_interval(self):
+        return self.scheduled[0][1]
+
+
+def test_consecutive_batched_events_become_one_call():
+    root = FakeRoot()
+    queue = UIEventQueue(root)
+    calls = []
+    queue.register("text", lambda items: calls.append(("text", items)), batch=True)
+    queue.register("status", lambda message: calls.append(("status", message)))
+    for event in [("text", "a"), ("text", "b"), ("status", "busy"), ("text", "c")]:
+        queue.post(*event)
+    queue.pump()
+    assert calls == [("text", [("a",), ("b",)]), ("status", "busy"), ("text", [("c",)])]
+    assert queue.stats()["last_batch"] == 4
+
+
+def test_unknown_kinds_and_failing_handlers_do_not_stop_the_pump(capsys):
+    root = FakeRoot()
+    queue = UIEventQueue(root)
+    seen = []
+    queue.register("boom", lambda: 1 / 0)
+    queue.register("ok", seen.append)
+    queue.start()
+    assert root.run_next() == 0
+
+    queue.post("missing")
+    queue.post("boom")
+    queue.post("ok", 1)
+    root.run_next()
+    assert seen == [1]
+    assert len(root.scheduled) == 1
+    out = capsys.readouterr().out
+    assert "No handler for UI event 'missing'" in out
+    assert "Error handling UI event" in out
+
+
+def test_pump_backs_off_when_quiet_and_speeds_up_for_events(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ui_queue.time, "monotonic", lambda: now[0])
+    root = FakeRoot()
+    queue = UIEventQueue(root)
+    queue.register("ok", lambda: None)
+    queue.start()
+    root.run_next()
+    assert root.next_interval() == IDLE_INTERVAL_MS > ACTIVE_INTERVAL_MS
+
+    queue.post("ok")
+    root.run_next()
+    assert root.next_interval() == ACTIVE_INTERVAL_MS
+    # Still fast for a while after the last event, then idle again
+    now[0] += ui_queue.ACTIVE_SECONDS - 1
+    root.run_next()
+    assert root.next_interval() == ACTIVE_INTERVAL_MS
+    now[0] += 2
+    root.run_next()
+    assert root.next_interval() == IDLE_INTERVAL_MS
+
+    queue.stop()
+    root.run_next()
+    assert root.scheduled == []
+
+
+def test_wake_reschedules_an_idle_pump_at_the_fast_rate():
+    root = FakeRoot()
+    queue = UIEventQueue(root)
+    queue.start()
+    root.run_next()
+    assert root.next_interval() == IDLE_INTERVAL_MS
+    queue.wake()
+    assert [ms for _, ms, _ in root.scheduled] == [ACTIVE_INTERVAL_MS]
+    root.run_next()
+    assert root.next_interval() == ACTIVE_INTERVAL_MS
+
+
+def test_events_from_many_threads_are_all_delivered():
+    queue = UIEventQueue(FakeRoot())
+    received = []
+    queue.register("n", lambda items: received.extend(n for (n,) in items), batch=True)
+    threads = [
+        threading.Thread(target=lambda start=start: [queue.post("n", start + i) for i in range(100)])
+        for start in range(0, 400, 100)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    queue.pump()
+    assert sorted(received) == list(range(400))
@@ -0,0 +1,163 @@
+from collections import deque
+
+# The transcript widget only ever holds a window of messages, so inserts and
+# scrolling cost the same after hours of chatting. Messages outside the window
+# are read back from the chat log as the user scrolls towards them.
+
+MAX_MESSAGES = 300
+PAGE_MESSAGES = 100
+POLL_MS = 150
+HIGHLIGHT_COLOR = "#4a3f00"
+
+
+def text_lines(message):
+    return message.count("\n") + 1
+
+
+class TranscriptView:
+    def __init__(self, textbox, chat_log, max_messages=MAX_MESSAGES, page_messages=PAGE_MESSAGES):
+        self.textbox = textbox
+        self.chat_log = chat_log
+        self.max_messages = max_messages
+        self.page_messages = page_messages
+        self.session_id = None
+        # Log position of the first message shown, and the text lines each shown
+        # message takes up, top to bottom
+        self.first_seq = 0
+        self.heights = deque()
+        # Whether the bottom of the widget is the live end of the chat
+        self.following = True
+        # A streamed reply is being written below the last complete message
+        self.partial = False
+
+    def start(self):
+        # Tk has no single event for wheel, keyboard and scrollbar scrolling,
+        # so the scroll position is polled
+        self.check_scroll()
+
+    def reset(self, session_id, lines, first_seq=0):
+        self.session_id = session_id
+        self.first_seq = first_seq
+        self.heights = deque(text_lines(line) for line in lines)
+        self.following = True
+        self.partial = False
+        self._delete("1.0", "end")
+        self._insert("end", "".join(f"{line}\n" for line in lines))
+        self.textbox.see("end")
+
+    def show(self, session_id, seq):
+        # Opens the window around one message of a chat, e.g. a search hit, and
+        # highlights it
+        start = max(0, seq - self.page_messages // 2)
+        lines = self.chat_log.read(session_id, start, self.page_messages)
+        if not lines:
+            return
+        self.reset(session_id, lines, start)
+        self.following = start + len(lines) >= self.chat_log.count(session_id)
+        offset = min(seq - start, len(lines) - 1)
+        line = 1 + sum(list(self.heights)[:offset])
+        self.textbox.tag_config("highlight", background=HIGHLIGHT_COLOR)
+        self.textbox.tag_add("highlight", f"{line}.0", f"{line + self.heights[offset]}.0")
+        self.textbox.yview(f"{line}.0")
+
+    def append(self, lines):
+        if not self.following:
+            return  # Already in the log; shown when the user scrolls back down
+        self._insert("end", "".join(f"{line}\n" for line in lines))
+        self.heights.extend(text_lines(line) for line in lines)
+        self._trim_top()
+        self.textbox.see("end")
+
+    def begin_partial(self, text):
+        if not self.following:
+            return
+        self.partial = True
+        self._insert("end", text)
+        self.textbox.see("end")
+
+    def write_partial(self, text):
+        if self.partial:
+            self._insert("end", text)
+            self.textbox.see("end")
+
+    def end_partial(self, line):
+        # line is the finished message, identical to the text streamed so far
+        if not self.partial:
+            self.append([line])
+            return
+        self.partial = False
+        self._insert("end", "\n")
+        self.heights.append(text_lines(line))
+        self._trim_top()
+        self.textbox.see("end")
+
+    def check_scroll(self):
+        try:
+            top, bottom = self.textbox.yview()
+        except Exception:
+            return  # Widget destroyed
+        if top <= 0.0 and self.first_seq > 0 and (bottom < 1.0 or len(self.heights) < self.max_messages):
+            self.page_older()
+        elif bottom >= 1.0 and not self.following:
+            self.page_newer()
+        self.textbox.after(POLL_MS, self.check_scroll)
+
+    def page_older(self):
+        if self.session_id is None or self.first_seq == 0:
+            return
+        start = max(0, self.first_seq - self.page_messages)
+        lines = self.chat_log.read(self.session_id, start, self.first_seq - start)
+        if not lines:
+            return
+        # Keep the message the user is looking at in place
+        top_line = self._top_line()
+        heights = [text_lines(line) for line in lines]
+        self._insert("1.0", "".join(f"{line}\n" for line in lines))
+        self.heights.extendleft(reversed(heights))
+        self.first_seq = start
+        self.textbox.yview(f"{top_line + sum(heights)}.0")
+
+        excess = len(self.heights) - self.max_messages
+        if excess > 0:
+            # Drop messages off the bottom, along with any reply still streaming
+            kept = sum(self.heights) - sum(self.heights.pop() for _ in range(excess))
+            self._delete(f"{kept + 1}.0", "end")
+            self.following = False
+            self.partial = False
+
+    def page_newer(self):
+        if self.session_id is None or self.following:
+            return
+        end = self.first_seq + len(self.heights)
+        lines = self.chat_log.read(self.session_id, end, self.page_messages)
+        if end + len(lines) >= self.chat_log.count(self.session_id):
+            self.following = True
+        top_line = self._top_line()
+        self._insert("end", "".join(f"{line}\n" for line in lines))
+        self.heights.extend(text_lines(line) for line in lines)
+        removed = self._trim_top()
+        self.textbox.yview(f"{max(1, top_line - removed)}.0")
+
+    def _trim_top(self):
+        # Returns how many text lines were removed
+        excess = len(self.heights) - self.max_messages
+        if excess <= 0:
+            return 0
+        removed = sum(self.heights.popleft() for _ in range(excess))
+        self._delete("1.0", f"{removed + 1}.0")
+        self.first_seq += excess
+        return removed
+
+    def _top_line(self):
+        return int(self.textbox.index("@0,0").split(".")[0])
+
+    def _insert(self, index, text):
+        if text:
+            self.textbox.configure(state="normal")
+            self.textbox.insert(index, text)
+            self.textbox.configure(state="disabled")
+
+    def _delete(self, start, end):
+        self.textbox.configure(state="normal")
+        self.textbox.delete(start, end)
+        self.textbox.configure(state="disabled")
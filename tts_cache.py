@@ -0,0 +1,337 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from metrics import timed
+
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+# The speech endpoint rejects longer input
+MAX_INPUT_CHARS = 4096
+# Longer text is split into chunks of about this size and synthesized in parallel
+DEFAULT_CHUNK_CHARS = 1000
+# Formats whose clips can be played back to back by simple concatenation
+STITCHABLE_FORMATS = {"mp3", "pcm"}
+# Hits only change LRU order, so the index is saved this long after the first
+# unsaved hit rather than on every one
+INDEX_SAVE_DELAY = 5.0
+
+PARAGRAPH_BREAK = re.compile(r'\n\s*\n')
+SENTENCE_END = re.compile(r'(?<=[.!?…])["\')\]]*\s+')
+
+
+def split_text(text, max_chars=DEFAULT_CHUNK_CHARS):
+    # Packs whole paragraphs, then sentences, then words into chunks of at most
+    # max_chars so every chunk still sounds natural on its own
+    pieces = []
+    for paragraph in PARAGRAPH_BREAK.split(text.strip()):
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        for sentence in SENTENCE_END.split(paragraph):
+            if len(sentence) <= max_chars:
+                pieces.append(sentence)
+                continue
+            # Even a single overlong word is cut rather than dropped
+            words = [word[i:i + max_chars] for word in sentence.split() for i in range(0, len(word), max_chars)]
+            while words:
+                line = words.pop(0)
+                while words and len(line) + 1 + len(words[0]) <= max_chars:
+                    line += " " + words.pop(0)
+                pieces.append(line)
+
+    chunks = []
+    for piece in filter(None, (piece.strip() for piece in pieces)):
+        if chunks and len(chunks[-1]) + 1 + len(piece) <= max_chars:
+            chunks[-1] += " " + piece
+        else:
+            chunks.append(piece)
+    return chunks
+
+
+def download_speech(client, text, voice, speed=1.0, model="tts-1", response_format="mp3",
+                    cancelled=None, timer=None, on_chunk=None, attach=None):
+    # Setting the cancelled event aborts the download between chunks; on_chunk
+    # sees each piece as it arrives, for progressive playback. attach(response)
+    # hands the open response to the caller, e.g. ChatRequest.attach, so a
+    # cancel can close it and unblock a stalled read.
+    audio = bytearray()
+    # Sentences and chunks are synthesized in parallel under one timer
+    with timed(timer, "tts_synthesis", overlapping=True):
+        with client.audio.speech.with_streaming_response.create(
+            model=model,
+            voice=voice,
+            speed=speed,
+            response_format=response_format,
+            input=text
+        ) as response:
+            if attach:
+                attach(response)
+            for chunk in response.iter_bytes():
+                if cancelled is not None and cancelled.is_set():
+                    return None
+                audio += chunk
+                if on_chunk:
+                    on_chunk(chunk)
+    return bytes(audio)
+
+
+class AnySet:
+    # Reads as set once any of the given events is
+    def __init__(self, *events):
+        self.events = events
+
+    def is_set(self):
+        return any(event.is_set() for event in self.events)
+
+
+class TTSCache:
+    def __init__(self, cache_dir, max_bytes=DEFAULT_MAX_BYTES, chunk_chars=DEFAULT_CHUNK_CHARS, max_workers=4):
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.index_file = self.cache_dir / "index.json"
+        self.max_bytes = max_bytes
+        self.chunk_chars = min(chunk_chars, MAX_INPUT_CHARS)
+        # Bounded pool for the chunks of long texts
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts-chunk")
+        # Downloaded clips are written to disk here, off the playback path; until
+        # then they are served from memory
+        self.writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="tts-write")
+        self.unwritten = {}
+        self.lock = threading.Lock()
+        # Held while the index is written, so saves land in order without
+        # holding up lookups
+        self.save_lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.save_timer = None
+
+        # key -> {"file", "size", "last_used"}, least recently used first
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.load_index()
+
+    @staticmethod
+    def make_key(text, voice, speed, model, response_format="mp3"):
+        payload = json.dumps([text, voice, round(float(speed), 3), model, response_format], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def load_index(self):
+        # Clips whose write was interrupted were never indexed
+        for part in self.cache_dir.glob("*.part"):
+            try:
+                part.unlink()
+            except OSError:
+                pass
+        if not self.index_file.exists():
+            return
+        try:
+            with open(self.index_file, 'r', encoding='utf-8') as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not read TTS cache index, starting empty: {e}")
+            return
+
+        for key, entry in sorted(entries.items(), key=lambda item: item[1]["last_used"]):
+            # Skip entries whose audio file was deleted behind our back
+            if (self.cache_dir / entry["file"]).exists():
+                self.entries[key] = entry
+                self.total_bytes += entry["size"]
+
+    def save_index(self):
+        # Called without the lock; any pending delayed save is covered by this one
+        with self.save_lock:
+            with self.lock:
+                if self.save_timer:
+                    self.save_timer.cancel()
+                    self.save_timer = None
+                entries = {key: dict(entry) for key, entry in self.entries.items()}
+            tmp_file = self.index_file.with_suffix(".tmp")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(entries, f)
+            os.replace(tmp_file, self.index_file)
+
+    def schedule_save(self):
+        # Called with the lock held
+        if self.save_timer is None:
+            self.save_timer = threading.Timer(INDEX_SAVE_DELAY, self.flush)
+            self.save_timer.daemon = True
+            self.save_timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.save_timer is None:
+                return
+        try:
+            self.save_index()
+        except OSError as e:
+            print(f"Warning: Could not save TTS cache index: {e}")
+
+    def close(self):
+        # Finishes pending clip writes and saves recency from recent hits
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.writer.shutdown(wait=True)
+        self.flush()
+
+    def lookup(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            path = self.cache_dir / entry["file"] if entry else None
+            if path is None or not path.exists():
+                if entry:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            entry["last_used"] = time.time()
+            self.entries.move_to_end(key)
+            self.hits += 1
+            self.schedule_save()
+            return path
+
+    def get(self, key):
+        with self.lock:
+            audio = self.unwritten.get(key)
+            if audio is not None:
+                self.hits += 1
+                return audio
+        path = self.lookup(key)
+        if path is None:
+            return None
+        try:
+            return path.read_bytes()
+        except OSError:
+            return None
+
+    def put(self, key, audio, response_format="mp3"):
+        # A zero budget keeps speech in memory only
+        if self.max_bytes <= 0:
+            return None
+        filename = f"{key}.{response_format}"
+        path = self.cache_dir / filename
+        # The clip is written under a temporary name without the lock, so hits
+        # are served meanwhile; only renaming it into place is locked
+        part = path.with_name(f"{filename}.{threading.get_ident()}.part")
+        try:
+            with open(part, 'wb') as f:
+                f.write(audio)
+            with self.lock:
+                if key in self.entries:
+                    self._remove(key)
+                os.replace(part, path)
+                self.entries[key] = {"file": filename, "size": len(audio), "last_used": time.time()}
+                self.total_bytes += len(audio)
+                self._evict()
+        except OSError:
+            try:
+                part.unlink()
+            except OSError:
+                pass
+            raise
+        self.save_index()
+        return path
+
+    def write_later(self, key, audio, response_format="mp3", timer=None):
+        if self.max_bytes <= 0:
+            return
+        with self.lock:
+            self.unwritten[key] = audio
+        self.writer.submit(self._write, key, audio, response_format, timer)
+
+    def _write(self, key, audio, response_format, timer):
+        try:
+            with timed(timer, "tts_write"):
+                self.put(key, audio, response_format)
+        except OSError as e:
+            print(f"Warning: Could not cache speech: {e}")
+        finally:
+            with self.lock:
+                self.unwritten.pop(key, None)
+
+    def speech(self, client, text, voice, speed=1.0, model="tts-1", response_format="mp3",
+               cancelled=None, timer=None, on_chunk=None, attach=None):
+        # Returns the encoded clip as bytes, ready to play from memory. A hit never
+        # touches the network; a miss is downloaded and returned straight away,
+        # while a background thread writes it to the cache. Returns None if
+        # cancelled mid-download.
+        # on_chunk receives the audio as it arrives (all at once on a hit).
+        if len(text) > self.chunk_chars and response_format in STITCHABLE_FORMATS:
+            chunks = split_text(text, self.chunk_chars)
+            if len(chunks) > 1:
+                return self.chunked_speech(client, chunks, voice, speed, model, response_format,
+                                           cancelled, timer, on_chunk, attach)
+        key = self.make_key(text, voice, speed, model, response_format)
+        audio = self.get(key)
+        if audio is not None:
+            if timer:
+                timer.mark("tts_cache_hit")
+            if on_chunk:
+                on_chunk(audio)
+            return audio
+        audio = download_speech(client, text, voice, speed, model, response_format, cancelled, timer, on_chunk,
+                                attach)
+        if audio is not None:
+            self.write_later(key, audio, response_format, timer)
+        return audio
+
+    def chunked_speech(self, client, chunks, voice, speed=1.0, model="tts-1", response_format="mp3",
+                       cancelled=None, timer=None, on_chunk=None, attach=None):
+        # Every chunk after the first is synthesized (and cached) in parallel while
+        # the first streams to on_chunk, so a long reply takes about as long as
+        # its slowest chunk. The clips are stitched back together in order.
+        # The other chunks also stop once this call gives up, e.g. because the
+        # first chunk failed, without cancelling the caller's event
+        stopped = threading.Event()
+        siblings_cancelled = AnySet(stopped, cancelled) if cancelled is not None else stopped
+        futures = [
+            self.executor.submit(self.speech, client, chunk, voice, speed, model, response_format,
+                                 siblings_cancelled, timer, attach=attach)
+            for chunk in chunks[1:]
+        ]
+        try:
+            parts = []
+            for i, chunk in enumerate(chunks):
+                if i == 0:
+                    audio = self.speech(client, chunk, voice, speed, model, response_format,
+                                        cancelled, timer, on_chunk, attach)
+                else:
+                    audio = futures[i - 1].result()
+                    if on_chunk and audio is not None:
+                        on_chunk(audio)
+                if audio is None:
+                    return None  # Cancelled
+                parts.append(audio)
+            return b"".join(parts)
+        finally:
+            stopped.set()
+            for future in futures:
+                future.cancel()
+
+    def _remove(self, key):
+        entry = self.entries.pop(key)
+        self.total_bytes -= entry["size"]
+        try:
+            (self.cache_dir / entry["file"]).unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            # On Windows a clip that is still playing can't be deleted yet
+            print(f"Warning: Could not remove cached audio: {e}")
+
+    def _evict(self):
+        # Always keep the newest entry, even if it alone exceeds the budget
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            self._remove(next(iter(self.entries)))
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "entries": len(self.entries),
+                "bytes": self.total_bytes,
+                "max_bytes": self.max_bytes
+            }
@@ -0,0 +1,117 @@
+import threading
+import time
+from collections import deque
+
+# Pump interval while events are flowing (~60 fps) and once the queue has been
+# quiet for a while. post() doesn't wake Tk, since that would make worker
+# threads wait on it; instead the pump keeps the fast rate for ACTIVE_SECONDS
+# after the last event or wake(), so the first token of a reply isn't held up
+# by the slow idle poll.
+ACTIVE_INTERVAL_MS = 16
+IDLE_INTERVAL_MS = 100
+ACTIVE_SECONDS = 5.0
+
+
+class UIEventQueue:
+    def __init__(self, root):
+        # Worker threads only ever call post(); everything else runs on the Tk thread
+        self.root = root
+        self.lock = threading.Lock()
+        self.events = deque()
+        self.handlers = {}
+        self.running = False
+        self.active_until = 0.0
+        self.pending_pump = None
+
+        self.max_depth = 0
+        self.last_depth = 0
+        self.last_latency = 0.0
+        self.max_latency = 0.0
+        self.pumps = 0
+
+    def register(self, kind, handler, batch=False):
+        # Batched handlers get one call per run of consecutive events with the
+        # list of their payloads, e.g. many text appends become one insert
+        self.handlers[kind] = (handler, batch)
+
+    def post(self, kind, *args):
+        with self.lock:
+            self.events.append((kind, args, time.perf_counter()))
+            depth = len(self.events)
+            if depth > self.max_depth:
+                self.max_depth = depth
+
+    def start(self):
+        if not self.running:
+            self.running = True
+            self.pending_pump = self.root.after(0, self.pump)
+
+    def wake(self):
+        # Called on the Tk thread when events are about to arrive, e.g. a
+        # message was just sent: pump soon and keep polling at the fast rate
+        self.active_until = time.monotonic() + ACTIVE_SECONDS
+        if self.running and self.pending_pump is not None:
+            self.root.after_cancel(self.pending_pump)
+            self.pending_pump = self.root.after(ACTIVE_INTERVAL_MS, self.pump)
+
+    def stop(self):
+        self.running = False
+
+    def pump(self):
+        with self.lock:
+            events = list(self.events)
+            self.events.clear()
+
+        self.pending_pump = None
+        try:
+            if events:
+                self.active_until = time.monotonic() + ACTIVE_SECONDS
+                now = time.perf_counter()
+                self.last_depth = len(events)
+                self.last_latency = now - events[0][2]
+                self.max_latency = max(self.max_latency, self.last_latency)
+                self.pumps += 1
+                self.dispatch(events)
+        finally:
+            if self.running:
+                active = time.monotonic() < self.active_until
+                self.pending_pump = self.root.after(ACTIVE_INTERVAL_MS if active else IDLE_INTERVAL_MS, self.pump)
+
+    def dispatch(self, events):
+        i = 0
+        while i < len(events):
+            kind = events[i][0]
+            if kind not in self.handlers:
+                # Dropped rather than raised, which would stop the pump for good
+                print(f"Warning: No handler for UI event {kind!r}")
+                i += 1
+                continue
+            handler, batch = self.handlers[kind]
+            if batch:
+                j = i
+                while j < len(events) and events[j][0] == kind:
+                    j += 1
+                self.call(handler, [args for _, args, _ in events[i:j]])
+                i = j
+            else:
+                self.call(handler, *events[i][1])
+                i += 1
+
+    def call(self, handler, *args):
+        # One failing handler must not stop the pump
+        try:
+            handler(*args)
+        except Exception as e:
+            print(f"Error handling UI event: {e}")
+
+    def stats(self):
+        with self.lock:
+            depth = len(self.events)
+        return {
+            "depth": depth,
+            "max_depth": self.max_depth,
+            "last_batch": self.last_depth,
+            "last_latency_ms": self.last_latency * 1000,
+            "max_latency_ms": self.max_latency * 1000,
+            "pumps": self.pumps
+        }